@@ -1,17 +1,25 @@
-from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi import FastAPI, HTTPException, Request, Depends, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from datetime import datetime
 import os
+import asyncio
+import time
 import logging
 from pathlib import Path
 
 # Import services
-from app.writer import transcript_lines_plain, transcript_lines_speaker, lock
+from app.writer import transcript_records, lock, transcript_log, persister, read_live, last_seq
+from app.transcript_log import list_sessions, open_session, session_summary
+from app.broadcaster import broadcaster
+from app.scheduler import scheduler
+from app.config import TRANSCRIPT_READ_LIMIT, TIMESTAMP, SEARCH_DEFAULT_LIMIT
+from app.search import search_index
+from app.rotation import rotator
 from app.services.emotion_service import EmotionResult, get_emotion_detector
 from app.services.sentiment_analyzer import analyze_sentiment
 from app.services.summarizer import generate_summary
@@ -66,13 +74,126 @@ async def serve_frontend(request: Request):
 
 # Transcript Endpoints
 @app.get("/api/transcript", response_model=List[Dict[str, Any]])
-async def get_transcript(mode: str = "speaker"):
-    """Get transcript in either plain text or with speaker information"""
+def get_transcript(mode: str = "speaker", since_seq: Optional[int] = None, from_ts: Optional[float] = None,
+                   to_ts: Optional[float] = None, limit: int = TRANSCRIPT_READ_LIMIT, session: Optional[str] = None):
+    """Get transcript in either plain text or with speaker information.
+
+    With `since_seq`, `from_ts` or `to_ts` (epoch seconds) any range of the
+    session is read from the indexed transcript log instead of the recent
+    in-memory window. `session` (see /api/sessions) reads a past session's
+    log the same way, paging in only the requested records.
+    """
+    if session is not None and session != TIMESTAMP:
+        try:
+            log = open_session(session)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Unknown session {session}")
+    else:
+        log = transcript_log
+    if log is not transcript_log or since_seq is not None or from_ts is not None or to_ts is not None:
+        read = read_live if log is transcript_log else log.read
+        records = read(since_seq, from_ts, to_ts, max(1, min(limit, TRANSCRIPT_READ_LIMIT)))
+        if mode == "plain":
+            return [{"seq": r["seq"], "text": r["text"]} for r in records]
+        return records
     with lock:
         if mode == "plain":
-            return [{"text": line} for line in transcript_lines_plain]
+            return [{"text": r.text} for r in transcript_records]
+        else:
+            return [{"timestamp": r.clock, "speaker": r.speaker, "text": r.text} for r in transcript_records]
+
+@app.get("/api/sessions")
+def get_sessions():
+    """Every recorded session with its record count and time span.
+
+    Past sessions are summarised from their column files, without opening
+    their logs (which would push the sessions being read out of the LRU).
+    """
+    sessions = []
+    for name in list_sessions():
+        if name == TIMESTAMP:
+            # The newest records may not be in the log yet (see read_live)
+            with lock:
+                newest = transcript_records[-1] if transcript_records and transcript_records[-1].seq >= 0 else None
+            records, first_ts, last_ts = last_seq() + 1, transcript_log.first_ts(), transcript_log.last_ts()
+            if newest is not None:
+                first_ts, last_ts = first_ts if first_ts is not None else newest.ts, newest.ts
         else:
-            return [{"speaker": line[0], "text": line[1]} for line in transcript_lines_speaker]
+            try:
+                records, first_ts, last_ts = session_summary(name)
+            except KeyError:
+                continue  # Removed since it was listed
+        sessions.append({"session": name, "records": records, "first_ts": first_ts, "last_ts": last_ts,
+                         "live": name == TIMESTAMP})
+    return sessions
+
+@app.get("/api/transcript/delta")
+def get_transcript_delta(request: Request, since_seq: int = -1, mode: str = "speaker",
+                         limit: int = TRANSCRIPT_READ_LIMIT):
+    """Records after the client's `since_seq` cursor.
+
+    Clients resume from the returned `last_seq` (re-reading while `more` is
+    set) and reset their cursor when `session` changes; `truncated` means
+    records right after the cursor no longer exist. The response has the
+    same shape as stt.py's /transcript/delta. The ETag names the session
+    and its last seq, so a poller that sends it back in If-None-Match gets
+    an empty 304 until something new is logged.
+    """
+    newest = last_seq()
+    etag = f'"{TIMESTAMP}-{newest}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    records = read_live(since_seq, limit=max(1, min(limit, TRANSCRIPT_READ_LIMIT))) if since_seq < newest else []
+    if mode == "plain":
+        records = [{"seq": r["seq"], "text": r["text"]} for r in records]
+    cursor = records[-1]["seq"] if records else newest
+    return JSONResponse(
+        {"session": TIMESTAMP, "last_seq": cursor, "truncated": bool(records) and records[0]["seq"] > since_seq + 1,
+         "more": cursor < newest, "entries": records},
+        headers={"ETag": etag if cursor == newest else f'"{TIMESTAMP}-{cursor}"'},
+    )
+
+@app.get("/api/search")
+def search_transcripts(q: str, speaker: Optional[str] = None, from_ts: Optional[float] = None,
+                       to_ts: Optional[float] = None, source: Optional[str] = None,
+                       limit: int = SEARCH_DEFAULT_LIMIT):
+    """Ranked full-text search over every session's transcript and AI responses.
+
+    All words must match; "quoted phrases" must appear in order. `speaker`,
+    `from_ts`/`to_ts` (epoch seconds) and `source` ("transcript" or
+    "ai_responses") narrow the results.
+    """
+    started = time.perf_counter()
+    total, results = search_index.search(q, speaker, from_ts, to_ts, source, max(1, min(limit, TRANSCRIPT_READ_LIMIT)))
+    return {"query": q, "total": total, "took_ms": round((time.perf_counter() - started) * 1000, 2), "results": results}
+
+@app.on_event("startup")
+async def bind_broadcaster():
+    broadcaster.bind(asyncio.get_running_loop())
+
+async def _pump_transcript(websocket: WebSocket, client):
+    while True:
+        record = await client.get()
+        if client.dropped:
+            record = {**record, "dropped": client.dropped}
+            client.dropped = 0
+        await websocket.send_json(record)
+
+@app.websocket("/ws")
+async def transcript_ws(websocket: WebSocket):
+    """Push each new transcript record to the client as it is produced"""
+    await websocket.accept()
+    client = broadcaster.subscribe()
+    sender = asyncio.create_task(_pump_transcript(websocket, client))
+    try:
+        # Clients never need to send anything; this only detects disconnects
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        broadcaster.unsubscribe(client)
 
 # Analysis Endpoints
 @app.post("/api/analyze/emotion", response_model=Dict[str, Any])
@@ -139,8 +260,11 @@ async def status():
         return {
             "status": "running",
             "timestamp": datetime.utcnow().isoformat(),
-            "total_lines": len(transcript_lines_speaker),
-            "last_update": transcript_lines_speaker[-1][1] if transcript_lines_speaker else None
+            "total_lines": len(transcript_records),
+            "last_update": transcript_records[-1].clock if transcript_records else None,
+            "scheduler": scheduler.stats(),
+            "persistence": persister.stats(),
+            "archive": rotator.stats()
         }
 
 @app.get("/api/health")
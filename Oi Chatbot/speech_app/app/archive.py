@@ -0,0 +1,206 @@
+import bisect
+import json
+import os
+import threading
+import zlib
+from array import array
+from app.config import ARCHIVE_BLOCK_BYTES
+
+ARCHIVE_SUFFIX = ".z"
+SOURCE_SUFFIX = ARCHIVE_SUFFIX + ".src"  # Identity of an archived file whose removal failed
+MAGIC = b"OIARCH01"
+
+
+class ArchiveReader:
+    """Random access into a block-compressed archive.
+
+    Layout: independently zlib-compressed blocks of about `block_bytes` raw
+    bytes (cut at line ends), then the seek index (raw and compressed start
+    offset of every block, plus one end entry), the block count and MAGIC.
+    A read of raw bytes [begin, end) bisects the index and decompresses
+    only the blocks overlapping it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            f.seek(-16, os.SEEK_END)
+            trailer = f.read(16)
+            if trailer[8:] != MAGIC:
+                raise ValueError(f"{path} is not a transcript archive")
+            count = array("q", trailer[:8])[0] + 1
+            f.seek(-16 - 16 * count, os.SEEK_END)
+            index = f.read(16 * count)
+        self.raw_offsets = array("q", index[:8 * count])
+        self.comp_offsets = array("q", index[8 * count:])
+        self.size = self.raw_offsets[-1]
+        self._cached = (-1, b"")
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        # Lets a reader stand in for an mmap of the raw file: archive[begin:end]
+        return self.read(key.start or 0, self.size if key.stop is None else key.stop)
+
+    def _block(self, f, i):
+        with self._lock:
+            if self._cached[0] == i:
+                return self._cached[1]
+        f.seek(self.comp_offsets[i])
+        data = zlib.decompress(f.read(self.comp_offsets[i + 1] - self.comp_offsets[i]))
+        with self._lock:
+            self._cached = (i, data)
+        return data
+
+    def read(self, begin, end=None):
+        end = self.size if end is None else min(end, self.size)
+        if begin >= end:
+            return b""
+        first = bisect.bisect_right(self.raw_offsets, begin) - 1
+        parts = []
+        with open(self.path, "rb") as f:
+            i = first
+            while i < len(self.raw_offsets) - 1 and self.raw_offsets[i] < end:
+                block = self._block(f, i)
+                base = self.raw_offsets[i]
+                parts.append(block[max(begin - base, 0):end - base])
+                i += 1
+        return b"".join(parts)
+
+
+def _source_start(path):
+    """Where the bytes of plain `path` that its archive lacks begin.
+
+    An archived file whose removal failed has a SOURCE_SUFFIX marker with
+    its identity and archived size: while it is that same file, its first
+    `size` bytes are already archived (all of them if it is unchanged).
+    Any other plain file next to an archive, e.g. one recreated by a
+    writer after its predecessor was archived, is new data from byte 0.
+    """
+    try:
+        with open(path + SOURCE_SUFFIX) as f:
+            marker = json.load(f)
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return 0
+    same = (st.st_dev, st.st_ino) == (marker["dev"], marker["ino"]) and st.st_size >= marker["size"]
+    return marker["size"] if same else 0
+
+
+def _parts(path):
+    """(archive reader or None, plain file or None, where its new bytes begin)
+
+    The raw bytes of `path` are its archive's followed by those of the
+    plain file the archive does not hold yet.
+    """
+    archive = path + ARCHIVE_SUFFIX
+    reader = ArchiveReader(archive) if os.path.exists(archive) else None
+    if not os.path.exists(path):
+        return reader, None, 0
+    return reader, path, _source_start(path) if reader is not None else 0
+
+
+def unarchived_bytes(path):
+    """Bytes of plain `path` that its archive (if any) does not hold"""
+    reader, plain, start = _parts(path)
+    return os.path.getsize(plain) - start if plain is not None else 0
+
+
+def compress_file(path, block_bytes=ARCHIVE_BLOCK_BYTES):
+    """Archive what `path` holds beyond its archive, then remove `path`; returns the archive path.
+
+    An existing archive gets the new bytes as further blocks after its own,
+    which are copied unchanged, so open ArchiveReaders of it stay valid.
+    """
+    target = path + ARCHIVE_SUFFIX
+    previous, _, start = _parts(path)
+    raw_offsets = array("q", previous.raw_offsets) if previous else array("q", [0])
+    comp_offsets = array("q", previous.comp_offsets) if previous else array("q", [0])
+    with open(path, "rb") as src, open(target + ".tmp", "wb") as dst:
+        if previous is not None:
+            with open(target, "rb") as old:
+                remaining = comp_offsets[-1]
+                while remaining:
+                    data = old.read(min(remaining, 1 << 20))
+                    dst.write(data)
+                    remaining -= len(data)
+        src.seek(start)
+        pending = b""
+        while True:
+            chunk = src.read(block_bytes)
+            data = pending + chunk
+            if not data:
+                break
+            # Cut blocks at line ends so a record rarely spans two blocks
+            cut = (data.rfind(b"\n") + 1 or len(data)) if chunk else len(data)
+            block, pending = data[:cut], data[cut:]
+            dst.write(zlib.compress(block, 6))
+            raw_offsets.append(raw_offsets[-1] + len(block))
+            comp_offsets.append(dst.tell())
+        source = os.fstat(src.fileno())
+        archived = src.tell()  # Bytes of `path` the archive now holds
+        dst.write(raw_offsets.tobytes())
+        dst.write(comp_offsets.tobytes())
+        dst.write(array("q", [len(raw_offsets) - 1]).tobytes() + MAGIC)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(target + ".tmp", target)
+    try:
+        os.remove(path)
+    except OSError as e:
+        # Still open elsewhere (e.g. mapped on Windows): record what was
+        # archived so the next rotation pass only removes this very file
+        with open(path + SOURCE_SUFFIX + ".tmp", "w") as f:
+            json.dump({"dev": source.st_dev, "ino": source.st_ino, "size": archived}, f)
+        os.replace(path + SOURCE_SUFFIX + ".tmp", path + SOURCE_SUFFIX)
+        print(f"[⚠️ Archive] Kept {path} for now: {e}")
+    else:
+        if os.path.exists(path + SOURCE_SUFFIX):
+            os.remove(path + SOURCE_SUFFIX)
+    return target
+
+
+def remove_archived(path):
+    """Remove plain `path` and its marker once its archive holds all of it; returns whether it did"""
+    if not os.path.exists(path) or not os.path.exists(path + ARCHIVE_SUFFIX) or unarchived_bytes(path):
+        return False
+    os.remove(path)
+    if os.path.exists(path + SOURCE_SUFFIX):
+        os.remove(path + SOURCE_SUFFIX)
+    return True
+
+
+def raw_size(path):
+    """Raw byte size of `path`: its archive plus any newer plain bytes"""
+    reader, plain, start = _parts(path)
+    size = reader.size if reader is not None else 0
+    return size + (os.path.getsize(plain) - start if plain is not None else 0)
+
+
+def read_range(path, begin, end=None):
+    """Raw bytes [begin, end) of `path` (to the end by default), across its archive and plain file"""
+    reader, plain, start = _parts(path)
+    parts = []
+    archived = reader.size if reader is not None else 0
+    if reader is not None and begin < archived:
+        parts.append(reader.read(begin, end))
+    if plain is not None and (end is None or end > archived):
+        with open(plain, "rb") as f:
+            f.seek(start + max(begin - archived, 0))
+            parts.append(f.read() if end is None else f.read(end - max(begin, archived)))
+    return b"".join(parts)
+
+
+def read_from(path, offset):
+    """Raw bytes of `path` from `offset` to the end"""
+    return read_range(path, offset)
+
+
+def logical_path(path):
+    """The file an archive, or its marker, stands for"""
+    for suffix in (SOURCE_SUFFIX, ARCHIVE_SUFFIX):
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
@@ -1,23 +1,192 @@
-import queue
+import threading
 import sounddevice as sd
 import numpy as np
-from app.config import SAMPLERATE, BLOCKSIZE
+from app.config import (SAMPLERATE, BLOCKSIZE, RING_BUFFER_SECONDS, VAD_FRAME_MS, VAD_MIN_SPEECH_MS,
+                        VAD_PRE_ROLL_MS, VAD_HANGOVER_MS, VAD_MAX_UTTERANCE_SECONDS, VAD_ENERGY_RATIO, VAD_MIN_RMS)
 
-q = queue.Queue()
 
-def callback(indata, frames, time, status):
-    if status:
-        print("[⚠️ Audio Status]", status)
-    q.put(bytes(indata))
+class AudioRingBuffer:
+    """Preallocated float32 ring buffer written by the capture callback.
+
+    Every sample is mirrored into both halves of a 2x sized array, so any
+    window of up to `capacity` samples is one contiguous slice. Readers get
+    zero-copy views and the callback never allocates.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=np.float32)
+        self.written = 0  # Total samples written since start (stream position)
+        self._ready = threading.Event()
+
+    def write(self, samples):
+        n = len(samples)
+        if n > self.capacity:
+            self.written += n - self.capacity
+            samples = samples[-self.capacity:]
+            n = self.capacity
+        cap = self.capacity
+        pos = self.written % cap
+        first = min(n, cap - pos)
+        self._data[pos:pos + first] = samples[:first]
+        self._data[cap + pos:cap + pos + first] = samples[:first]
+        rest = n - first
+        if rest:
+            self._data[:rest] = samples[first:]
+            self._data[cap:cap + rest] = samples[first:]
+        self.written += n
+        self._ready.set()
+
+    def oldest(self):
+        """Stream position of the oldest sample still held in the buffer"""
+        return max(0, self.written - self.capacity)
+
+    def wait_for(self, position, timeout=None):
+        """Block until the stream has reached `position` samples"""
+        while self.written < position:
+            self._ready.clear()
+            if self.written >= position:
+                break
+            if not self._ready.wait(timeout):
+                return False
+        return True
+
+    def view(self, start, length):
+        """Zero-copy view of stream samples [start, start + length)"""
+        if start < self.oldest() or start + length > self.written:
+            raise IndexError(f"samples {start}..{start + length} not in buffer")
+        pos = start % self.capacity
+        return self._data[pos:pos + length]
+
+
+class EnergyVAD:
+    """Frame classifier: RMS energy against an adaptive noise floor"""
+
+    def __init__(self, ratio=VAD_ENERGY_RATIO, min_rms=VAD_MIN_RMS, adapt=0.05):
+        self.ratio = ratio
+        self.min_rms = min_rms
+        self.adapt = adapt
+        self.noise_floor = min_rms / ratio
+
+    def is_speech(self, frame):
+        rms = float(np.sqrt(np.dot(frame, frame) / len(frame)))
+        speech = rms > max(self.min_rms, self.noise_floor * self.ratio)
+        if not speech or rms < self.noise_floor:
+            self.noise_floor += self.adapt * (rms - self.noise_floor)
+        return speech
+
+
+class UtteranceSegmenter:
+    """Turns per-frame speech decisions into utterance boundaries.
+
+    An utterance opens after `min_speech` samples of consecutive speech
+    (backdated by `pre_roll`), closes once `hangover` samples of silence
+    follow it, and is force-split when it reaches `max_utterance` samples.
+    Positions are stream sample positions, as used by AudioRingBuffer.
+    """
+
+    def __init__(self, samplerate=SAMPLERATE, min_speech_ms=VAD_MIN_SPEECH_MS, pre_roll_ms=VAD_PRE_ROLL_MS,
+                 hangover_ms=VAD_HANGOVER_MS, max_utterance_seconds=VAD_MAX_UTTERANCE_SECONDS):
+        self.min_speech = samplerate * min_speech_ms // 1000
+        self.pre_roll = samplerate * pre_roll_ms // 1000
+        self.hangover = samplerate * hangover_ms // 1000
+        self.max_utterance = int(samplerate * max_utterance_seconds)
+        self.reset()
+
+    def reset(self):
+        self.start = None
+        self.candidate = None
+        self.last_speech = None
+
+    def push(self, speech, frame_start, frame_end):
+        """Feed one frame; returns (start, end, final) when an utterance is ready"""
+        if self.start is None:
+            if not speech:
+                self.candidate = None
+            elif self.candidate is None:
+                self.candidate = frame_start
+            if self.candidate is not None and frame_end - self.candidate >= self.min_speech:
+                self.start = max(0, self.candidate - self.pre_roll)
+                self.last_speech = frame_end
+                self.candidate = None
+            return None
+
+        if speech:
+            self.last_speech = frame_end
+        elif frame_end - self.last_speech >= self.hangover:
+            utterance = (self.start, min(frame_end, self.last_speech + self.pre_roll), True)
+            self.reset()
+            return utterance
+
+        if frame_end - self.start >= self.max_utterance:
+            utterance = (self.start, frame_end, False)
+            self.start = frame_end
+            return utterance
+        return None
+
+    def resume_from(self, position):
+        """Restart an open (force-split) utterance at `position`"""
+        if self.start is not None:
+            self.start = position
+
+
+class CaptureEngine:
+    """Captures float32 audio into an AudioRingBuffer and emits utterances.
+
+    Every captured frame goes through the streaming VAD; only speech
+    reaches the processor, as zero-copy views bounded by the utterance
+    (never cut mid-word by a fixed window). Views stay valid until the ring
+    wraps over them, so processors that hold on to one for longer than
+    RING_BUFFER_SECONDS must copy it.
+    """
+
+    def __init__(self, device=None, samplerate=SAMPLERATE, blocksize=BLOCKSIZE,
+                 buffer_seconds=RING_BUFFER_SECONDS, vad=None, segmenter=None):
+        self.device = device
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.frame_samples = samplerate * VAD_FRAME_MS // 1000
+        self.vad = vad or EnergyVAD()
+        self.segmenter = segmenter or UtteranceSegmenter(samplerate)
+        capacity = max(buffer_seconds * samplerate, 2 * self.segmenter.max_utterance)
+        self.ring = AudioRingBuffer(capacity)
+        self.overruns = 0
+
+    def callback(self, indata, frames, time, status):
+        if status:
+            print("[⚠️ Audio Status]", status)
+        self.ring.write(indata[:, 0])
+
+    def run(self, processor):
+        """Feed utterances to `processor(audio, start_sample, final)`.
+
+        `final` is False when an utterance was split at the max length; the
+        processor may then return how many samples it consumed so the rest
+        is carried into the next piece.
+        """
+        with sd.InputStream(samplerate=self.samplerate, blocksize=self.blocksize, device=self.device,
+                            dtype='float32', channels=1, callback=self.callback):
+            cursor = 0
+            while True:
+                self.ring.wait_for(cursor + self.frame_samples)
+                if cursor < self.ring.oldest():
+                    # Consumer fell behind by a whole buffer: drop the stale audio
+                    self.overruns += 1
+                    print(f"[⚠️ Audio Overrun] skipped {self.ring.oldest() - cursor} samples")
+                    cursor = self.ring.oldest()
+                    self.segmenter.reset()
+                frame_end = cursor + self.frame_samples
+                speech = self.vad.is_speech(self.ring.view(cursor, self.frame_samples))
+                utterance = self.segmenter.push(speech, cursor, frame_end)
+                cursor = frame_end
+                if utterance is None:
+                    continue
+                start, end, final = utterance
+                start = max(start, self.ring.oldest())
+                consumed = processor(self.ring.view(start, end - start), start, final)
+                if not final and consumed:
+                    self.segmenter.resume_from(min(start + consumed, end))
+
 
 def start_stream(device, processor):
-    buffer = []
-    with sd.RawInputStream(samplerate=SAMPLERATE, blocksize=BLOCKSIZE, device=device,
-                           dtype='int16', channels=1, callback=callback):
-        while True:
-            data = q.get()
-            audio_np = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
-            buffer.append(audio_np)
-            if len(buffer) >= 3:
-                processor(buffer[-3:])
-                buffer = buffer[-1:]
+    CaptureEngine(device).run(processor)
@@ -0,0 +1,152 @@
+import bisect
+import dataclasses
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from faster_whisper import BatchedInferencePipeline
+from app.config import SAMPLERATE, WHISPER_MAX_BATCH_SIZE, WHISPER_MAX_WAIT_MS
+
+STREAM_IDLE_SECONDS = 5.0
+# Per-stream conditioning: differs between streams without changing the
+# shape of a decode, so it is left out of the grouping key
+PER_STREAM_OPTIONS = ("initial_prompt",)
+
+
+class _Request:
+    __slots__ = ("audio", "stream", "options", "future")
+
+    def __init__(self, audio, stream, options):
+        self.audio = audio
+        self.stream = stream
+        self.options = options
+        self.future = Future()
+
+
+def _shift(segment, offset):
+    """Rebase a segment (and its words) from batch time to chunk time"""
+    words = segment.words
+    if words:
+        words = [dataclasses.replace(w, start=w.start - offset, end=w.end - offset) for w in words]
+    return dataclasses.replace(segment, start=segment.start - offset, end=segment.end - offset, words=words)
+
+
+class WhisperBatcher:
+    """Micro-batching scheduler in front of the Whisper model.
+
+    Chunks submitted from any thread or stream are collected for up to
+    `max_wait_ms` (or until `max_batch_size` are ready) and decoded in one
+    batched call: the chunks are laid end to end and passed as clip
+    timestamps to faster-whisper's BatchedInferencePipeline, then the
+    segments are mapped back to the chunk they came from. The wait window
+    is only used while more than one stream is active, so a single
+    microphone never pays extra latency.
+    """
+
+    def __init__(self, model, max_batch_size=WHISPER_MAX_BATCH_SIZE, max_wait_ms=WHISPER_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.batched_chunks = 0
+        self._pipeline = None
+        self._queue = queue.Queue()
+        self._streams = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, audio, stream=None, **options):
+        """Queue one chunk; the future resolves to its list of segments"""
+        self._ensure_started()
+        self._streams[stream] = time.monotonic()
+        request = _Request(audio, stream, options)
+        self._queue.put(request)
+        return request.future
+
+    def transcribe(self, audio, stream=None, **options):
+        return self.submit(audio, stream, **options).result()
+
+    def mean_batch_size(self):
+        return self.batched_chunks / self.batches if self.batches else 0.0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+
+    def _active_streams(self):
+        cutoff = time.monotonic() - STREAM_IDLE_SECONDS
+        return sum(1 for last in list(self._streams.values()) if last >= cutoff)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + (self.max_wait if self._active_streams() > 1 else 0)
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Only requests with identical decode options can share a call
+            groups = {}
+            for request in batch:
+                key = tuple(sorted((k, repr(v)) for k, v in request.options.items()
+                                   if k not in PER_STREAM_OPTIONS))
+                groups.setdefault(key, []).append(request)
+            for group in groups.values():
+                self._execute(group)
+
+    def _execute(self, group):
+        self.batches += 1
+        self.batched_chunks += len(group)
+        try:
+            if len(group) == 1:
+                request = group[0]
+                segments, _ = self.model.transcribe(request.audio, **request.options)
+                request.future.set_result(list(segments))
+                return
+            self._execute_batched(group)
+        except Exception as e:
+            for request in group:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+    def _execute_batched(self, group):
+        if self._pipeline is None:
+            self._pipeline = BatchedInferencePipeline(model=self.model)
+        options = dict(group[0].options)
+        # Clips replace VAD: each chunk is already a speech window
+        options.pop("vad_filter", None)
+        options.pop("vad_parameters", None)
+        # The pipeline takes one prompt per call: keep it only if every stream
+        # shares it, otherwise decode unprompted (the stitcher aligns on word
+        # timestamps, the prompt only helps continuity)
+        for name in PER_STREAM_OPTIONS:
+            values = {repr(r.options.get(name)) for r in group}
+            if len(values) > 1:
+                options.pop(name, None)
+
+        offsets, clips, position = [], [], 0.0
+        for request in group:
+            duration = len(request.audio) / SAMPLERATE
+            offsets.append(position)
+            clips.append({"start": position, "end": position + duration})
+            position += duration
+        audio = np.concatenate([r.audio for r in group]).astype(np.float32, copy=False)
+
+        segments, _ = self._pipeline.transcribe(audio, vad_filter=False, clip_timestamps=clips,
+                                                batch_size=len(group), **options)
+        results = [[] for _ in group]
+        for segment in segments:
+            index = max(0, bisect.bisect_right(offsets, (segment.start + segment.end) / 2) - 1)
+            results[index].append(_shift(segment, offsets[index]))
+        for request, result in zip(group, results):
+            request.future.set_result(result)
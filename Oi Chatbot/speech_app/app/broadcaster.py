@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from app.config import WS_CLIENT_QUEUE_SIZE
+
+
+class ClientQueue(asyncio.Queue):
+    """Bounded per-client queue that drops the oldest record when full"""
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize=maxsize)
+        self.dropped = 0
+
+    def push(self, record):
+        if self.full():
+            self.get_nowait()
+            self.dropped += 1
+        self.put_nowait(record)
+
+
+class TranscriptBroadcaster:
+    """Pushes transcript records to every connected websocket client.
+
+    `publish` is safe to call from any thread (the transcription workers);
+    records are handed to the event loop and fanned out there. A slow client
+    only ever loses its own oldest records, it never blocks the producer or
+    the other clients.
+    """
+
+    def __init__(self, queue_size=WS_CLIENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.loop = None
+        self.clients = set()
+        self._lock = threading.Lock()
+
+    def bind(self, loop):
+        self.loop = loop
+
+    def subscribe(self):
+        client = ClientQueue(self.queue_size)
+        with self._lock:
+            self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self.clients.discard(client)
+
+    def publish(self, record):
+        loop = self.loop
+        if loop is None or not self.clients:
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out, record)
+        except RuntimeError:
+            # Event loop already closed during shutdown
+            pass
+
+    def _fan_out(self, record):
+        with self._lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.push(record)
+
+
+broadcaster = TranscriptBroadcaster()
@@ -7,9 +7,57 @@ os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
 TIMESTAMP = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 SPEAKER_TRANSCRIPT_PATH = os.path.join(TRANSCRIPT_DIR, f"with_speakers_{TIMESTAMP}.txt")
 PLAIN_TRANSCRIPT_PATH = os.path.join(TRANSCRIPT_DIR, f"plain_{TIMESTAMP}.txt")
+SESSIONS_DIR = os.path.join(TRANSCRIPT_DIR, "sessions")
+TRANSCRIPT_LOG_DIR = os.path.join(SESSIONS_DIR, TIMESTAMP)
 
 SAMPLERATE = 16000
 BLOCKSIZE = 16000
 SPEAKER_THRESHOLD = 0.55
 MAX_TRANSCRIPT_LINES = 10000
 MAX_SPEAKERS = 4
+WS_CLIENT_QUEUE_SIZE = 256
+RING_BUFFER_SECONDS = 30
+SPEAKER_MATCH_SIMILARITY = 0.75
+SPEAKER_MERGE_SIMILARITY = 0.85
+SPEAKER_SPLIT_COHESION = 0.7
+SPEAKER_MIN_COUNT = 5
+SPEAKER_MAINTENANCE_INTERVAL = 50
+WHISPER_MAX_BATCH_SIZE = 8
+WHISPER_MAX_WAIT_MS = 50
+STITCH_HOLDBACK_SECONDS = 0.3
+STITCH_MAX_REWIND_SECONDS = 1.0
+STITCH_CONTEXT_CHARS = 200
+VAD_FRAME_MS = 30
+VAD_MIN_SPEECH_MS = 120
+VAD_PRE_ROLL_MS = 200
+VAD_HANGOVER_MS = 500
+VAD_MAX_UTTERANCE_SECONDS = 15
+VAD_ENERGY_RATIO = 3.0
+VAD_MIN_RMS = 0.01
+# Queued utterances are zero-copy ring views: keep max lag + max utterance
+# below RING_BUFFER_SECONDS
+SCHEDULER_POLICY = "drop_oldest"  # drop_oldest | merge | degrade
+SCHEDULER_MAX_QUEUE = 8
+SCHEDULER_MAX_LAG_SECONDS = 10
+SCHEDULER_MERGE_MAX_SECONDS = 28
+WHISPER_FALLBACK_MODEL = "base"
+WHISPER_MODEL_SIZE = "medium"
+WHISPER_WORKER_PROCESSES = 0  # 0 = transcribe in the server process
+WHISPER_WORKER_SLOT_SECONDS = 30  # Must fit SCHEDULER_MERGE_MAX_SECONDS
+WHISPER_WORKER_TIMEOUT_SECONDS = 120
+TRANSCRIPT_SEGMENT_BYTES = 8 * 1024 * 1024
+TRANSCRIPT_READ_LIMIT = 1000
+TRANSCRIPT_OPEN_SESSIONS = 8  # Past sessions kept mapped for history reads
+TRANSCRIPT_FLUSH_INTERVAL = 5  # Seconds between transcript file flushes
+TRANSCRIPT_FLUSH_LINES = 200  # ...or sooner once this many lines are pending
+TRANSCRIPT_FSYNC = "interval"  # never | interval | always
+TRANSCRIPT_FSYNC_INTERVAL = 30
+TRANSCRIPT_ROTATE_BYTES = 64 * 1024 * 1024  # Session text files roll over to .NNN parts past this...
+TRANSCRIPT_ROTATE_SECONDS = 24 * 3600  # ...or after being open this long
+TRANSCRIPT_SEGMENT_SECONDS = 3600  # Transcript-log segments also roll over hourly
+ARCHIVE_BLOCK_BYTES = 64 * 1024  # Raw bytes per independently compressed block
+ARCHIVE_IDLE_SECONDS = 6 * 3600  # Other sessions' files are archived once idle this long
+ARCHIVE_CHECK_INTERVAL = 300
+SEARCH_TAIL_INTERVAL = 5  # Seconds between checks for new lines in other sessions' files
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_INDEX_DIR = os.path.join(TRANSCRIPT_DIR, "search")  # Saved postings, one file per indexed transcript
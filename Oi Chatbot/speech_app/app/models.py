@@ -1,7 +1,22 @@
+import threading
 import torch
 from resemblyzer import VoiceEncoder
 from faster_whisper import WhisperModel
+from app.config import WHISPER_MODEL_SIZE, WHISPER_FALLBACK_MODEL, WHISPER_WORKER_PROCESSES
 
 device_type = "cuda" if torch.cuda.is_available() else "cpu"
+compute_type = "float16" if device_type == "cuda" else "int8"
 encoder = VoiceEncoder().to(device_type)
-whisper_model = WhisperModel("medium", device=device_type, compute_type="float16" if device_type == "cuda" else "int8")
+# Worker-pool mode loads Whisper in the worker processes instead
+whisper_model = None if WHISPER_WORKER_PROCESSES else WhisperModel(WHISPER_MODEL_SIZE, device=device_type, compute_type=compute_type)
+
+_fallback_model = None
+_fallback_lock = threading.Lock()
+
+def get_fallback_whisper_model():
+    """Smaller Whisper model used while the scheduler is degraded, loaded on first use"""
+    global _fallback_model
+    with _fallback_lock:
+        if _fallback_model is None:
+            _fallback_model = WhisperModel(WHISPER_FALLBACK_MODEL, device=device_type, compute_type=compute_type)
+    return _fallback_model
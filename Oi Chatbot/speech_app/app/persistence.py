@@ -0,0 +1,162 @@
+import glob
+import os
+import threading
+import time
+from app.config import (
+    TRANSCRIPT_FLUSH_INTERVAL, TRANSCRIPT_FLUSH_LINES, TRANSCRIPT_FSYNC, TRANSCRIPT_FSYNC_INTERVAL,
+    TRANSCRIPT_ROTATE_BYTES, TRANSCRIPT_ROTATE_SECONDS,
+)
+
+FSYNC_POLICIES = ("never", "interval", "always")
+
+
+class TranscriptPersister:
+    """Double-buffered writer for the session transcript files.
+
+    Producers append to the active buffer; the writer thread swaps it for an
+    empty one under the lock (O(1)) and does all file I/O outside it, so
+    neither `log_transcript` nor API requests ever wait on the disk. With a
+    `log` (TranscriptLog), each record (`seq`, `ts`, `speaker`, `text`) is
+    appended to it on the writer thread too, in the order they were queued.
+
+    Buffers are flushed every `flush_interval` seconds or as soon as
+    `flush_lines` records are pending. `fsync` decides durability: "never"
+    leaves it to the OS, "interval" fsyncs at most every `fsync_interval`
+    seconds and "always" after every flush. `syncables` (objects with a
+    `sync()` method, e.g. the transcript log) are fsynced on the same policy.
+
+    Once a file reaches `rotate_bytes` or has been open `rotate_seconds`,
+    every file is closed and renamed to the next `<path>.NNN` part, ready
+    for the archive rotator to compress.
+    """
+
+    def __init__(self, paths, render, log=None, syncables=(), flush_interval=TRANSCRIPT_FLUSH_INTERVAL,
+                 flush_lines=TRANSCRIPT_FLUSH_LINES, fsync=TRANSCRIPT_FSYNC, fsync_interval=TRANSCRIPT_FSYNC_INTERVAL,
+                 rotate_bytes=TRANSCRIPT_ROTATE_BYTES, rotate_seconds=TRANSCRIPT_ROTATE_SECONDS):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}")
+        self.paths = paths
+        self.render = render  # record -> one line per path
+        self.log = log
+        self.syncables = syncables
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self._opened_at = 0.0
+        self._pending = []
+        self._oldest = None  # Arrival time of the oldest pending record
+        self._cond = threading.Condition()
+        self._files = None
+        self._last_fsync = time.monotonic()
+        self._stats = {"written": 0, "flushes": 0, "fsyncs": 0, "rotations": 0, "errors": 0,
+                       "last_flush_seconds": 0.0, "max_write_lag_seconds": 0.0}
+
+    def append(self, record):
+        with self._cond:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(record)
+            if len(self._pending) >= self.flush_lines:
+                self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+            lag = time.monotonic() - self._oldest if pending else 0.0
+            return {"fsync": self.fsync, "pending": pending, "write_lag_seconds": round(lag, 3),
+                    **{k: round(v, 4) if isinstance(v, float) else v for k, v in self._stats.items()}}
+
+    def _swap(self):
+        with self._cond:
+            batch, self._pending = self._pending, []
+            oldest, self._oldest = self._oldest, None
+            return batch, oldest
+
+    def _open(self):
+        if self._files is None:
+            self._files = [open(path, "a", encoding="utf-8") for path in self.paths]
+            self._opened_at = time.monotonic()
+        return self._files
+
+    def _rotate(self):
+        self._sync()  # Parts are final; make them durable before renaming
+        self._close()
+        for path in self.paths:
+            parts = [p for p in glob.glob(glob.escape(path) + ".*") if p[len(path) + 1:len(path) + 4].isdigit()]
+            part = 1 + max((int(p[len(path) + 1:len(path) + 4]) for p in parts), default=0)
+            os.replace(path, f"{path}.{part:03d}")
+        self._stats["rotations"] += 1
+
+    def _sync(self):
+        for f in self._files:
+            os.fsync(f.fileno())
+        for syncable in self.syncables:
+            syncable.sync()
+        self._last_fsync = time.monotonic()
+        self._stats["fsyncs"] += 1
+
+    def flush(self):
+        """Write everything pending; returns the number of records written"""
+        batch, oldest = self._swap()
+        if not batch:
+            return 0
+        started = time.monotonic()
+        try:
+            if self.log is not None:
+                for record in batch:
+                    if record.seq >= self.log.next_seq:  # Not already appended by a failed flush
+                        self.log.append(record.speaker, record.text, record.ts)
+            files = self._open()
+            columns = [[] for _ in files]
+            for record in batch:
+                for column, line in zip(columns, self.render(record)):
+                    column.append(line)
+            for f, column in zip(files, columns):
+                f.write("\n".join(column) + "\n")
+                f.flush()
+            if self.fsync == "always" or (
+                    self.fsync == "interval" and started - self._last_fsync >= self.fsync_interval):
+                self._sync()
+            rotate = (max(f.tell() for f in files) >= self.rotate_bytes
+                      or started - self._opened_at >= self.rotate_seconds)
+        except Exception:
+            # Put the batch back in front so nothing is lost; retried next round
+            with self._cond:
+                self._pending[:0] = batch
+                self._oldest = oldest
+            self._stats["errors"] += 1
+            self._close()
+            raise
+        now = time.monotonic()
+        self._stats["written"] += len(batch)
+        self._stats["flushes"] += 1
+        self._stats["last_flush_seconds"] = now - started
+        self._stats["max_write_lag_seconds"] = max(self._stats["max_write_lag_seconds"], now - oldest)
+        if rotate:
+            try:
+                self._rotate()
+            except OSError as e:
+                self._stats["errors"] += 1
+                self._close()  # Keep appending to the current files; retried next flush
+                print(f"[❌ Writer Error] Rotation failed: {e}")
+        return len(batch)
+
+    def _close(self):
+        for f in self._files or ():
+            try:
+                f.close()
+            except OSError:
+                pass
+        self._files = None
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._pending) >= self.flush_lines, timeout=self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[❌ Writer Error] {e}")
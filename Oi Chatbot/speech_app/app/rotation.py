@@ -0,0 +1,96 @@
+import glob
+import os
+import time
+from app.archive import ARCHIVE_SUFFIX, SOURCE_SUFFIX, compress_file, remove_archived, unarchived_bytes
+from app.config import TRANSCRIPT_DIR, SESSIONS_DIR, TIMESTAMP, ARCHIVE_IDLE_SECONDS, ARCHIVE_CHECK_INTERVAL
+from app.transcript_log import SEGMENT_SUFFIX, forget_session
+from app.writer import transcript_log
+
+TEXT_PREFIXES = ("with_speakers_", "plain_", "ai_responses_")
+
+
+class ArchiveRotator:
+    """Compresses closed transcript files into block archives in the background.
+
+    Closed files are rotated parts (`*.txt.NNN`, see TranscriptPersister),
+    other sessions' text files and transcript-log segments once idle for
+    `idle_seconds`, and this session's sealed log segments. Readers go
+    through ArchiveReader, so everything stays randomly accessible.
+
+    A plain file next to its archive is removed only if the archive holds
+    all of it (it is the archived file, whose removal failed). Otherwise it
+    has new data, e.g. text_gen recreated its ai_responses file after it
+    was archived, and once closed it is compressed onto the archive as
+    further blocks.
+    """
+
+    def __init__(self, transcript_log, directory=TRANSCRIPT_DIR, sessions_dir=SESSIONS_DIR,
+                 idle_seconds=ARCHIVE_IDLE_SECONDS, interval=ARCHIVE_CHECK_INTERVAL):
+        self.transcript_log = transcript_log
+        self.directory = directory
+        self.sessions_dir = sessions_dir
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self._stats = {"archived": 0, "raw_bytes": 0, "archive_bytes": 0}
+
+    def stats(self):
+        return dict(self._stats)
+
+    def _compress(self, path):
+        size = unarchived_bytes(path)
+        target = path + ARCHIVE_SUFFIX
+        before = os.path.getsize(target) if os.path.exists(target) else 0
+        compress_file(path)
+        self._stats["archived"] += 1
+        self._stats["raw_bytes"] += size
+        self._stats["archive_bytes"] += os.path.getsize(target) - before
+
+    def _idle(self, path, now):
+        return now - os.path.getmtime(path) >= self.idle_seconds
+
+    def _closed_text_files(self, now):
+        for prefix in TEXT_PREFIXES:
+            for path in glob.glob(os.path.join(self.directory, prefix + "*.txt*")):
+                if path.endswith(ARCHIVE_SUFFIX) or path.endswith(SOURCE_SUFFIX) or path.endswith(".tmp"):
+                    continue
+                if not path.endswith(".txt") or (TIMESTAMP not in os.path.basename(path) and self._idle(path, now)):
+                    yield path
+
+    def _archive(self, path):
+        """Compress `path`, or just remove it if its archive already holds all of it"""
+        try:
+            if not remove_archived(path):
+                self._compress(path)
+        except OSError as e:
+            print(f"[❌ Archive Error] {path}: {e}")
+
+    def run_once(self):
+        now = time.time()
+        for path in list(self._closed_text_files(now)):
+            self._archive(path)
+
+        self._stats["archived"] += self.transcript_log.archive_sealed(compress_file)
+
+        if not os.path.isdir(self.sessions_dir):
+            return
+        for name in os.listdir(self.sessions_dir):
+            session_dir = os.path.join(self.sessions_dir, name)
+            if name == TIMESTAMP or not os.path.isdir(session_dir):
+                continue
+            segments = glob.glob(os.path.join(session_dir, "*" + SEGMENT_SUFFIX))
+            if not segments or not all(self._idle(p, now) for p in segments):
+                continue
+            forget_session(name)  # Reopened from the archives on next access
+            for path in segments:
+                self._archive(path)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[❌ Archive Error] {e}")
+
+
+rotator = ArchiveRotator(transcript_log)
@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+from app.config import (SAMPLERATE, SCHEDULER_POLICY, SCHEDULER_MAX_QUEUE, SCHEDULER_MAX_LAG_SECONDS,
+                        SCHEDULER_MERGE_MAX_SECONDS)
+
+POLICIES = ("drop_oldest", "merge", "degrade")
+MERGE_GAP_SECONDS = 0.3
+
+
+class _Job:
+    __slots__ = ("audio", "start", "end", "final", "stream", "captured_at")
+
+    def __init__(self, audio, start, final, stream, captured_at):
+        self.audio = audio
+        self.start = start
+        self.end = start + len(audio)  # Stream position; merged gaps make audio shorter than the span
+        self.final = final
+        self.stream = stream
+        self.captured_at = captured_at
+
+
+class TranscriptionScheduler:
+    """Bounded queue between audio capture and transcription.
+
+    Capture submits utterances without waiting; `workers` threads run them
+    through the transcribe stage in parallel, while the commit stage
+    (stitching, speaker attribution, logging) runs in capture order per
+    stream. Depth is capped at `max_queue` jobs and lag (age
+    of the oldest queued audio) at `max_lag` seconds; past either bound the
+    oldest jobs are dropped, whatever the policy. Before that point the
+    policy decides how to catch up:
+
+    - drop_oldest: nothing extra.
+    - merge: once half full, adjacent utterances of a stream are joined
+      into one Whisper call (up to `merge_max_seconds`).
+    - degrade: once half full or half the lag budget is used, transcribe
+      with the smaller fallback model until the queue drains.
+    """
+
+    def __init__(self, policy=SCHEDULER_POLICY, max_queue=SCHEDULER_MAX_QUEUE,
+                 max_lag=SCHEDULER_MAX_LAG_SECONDS, merge_max_seconds=SCHEDULER_MERGE_MAX_SECONDS,
+                 samplerate=SAMPLERATE):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduler policy: {policy}")
+        self.policy = policy
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        self.merge_max_samples = int(merge_max_seconds * samplerate)
+        self.gap = np.zeros(int(MERGE_GAP_SECONDS * samplerate), dtype=np.float32)
+        self.degraded = False
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.merged = 0
+        self.last_latency = 0.0
+        self._jobs = deque()
+        self._carry = {}
+        self._blocked = set()  # Streams waiting on a force-split piece's carry
+        self._dispatched = {}
+        self._committed = {}
+        self._cond = threading.Condition()
+        self._transcribe = None
+        self._commit = None
+
+    def start(self, transcribe, commit, workers=1):
+        """Start the worker threads.
+
+        `transcribe(audio, start, stream, degraded)` may run concurrently;
+        `commit(result, audio, start, final, stream)` is called in order per
+        stream and returns the number of samples consumed.
+        """
+        self._transcribe = transcribe
+        self._commit = commit
+        for _ in range(max(1, workers)):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, audio, start, final, stream=None):
+        with self._cond:
+            self._jobs.append(_Job(audio, start, final, stream, time.time()))
+            self.submitted += 1
+            self._enforce()
+            self._cond.notify()
+
+    def lag(self):
+        with self._cond:
+            return self._lag(time.time())
+
+    def stats(self):
+        with self._cond:
+            return {
+                "policy": self.policy,
+                "queue_depth": len(self._jobs),
+                "lag_seconds": round(self._lag(time.time()), 3),
+                "last_latency_seconds": round(self.last_latency, 3),
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "merged": self.merged,
+                "degraded": self.degraded,
+            }
+
+    def _lag(self, now):
+        return now - self._jobs[0].captured_at if self._jobs else 0.0
+
+    def _enforce(self):
+        now = time.time()
+        pressured = len(self._jobs) > self.max_queue // 2 or self._lag(now) > self.max_lag / 2
+        if pressured and self.policy == "merge":
+            self._merge_adjacent()
+        elif pressured and self.policy == "degrade" and not self.degraded:
+            self.degraded = True
+            print("[⚠️ Scheduler] Falling behind, switching to fallback model")
+        while self._jobs and (len(self._jobs) > self.max_queue or self._lag(now) > self.max_lag):
+            self._jobs.popleft()
+            self.dropped += 1
+
+    def _merge_adjacent(self):
+        merged = deque()
+        for job in self._jobs:
+            prev = merged[-1] if merged else None
+            if (prev is not None and prev.stream == job.stream
+                    and len(prev.audio) + len(self.gap) + len(job.audio) <= self.merge_max_samples):
+                # Force-split pieces are contiguous; separate utterances get a short silence gap
+                parts = [prev.audio, job.audio] if prev.end == job.start else [prev.audio, self.gap, job.audio]
+                prev.audio = np.concatenate(parts)
+                prev.end = job.end
+                prev.final = job.final
+                self.merged += 1
+            else:
+                merged.append(job)
+        self._jobs = merged
+
+    def _with_carry(self, job):
+        carry = self._carry.pop(job.stream, None)
+        if carry is not None and carry[0] + len(carry[1]) == job.start:
+            return np.concatenate([carry[1], job.audio]), carry[0]
+        return job.audio, job.start
+
+    def _next_job(self):
+        while True:
+            for i, job in enumerate(self._jobs):
+                if job.stream not in self._blocked:
+                    del self._jobs[i]
+                    return job
+            if not self._jobs and self.degraded:
+                self.degraded = False
+                print("[✅ Scheduler] Caught up, back to primary model")
+            self._cond.wait()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                seq = self._dispatched.get(job.stream, 0)
+                self._dispatched[job.stream] = seq + 1
+                if not job.final:
+                    # The next piece needs this one's remainder, so hold the stream
+                    self._blocked.add(job.stream)
+                degraded = self.degraded
+                audio, start = self._with_carry(job)
+
+            try:
+                result = self._transcribe(audio, start, job.stream, degraded)
+            except Exception as e:
+                print(f"[❌ Scheduler Error] {e}")
+                result = None
+
+            with self._cond:
+                while self._committed.get(job.stream, 0) != seq:
+                    self._cond.wait()
+            consumed = None
+            if result is not None:
+                try:
+                    consumed = self._commit(result, audio, start, job.final, job.stream)
+                except Exception as e:
+                    print(f"[❌ Scheduler Error] {e}")
+
+            with self._cond:
+                if not job.final:
+                    if consumed and consumed < len(audio):
+                        # Remainder of a force-split utterance goes in front of its next piece
+                        remainder = audio[consumed:]
+                        self._carry[job.stream] = (job.end - len(remainder), remainder)
+                    self._blocked.discard(job.stream)
+                self._committed[job.stream] = seq + 1
+                self.processed += 1
+                self.last_latency = time.time() - job.captured_at
+                self._cond.notify_all()
+
+
+scheduler = TranscriptionScheduler()
@@ -0,0 +1,322 @@
+import glob
+import math
+import os
+import pickle
+import re
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from app.archive import ARCHIVE_SUFFIX, logical_path, raw_size, read_from, read_range
+from app.config import (TRANSCRIPT_DIR, TIMESTAMP, SPEAKER_TRANSCRIPT_PATH, SEARCH_TAIL_INTERVAL, SEARCH_DEFAULT_LIMIT,
+                        SEARCH_INDEX_DIR)
+
+TOKEN_RE = re.compile(r"\w+")
+PHRASE_RE = re.compile(r'"([^"]+)"')
+LINE_RE = re.compile(rb"^\[(\d\d):(\d\d):(\d\d)\] ([^:\n]+): ([^\n]*)$", re.M)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def _mtime(path):
+    """Modification time of `path` or of its archive"""
+    return os.path.getmtime(path if os.path.exists(path) else path + ARCHIVE_SUFFIX)
+
+
+def _session_start(session, path):
+    try:
+        return datetime.strptime(session, "%Y-%m-%d_%H-%M-%S")
+    except ValueError:
+        return datetime.fromtimestamp(_mtime(path))
+
+
+class _Shard:
+    """Inverted index of one file's lines (or of the live session).
+
+    Each line is a document. Postings are per-term arrays of (doc id, term
+    frequency), appended in doc-id order. The text itself is not kept: a
+    document records where its text is, as a raw byte range of the file
+    (plain or archived), or for the live session its seq in the transcript
+    log, and is read back only for results and phrase checks.
+    """
+    __slots__ = ("path", "session", "source", "offset", "clock", "postings", "starts", "ends",
+                 "timestamps", "speakers", "lengths", "total_length")
+
+    def __init__(self, path, session, source, clock=None):
+        self.path = path  # Logical path of the file; None for the live session
+        self.session = session
+        self.source = source
+        self.offset = 0  # Raw bytes of the file indexed so far
+        self.clock = clock  # Date of the last line, for transcripts whose lines carry only hh:mm:ss
+        self.postings = {}  # term -> (array of doc ids, array of term frequencies)
+        self.starts = array("q")
+        self.ends = array("q")
+        self.timestamps = array("d")
+        self.speakers = []
+        self.lengths = array("I")
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, ts, speaker, text, start, end):
+        terms = tokenize(text)
+        if not terms:
+            return
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        doc = len(self.lengths)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.timestamps.append(ts)
+        self.speakers.append(sys.intern(speaker))
+        self.lengths.append(len(terms))
+        self.total_length += len(terms)
+        for term, count in counts.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array("I"), array("I"))
+            entry[0].append(doc)
+            entry[1].append(count)
+
+    def text(self, doc):
+        if self.path is not None:
+            return read_range(self.path, self.starts[doc], self.ends[doc]).decode("utf-8", errors="replace")
+        from app.writer import read_live  # The writer imports this module
+        seq = self.starts[doc]
+        records = read_live(seq - 1, limit=1)
+        return records[0]["text"] if records and records[0]["seq"] == seq else ""
+
+    def save(self, path):
+        state = {name: getattr(self, name) for name in self.__slots__}
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        shard = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(shard, name, state[name])
+        return shard
+
+
+class TranscriptIndex:
+    """Full-text index over every transcript and AI-response line, one shard per file.
+
+    Adding a line is O(its tokens) and a query only touches the postings of
+    its own terms. Quoted phrases are verified on the few documents that
+    contain all of their words; results are ranked with BM25 over the
+    statistics of all shards together.
+    """
+
+    def __init__(self):
+        self.shards = {}  # Logical path (None for the live session) -> _Shard
+        self._lock = threading.Lock()
+
+    def shard(self, path, factory):
+        """The shard for `path`, made with `factory()` on first use"""
+        with self._lock:
+            shard = self.shards.get(path)
+        if shard is None:
+            shard = factory()
+            with self._lock:
+                shard = self.shards.setdefault(path, shard)
+        return shard
+
+    def add(self, shard, ts, speaker, text, start, end):
+        with self._lock:
+            shard.add(ts, speaker, text, start, end)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(shard) for shard in self.shards.values())
+
+    def search(self, query, speaker=None, from_ts=None, to_ts=None, source=None, limit=SEARCH_DEFAULT_LIMIT):
+        """Documents containing every query term (and quoted phrase), best first"""
+        phrases = [tokenize(p) for p in PHRASE_RE.findall(query)]
+        phrases = [p for p in phrases if len(p) > 1]
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return 0, []
+        speaker = speaker.lower() if speaker else None
+
+        matches = []  # (score, ts, shard, doc)
+        with self._lock:
+            shards = list(self.shards.values())
+            n_docs = sum(len(shard) for shard in shards)
+            if not n_docs:
+                return 0, []
+            avg_length = sum(shard.total_length for shard in shards) / n_docs
+            df = [sum(len(shard.postings[term][0]) for shard in shards if term in shard.postings) for term in terms]
+            idf = [math.log(1 + (n_docs - n + 0.5) / (n + 0.5)) for n in df]
+            for shard in shards:
+                if source is not None and shard.source != source:
+                    continue
+                entries = [shard.postings.get(term) for term in terms]
+                if any(entry is None for entry in entries):
+                    continue
+                # Intersect from the rarest term, keeping each doc's term frequencies
+                order = sorted(range(len(terms)), key=lambda i: len(entries[i][0]))
+                candidates = dict(zip(entries[order[0]][0], ([0] * len(terms) for _ in entries[order[0]][0])))
+                for i in order:
+                    docs, freqs = entries[i]
+                    found = {}
+                    for doc, tf in zip(docs, freqs):
+                        tfs = candidates.get(doc)
+                        if tfs is not None:
+                            tfs[i] = tf
+                            found[doc] = tfs
+                    candidates = found
+                    if not candidates:
+                        break
+                for doc, tfs in candidates.items():
+                    if speaker is not None and shard.speakers[doc].lower() != speaker:
+                        continue
+                    ts = shard.timestamps[doc]
+                    if (from_ts is not None and ts < from_ts) or (to_ts is not None and ts >= to_ts):
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * shard.lengths[doc] / avg_length)
+                    score = sum(w * tf * (BM25_K1 + 1) / (tf + norm) for w, tf in zip(idf, tfs))
+                    matches.append((score, ts, shard, doc))
+
+        # Texts are read from disk, outside the lock
+        if phrases:
+            matches = [m for m in matches if self._has_phrases(tokenize(m[2].text(m[3])), phrases)]
+        matches.sort(key=lambda m: (m[0], m[1]), reverse=True)
+        return len(matches), [{
+            "session": shard.session,
+            "source": shard.source,
+            "ts": ts,
+            "speaker": shard.speakers[doc],
+            "text": shard.text(doc),
+            "score": round(score, 4),
+        } for score, ts, shard, doc in matches[:limit]]
+
+    @staticmethod
+    def _has_phrases(tokens, phrases):
+        for phrase in phrases:
+            n = len(phrase)
+            if not any(tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1)):
+                return False
+        return True
+
+
+class TranscriptIndexer:
+    """Keeps `index` current with the transcript files on disk.
+
+    Past sessions' `with_speakers_*.txt` and every `ai_responses_*.txt`
+    (written by text_gen, in another process) are tailed from their last
+    indexed byte offset, so each line is read once. Rotated parts and
+    archived files are read the same way through `app.archive`, which only
+    decompresses the blocks past the offset. Each file's shard is saved to
+    `index_dir` whenever it grows and loaded from there on startup, so
+    restarts only read what was appended since. The live session is fed
+    directly by `log_transcript` instead.
+    """
+
+    def __init__(self, index, directory=TRANSCRIPT_DIR, index_dir=SEARCH_INDEX_DIR, interval=SEARCH_TAIL_INTERVAL):
+        self.index = index
+        self.directory = directory
+        self.index_dir = index_dir
+        self.interval = interval
+        os.makedirs(index_dir, exist_ok=True)
+
+    def _saved_path(self, path):
+        return os.path.join(self.index_dir, os.path.basename(path) + ".idx")
+
+    def _open_shard(self, path, prefix, source):
+        """The saved shard of `path`, or a new one if there is none (or the file shrank since)"""
+        saved = self._saved_path(path)
+        if os.path.exists(saved):
+            try:
+                shard = _Shard.load(saved)
+                if shard.path == path and raw_size(path) >= shard.offset:
+                    return shard
+            except Exception as e:
+                print(f"[❌ Search Index Error] {saved}: {e}")
+        # with_speakers_<session>.txt, its rotated parts .txt.NNN and their archives
+        session = os.path.basename(path).split(".txt", 1)[0][len(prefix):]
+        return _Shard(path, session, source, _session_start(session, path))
+
+    def _index_transcript(self, path, shard):
+        data = read_from(path, shard.offset)
+        end = data.rfind(b"\n") + 1  # Leave a partially written line for next time
+        for match in LINE_RE.finditer(data, 0, end):
+            h, m, s = (int(g) for g in match.groups()[:3])
+            clock = shard.clock.replace(hour=h, minute=m, second=s)
+            if clock < shard.clock:
+                clock += timedelta(days=1)  # Session ran past midnight
+            shard.clock = clock
+            start, stop = match.span(5)
+            self.index.add(shard, clock.timestamp(), match.group(4).decode("utf-8", errors="replace"),
+                           match.group(5).decode("utf-8", errors="replace"), shard.offset + start, shard.offset + stop)
+        shard.offset += end
+
+    def _index_responses(self, path, shard):
+        data = read_from(path, shard.offset)
+        # Exchanges are "[User] ...\n[AI] ...\n\n"; only consume complete ones
+        end = data.rfind(b"\n\n") + 2 if data.endswith(b"\n\n") else data.rfind(b"\n[User] ") + 1
+        if end <= 0:
+            return
+        ts = _mtime(path)  # Lines carry no clock; the append time is close enough
+        start = 0
+        while start < end:
+            boundary = data.find(b"\n[User] ", start, end)
+            stop = end if boundary < 0 else boundary + 1
+            block = data[start:stop].rstrip(b"\n")
+            if block.startswith(b"[User] "):
+                split = block.find(b"\n[AI] ")
+                user_end = split if split >= 0 else len(block)
+                self._add_range(shard, ts, "User", data, start + len(b"[User] "), start + user_end)
+                if split >= 0:
+                    self._add_range(shard, ts, "AI", data, start + split + len(b"\n[AI] "), start + len(block))
+            start = stop
+        shard.offset += end
+
+    def _add_range(self, shard, ts, speaker, data, start, stop):
+        text = data[start:stop].decode("utf-8", errors="replace")
+        self.index.add(shard, ts, speaker, text, shard.offset + start, shard.offset + stop)
+
+    def scan(self):
+        own = os.path.abspath(SPEAKER_TRANSCRIPT_PATH)
+        for prefix, source, index_file in (("with_speakers_", "transcript", self._index_transcript),
+                                           ("ai_responses_", "ai_responses", self._index_responses)):
+            paths = {logical_path(p) for p in glob.glob(os.path.join(self.directory, prefix + "*.txt*"))
+                     if not p.endswith(".tmp")}
+            for path in sorted(paths):
+                if os.path.abspath(path).startswith(own):
+                    continue  # This session and its rotated parts are indexed live
+                try:
+                    shard = self.index.shard(path, lambda: self._open_shard(path, prefix, source))
+                    if raw_size(path) > shard.offset:
+                        index_file(path, shard)
+                        shard.save(self._saved_path(path))
+                except OSError as e:
+                    print(f"[❌ Search Index Error] {path}: {e}")
+
+    def run(self):
+        started = time.time()
+        self.scan()
+        print(f"[🔎 Search] {len(self.index)} lines searchable after {time.time() - started:.1f}s")
+        while True:
+            time.sleep(self.interval)
+            self.scan()
+
+
+search_index = TranscriptIndex()
+indexer = TranscriptIndexer(search_index)
+_live = _Shard(None, TIMESTAMP, "transcript")
+search_index.shards[None] = _live
+
+
+def index_live(seq, ts, speaker, text):
+    search_index.add(_live, ts, speaker, text, seq, seq)
@@ -1,26 +1,228 @@
-from resemblyzer import preprocess_wav
+import threading
+from collections import deque
+import librosa
+from resemblyzer.audio import normalize_volume
+from resemblyzer.hparams import audio_norm_target_dBFS, sampling_rate as ENCODER_SAMPLERATE
 import numpy as np
-from sklearn.cluster import DBSCAN
 from app.models import encoder
-from app.config import MAX_SPEAKERS, SAMPLERATE
+from app.config import (MAX_SPEAKERS, SAMPLERATE, SPEAKER_MATCH_SIMILARITY, SPEAKER_MERGE_SIMILARITY,
+                        SPEAKER_SPLIT_COHESION, SPEAKER_MIN_COUNT, SPEAKER_MAINTENANCE_INTERVAL)
 
-embedding_history = []
 
-def identify_speaker(audio_frames, known_speakers):
-    wav = preprocess_wav(np.concatenate(audio_frames), source_sr=SAMPLERATE)
-    if np.mean(np.abs(wav)) < 0.01:
-        return "Unknown"
+def _normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
 
-    embedding = encoder.embed_utterance(wav)
-    embedding_history.append(embedding)
 
-    if len(embedding_history) < 5:
-        return "Unknown"
+class _Centroid:
+    __slots__ = ("vector", "count", "label", "last_seen", "cohesion", "recent")
 
-    clustering = DBSCAN(eps=0.4, min_samples=5).fit(embedding_history)
-    label = clustering.labels_[-1]
+    def __init__(self, vector, step, reservoir_size):
+        self.vector = vector
+        self.count = 1
+        self.label = None
+        self.last_seen = step
+        self.cohesion = 1.0  # Running mean similarity of members to the centroid
+        self.recent = deque([vector], maxlen=reservoir_size)
 
-    identity = f"Speaker_{label + 1}" if label >= 0 else "Unknown"
-    if identity not in known_speakers and len(known_speakers) < MAX_SPEAKERS:
-        known_speakers[identity] = embedding
-    return identity
+
+class OnlineSpeakerClusterer:
+    """Incremental speaker clustering over a bounded set of centroids.
+
+    Each embedding is compared against at most `max_speakers + max_candidates`
+    centroids, so attribution cost and memory stay constant however long the
+    meeting runs. New voices start as unlabelled candidates and get a
+    Speaker_N label once heard `min_count` times (DBSCAN's min_samples).
+    Every `maintenance_interval` assignments, near-duplicate centroids are
+    merged, stale candidates dropped and incoherent speakers split in two.
+    """
+
+    def __init__(self, match_similarity=SPEAKER_MATCH_SIMILARITY, merge_similarity=SPEAKER_MERGE_SIMILARITY,
+                 split_cohesion=SPEAKER_SPLIT_COHESION, max_speakers=MAX_SPEAKERS, max_candidates=4,
+                 min_count=SPEAKER_MIN_COUNT, maintenance_interval=SPEAKER_MAINTENANCE_INTERVAL,
+                 reservoir_size=32, max_weight=200):
+        self.match_similarity = match_similarity
+        self.merge_similarity = merge_similarity
+        self.split_cohesion = split_cohesion
+        self.max_speakers = max_speakers
+        self.max_candidates = max_candidates
+        self.min_count = min_count
+        self.maintenance_interval = maintenance_interval
+        self.reservoir_size = reservoir_size
+        self.max_weight = max_weight
+        self.centroids = []
+        self.step = 0
+        self._next_label = 1
+        self._lock = threading.Lock()
+
+    def assign(self, embedding):
+        """Return the speaker label for one embedding and update the model"""
+        embedding = _normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            self.step += 1
+            best, similarity = self._nearest(embedding)
+            if best is None or similarity < self.match_similarity:
+                best = self._spawn(embedding)
+            else:
+                self._update(best, embedding, similarity)
+
+            if best.label is None and best.count >= self.min_count:
+                self._promote(best)
+            label = best.label
+
+            if self.step % self.maintenance_interval == 0:
+                self._maintain()
+        return label or "Unknown"
+
+    def speakers(self):
+        with self._lock:
+            return {c.label: c.vector for c in self.centroids if c.label}
+
+    def _labelled(self):
+        return sum(1 for c in self.centroids if c.label)
+
+    def _nearest(self, embedding):
+        best, best_sim = None, -1.0
+        for centroid in self.centroids:
+            sim = float(np.dot(centroid.vector, embedding))
+            if sim > best_sim:
+                best, best_sim = centroid, sim
+        return best, best_sim
+
+    def _spawn(self, embedding):
+        candidates = [c for c in self.centroids if c.label is None]
+        if len(candidates) >= self.max_candidates:
+            self.centroids.remove(min(candidates, key=lambda c: c.last_seen))
+        centroid = _Centroid(embedding, self.step, self.reservoir_size)
+        self.centroids.append(centroid)
+        return centroid
+
+    def _update(self, centroid, embedding, similarity):
+        # Capped weight keeps the centroid tracking slow drift in a long session
+        weight = 1.0 / min(centroid.count + 1, self.max_weight)
+        centroid.vector = _normalize((1 - weight) * centroid.vector + weight * embedding)
+        centroid.count += 1
+        centroid.last_seen = self.step
+        centroid.cohesion = 0.9 * centroid.cohesion + 0.1 * similarity
+        centroid.recent.append(embedding)
+
+    def _promote(self, centroid):
+        if self._labelled() < self.max_speakers:
+            centroid.label = f"Speaker_{self._next_label}"
+            self._next_label += 1
+
+    def _maintain(self):
+        stale_after = 4 * self.maintenance_interval
+        self.centroids = [c for c in self.centroids
+                          if c.label or self.step - c.last_seen <= stale_after]
+        self._merge()
+        self._split()
+
+    def _merge(self):
+        i = 0
+        while i < len(self.centroids):
+            keep = self.centroids[i]
+            j = i + 1
+            while j < len(self.centroids):
+                other = self.centroids[j]
+                if float(np.dot(keep.vector, other.vector)) >= self.merge_similarity:
+                    # Earlier centroid wins so established labels stay stable
+                    total = keep.count + other.count
+                    keep.vector = _normalize((keep.count * keep.vector + other.count * other.vector) / total)
+                    keep.count = total
+                    keep.label = keep.label or other.label
+                    keep.last_seen = max(keep.last_seen, other.last_seen)
+                    keep.recent.extend(other.recent)
+                    del self.centroids[j]
+                else:
+                    j += 1
+            i += 1
+
+    def _split(self):
+        for centroid in list(self.centroids):
+            if (centroid.label is None or centroid.cohesion >= self.split_cohesion
+                    or len(centroid.recent) < self.reservoir_size // 2
+                    or self._labelled() >= self.max_speakers):
+                continue
+            halves = self._two_means(np.stack(centroid.recent))
+            if halves is None:
+                continue
+            (a, a_members), (b, b_members) = halves
+            if float(np.dot(a, b)) >= self.match_similarity:
+                continue
+            share = len(b_members) / (len(a_members) + len(b_members))
+            split = _Centroid(b, self.step, self.reservoir_size)
+            split.count = max(self.min_count, int(centroid.count * share))
+            split.recent.extend(b_members)
+            self.centroids.append(split)
+            self._promote(split)
+            centroid.vector = a
+            centroid.count = max(1, centroid.count - split.count)
+            centroid.cohesion = 1.0
+            centroid.recent = deque(a_members, maxlen=self.reservoir_size)
+
+    @staticmethod
+    def _two_means(members, iterations=5):
+        sims = members @ members.T
+        i, j = np.unravel_index(np.argmin(sims), sims.shape)
+        centers = np.stack([members[i], members[j]])
+        for _ in range(iterations):
+            assign = np.argmax(members @ centers.T, axis=1)
+            if assign.min() == assign.max():
+                return None
+            centers = np.stack([_normalize(members[assign == k].mean(axis=0)) for k in (0, 1)])
+        big, small = (0, 1) if (assign == 0).sum() >= (assign == 1).sum() else (1, 0)
+        return (centers[big], list(members[assign == big])), (centers[small], list(members[assign == small]))
+
+
+clusterer = OnlineSpeakerClusterer()
+
+def _preprocess(audio):
+    """Resemblyzer's preprocess_wav minus trim_long_silences, which would shift
+    the encoder windows off the chunk's timeline; None for digital silence"""
+    wav = np.asarray(audio, dtype=np.float32)
+    if SAMPLERATE != ENCODER_SAMPLERATE:
+        wav = librosa.resample(wav, orig_sr=SAMPLERATE, target_sr=ENCODER_SAMPLERATE)
+    if not wav.any():  # normalize_volume would scale zeros by infinity
+        return None
+    return normalize_volume(wav, audio_norm_target_dBFS, increase_only=True)
+
+def embed_spans(audio, spans):
+    """One encoder pass over `audio`, then one embedding per (start, end) span in seconds.
+
+    Resemblyzer's partial embeddings (1.6 s windows) are averaged over the
+    windows overlapping each span. Returns None entries for silence.
+    """
+    wav = _preprocess(audio)
+    if wav is None or np.mean(np.abs(wav)) < 0.01:
+        return [None] * len(spans)
+
+    _, partials, wav_slices = encoder.embed_utterance(wav, return_partials=True)
+    starts = np.array([s.start for s in wav_slices]) / ENCODER_SAMPLERATE
+    stops = np.array([s.stop for s in wav_slices]) / ENCODER_SAMPLERATE
+    centers = (starts + stops) / 2
+
+    embeddings = []
+    for start, end in spans:
+        mask = (starts < end) & (stops > start)
+        if not mask.any():
+            mask = np.zeros(len(partials), dtype=bool)
+            mask[np.argmin(np.abs(centers - (start + end) / 2))] = True
+        embeddings.append(_normalize(partials[mask].mean(axis=0)))
+    return embeddings
+
+def identify_speakers(audio, spans, known_speakers):
+    """Speaker label for each (start, end) span of `audio`, from a single encoder pass"""
+    identities = []
+    for embedding in embed_spans(audio, spans):
+        if embedding is None:
+            identities.append("Unknown")
+            continue
+        identity = clusterer.assign(embedding)
+        if identity != "Unknown" and identity not in known_speakers and len(known_speakers) < MAX_SPEAKERS:
+            known_speakers[identity] = embedding
+        identities.append(identity)
+    return identities
+
+def identify_speaker(audio, known_speakers):
+    return identify_speakers(audio, [(0.0, len(audio) / SAMPLERATE)], known_speakers)[0]
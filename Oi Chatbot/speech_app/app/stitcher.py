@@ -0,0 +1,72 @@
+from collections import namedtuple
+from app.config import STITCH_HOLDBACK_SECONDS, STITCH_MAX_REWIND_SECONDS, STITCH_CONTEXT_CHARS
+
+# Absolute stream times in seconds
+StitchedSegment = namedtuple("StitchedSegment", ["start", "end", "text"])
+
+
+class TranscriptStitcher:
+    """Commits each stretch of a stream's audio to the transcript exactly once.
+
+    Words ending in the last `holdback` seconds of a chunk may be cut off, so
+    they are not committed; instead the next chunk is started just before
+    the cut word and only that short tail is decoded again.
+    Words whose midpoint falls before the commit point are dropped, which
+    removes the duplicate lines fixed overlaps used to produce. The tail of
+    the committed text is offered as the decoder prompt for the next chunk.
+    """
+
+    def __init__(self, holdback=STITCH_HOLDBACK_SECONDS, max_rewind=STITCH_MAX_REWIND_SECONDS,
+                 context_chars=STITCH_CONTEXT_CHARS):
+        self.holdback = holdback
+        self.max_rewind = max_rewind
+        self.context_chars = context_chars
+        self.committed_until = 0.0
+        self.context = ""
+
+    def prompt(self):
+        return self.context or None
+
+    def skip(self, until):
+        """Mark audio up to `until` as handled without text (e.g. silence)"""
+        self.committed_until = max(self.committed_until, until)
+
+    def stitch(self, segments, chunk_start, chunk_end, final=False):
+        """Return (committed segments, stream time the next chunk should start at)"""
+        cutoff = chunk_end if final else chunk_end - self.holdback
+        rewind_floor = chunk_end - self.max_rewind
+        committed, held = [], None
+
+        for segment in segments:
+            words = segment.words or [segment]
+            kept = []
+            for word in words:
+                start, end = chunk_start + word.start, chunk_start + word.end
+                if (start + end) / 2 < self.committed_until:
+                    continue
+                # Words that start too early to be re-decoded are committed as they are
+                if end > cutoff and start >= rewind_floor:
+                    held = start
+                    break
+                kept.append((start, end, getattr(word, "word", None) or word.text))
+            if kept:
+                text = "".join(t for _, _, t in kept).strip()
+                if text:
+                    committed.append(StitchedSegment(kept[0][0], kept[-1][1], text))
+                self.committed_until = max(self.committed_until, kept[-1][1])
+            if held is not None:
+                break
+
+        if committed:
+            self.context = (self.context + " " + " ".join(s.text for s in committed))[-self.context_chars:].lstrip()
+
+        if final:
+            resume = chunk_end
+        elif held is not None:
+            # Leave a little lead-in before the cut word for the decoder
+            resume = max(self.committed_until, held - self.holdback)
+        else:
+            resume = max(self.committed_until, cutoff)
+        resume = min(chunk_end, max(resume, rewind_floor, chunk_start))
+        self.committed_until = max(self.committed_until, min(resume, cutoff))
+        return committed, resume
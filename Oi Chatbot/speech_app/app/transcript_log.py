@@ -0,0 +1,353 @@
+import bisect
+import json
+import mmap
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from app.archive import ArchiveReader, ARCHIVE_SUFFIX, remove_archived
+from app.config import (
+    SESSIONS_DIR, TRANSCRIPT_LOG_DIR, TRANSCRIPT_SEGMENT_BYTES, TRANSCRIPT_SEGMENT_SECONDS, TRANSCRIPT_READ_LIMIT,
+    TRANSCRIPT_OPEN_SESSIONS,
+)
+
+SEGMENT_SUFFIX = ".jsonl"
+OFFSETS_SUFFIX = ".off"  # int64 byte offset of each record
+TIMESTAMPS_SUFFIX = ".ts"  # float64 epoch seconds of each record
+
+
+def _map(path, length):
+    """Read-only mmap of the first `length` bytes of `path` (None when empty)"""
+    if length <= 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ)
+
+
+def _map_column(path, typecode, count):
+    mapped = _map(path, count * 8)
+    return memoryview(mapped).cast(typecode) if mapped is not None else memoryview(array(typecode))
+
+
+class _Segment:
+    """One JSONL segment plus its fixed-width offset and timestamp columns.
+
+    The active segment keeps its columns in arrays while it grows; sealed
+    segments memory-map them (and their data), so opening a session of any
+    size costs a few mmaps instead of a scan and the OS pages in only what
+    reads touch. Once archived, a sealed segment's data is served by an
+    ArchiveReader instead; offsets stay the raw ones.
+    """
+    __slots__ = ("path", "base_seq", "offsets", "timestamps", "size", "sealed", "_data")
+
+    def __init__(self, path, base_seq):
+        self.path = path
+        self.base_seq = base_seq
+        self.offsets = array("q")
+        self.timestamps = array("d")
+        self.size = 0
+        self.sealed = False
+        self._data = None
+
+    @property
+    def end_seq(self):
+        return self.base_seq + len(self.offsets)
+
+    def _column_paths(self):
+        stem = self.path[:-len(SEGMENT_SUFFIX)]
+        return stem + OFFSETS_SUFFIX, stem + TIMESTAMPS_SUFFIX
+
+    @property
+    def archived(self):
+        return isinstance(self._data, ArchiveReader)
+
+    def _lines(self):
+        if self.archived:
+            yield from self._data.read(0).splitlines(keepends=True)
+        else:
+            with open(self.path, "rb") as f:
+                yield from f
+
+    def _rebuild_columns(self):
+        """Write the columns of a segment that lacks them (or has torn ones)"""
+        offsets, timestamps, size = array("q"), array("d"), 0
+        for line in self._lines():
+            if not line.endswith(b"\n"):
+                break  # Torn final write
+            offsets.append(size)
+            timestamps.append(json.loads(line)["ts"])
+            size += len(line)
+        off_path, ts_path = self._column_paths()
+        with open(off_path, "wb") as f:
+            offsets.tofile(f)
+        with open(ts_path, "wb") as f:
+            timestamps.tofile(f)
+        return len(offsets), size
+
+    def seal(self):
+        """Swap the in-memory columns for mapped ones"""
+        off_path, ts_path = self._column_paths()
+        if not os.path.exists(self.path) and os.path.exists(self.path + ARCHIVE_SUFFIX):
+            self._data = ArchiveReader(self.path + ARCHIVE_SUFFIX)
+            size = self._data.size
+        else:
+            size = os.path.getsize(self.path)
+        try:
+            count = min(os.path.getsize(off_path), os.path.getsize(ts_path)) // 8
+        except OSError:
+            count = None  # Written before the columns existed
+        if count is None or (count == 0 and size):
+            count, size = self._rebuild_columns()
+        offsets = _map_column(off_path, "q", count)
+        if count and not self.archived:  # Archives are only made from sealed, checked segments
+            # Size the segment to the end of its last indexed record, which
+            # also drops any torn bytes after it
+            with open(self.path, "rb") as f:
+                f.seek(offsets[count - 1])
+                line = f.readline()
+            if line.endswith(b"\n"):
+                size = offsets[count - 1] + len(line)
+            else:  # Columns outlived their record (crash mid-append)
+                offsets.release()
+                count, size = self._rebuild_columns()
+                offsets = _map_column(off_path, "q", count)
+        self.offsets = offsets
+        self.timestamps = _map_column(ts_path, "d", count)
+        self.size = size
+        self.sealed = True
+
+    def data(self):
+        if self._data is None:
+            self._data = _map(self.path, self.size)
+        return self._data
+
+
+class TranscriptLog:
+    """Append-only, segment-rotated log of structured transcript records.
+
+    Records are JSON lines `{"seq", "ts", "speaker", "text"}` in segment
+    files of about `segment_bytes`, each with `.off`/`.ts` column files
+    holding every record's byte offset and timestamp. Ranges by sequence
+    number or time are found by indexing/bisecting the columns and served
+    with one read per segment, without scanning the files or holding the
+    text in RAM. Segments left by an earlier run are sealed and mapped;
+    appends always go to a fresh segment.
+    """
+
+    def __init__(self, directory=TRANSCRIPT_LOG_DIR, segment_bytes=TRANSCRIPT_SEGMENT_BYTES,
+                 segment_seconds=TRANSCRIPT_SEGMENT_SECONDS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self._opened_at = 0.0
+        self.segments = []
+        self._files = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def next_seq(self):
+        return self.segments[-1].end_seq if self.segments else 0
+
+    def _load(self):
+        """Map segments left by an earlier run of the same session"""
+        names = {n[:-len(ARCHIVE_SUFFIX)] if n.endswith(ARCHIVE_SUFFIX) else n for n in os.listdir(self.directory)}
+        for name in sorted(n for n in names if n.endswith(SEGMENT_SUFFIX)):
+            segment = _Segment(os.path.join(self.directory, name), self.next_seq)
+            segment.seal()
+            self.segments.append(segment)
+
+    def _close_files(self):
+        for f in self._files:
+            f.close()
+        self._files = None
+
+    def _active(self):
+        segment = self.segments[-1] if self.segments else None
+        if (segment is None or segment.sealed or segment.size >= self.segment_bytes
+                or time.monotonic() - self._opened_at >= self.segment_seconds):
+            if self._files is not None:
+                self._close_files()
+                segment.seal()
+            seq = self.next_seq
+            segment = _Segment(os.path.join(self.directory, f"{seq:012d}{SEGMENT_SUFFIX}"), seq)
+            self.segments.append(segment)
+        if self._files is None:
+            self._files = (open(segment.path, "ab"),) + tuple(open(p, "ab") for p in segment._column_paths())
+            self._opened_at = time.monotonic()
+        return segment
+
+    def append(self, speaker, text, ts):
+        """Write one record and return it (with its assigned seq)"""
+        with self._lock:
+            segment = self._active()
+            record = {"seq": segment.end_seq, "ts": ts, "speaker": speaker, "text": text}
+            data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+            data_file, off_file, ts_file = self._files
+            data_file.write(data)
+            data_file.flush()
+            # Columns are written after the record, so they never point past it
+            off_file.write(array("q", (segment.size,)).tobytes())
+            ts_file.write(array("d", (ts,)).tobytes())
+            off_file.flush()
+            ts_file.flush()
+            segment.offsets.append(segment.size)
+            segment.timestamps.append(ts)
+            segment.size += len(data)
+            return record
+
+    def archive_sealed(self, compress):
+        """Compress sealed segments still stored raw with `compress(path)`.
+
+        Each one switches to its archive once written; returns how many.
+        """
+        with self._lock:
+            pending = [s for s in self.segments if s.sealed and not s.archived]
+        for segment in pending:
+            reader = ArchiveReader(compress(segment.path))
+            with self._lock:
+                segment._data = reader  # Drops the mmap once in-flight reads finish
+            try:
+                remove_archived(segment.path)
+            except OSError:
+                pass  # Still mapped by a reader; the archive is used from now on
+        return len(pending)
+
+    def sync(self):
+        """fsync the active segment (appends are only flushed to the OS).
+
+        Call from the appending thread: the files are fsynced outside the
+        lock, so reads never wait on the disk.
+        """
+        with self._lock:
+            files = self._files
+        for f in files or ():
+            os.fsync(f.fileno())
+
+    def seq_at(self, ts):
+        """First seq whose timestamp is >= ts"""
+        with self._lock:
+            segments = list(self.segments)
+        for segment in segments:
+            if len(segment.timestamps) and segment.timestamps[-1] >= ts:
+                return segment.base_seq + bisect.bisect_left(segment.timestamps, ts)
+        return segments[-1].end_seq if segments else 0
+
+    def first_ts(self):
+        for segment in self.segments:
+            if len(segment.timestamps):
+                return segment.timestamps[0]
+        return None
+
+    def last_ts(self):
+        for segment in reversed(self.segments):
+            if len(segment.timestamps):
+                return segment.timestamps[-1]
+        return None
+
+    def read(self, since_seq=None, from_ts=None, to_ts=None, limit=TRANSCRIPT_READ_LIMIT):
+        """Records with seq > since_seq and from_ts <= ts < to_ts, oldest first"""
+        start = since_seq + 1 if since_seq is not None else 0
+        if from_ts is not None:
+            start = max(start, self.seq_at(from_ts))
+        with self._lock:
+            segments = [(s, s.end_seq, s.size) for s in self.segments]
+        stop = segments[-1][1] if segments else 0
+        if to_ts is not None:
+            stop = min(stop, self.seq_at(to_ts))
+        stop = min(stop, start + limit)
+
+        records = []
+        for segment, end_seq, size in segments:
+            if end_seq <= start or segment.base_seq >= stop:
+                continue
+            first = max(start, segment.base_seq) - segment.base_seq
+            last = min(stop, end_seq) - segment.base_seq
+            begin = segment.offsets[first]
+            end = segment.offsets[last] if last < end_seq - segment.base_seq else size
+            if segment.sealed:
+                data = segment.data()[begin:end]
+            else:
+                with open(segment.path, "rb") as f:
+                    f.seek(begin)
+                    data = f.read(end - begin)
+            records.extend(json.loads(line) for line in data.splitlines())
+        return records
+
+
+_open_sessions = OrderedDict()
+_open_sessions_lock = threading.Lock()
+
+
+def list_sessions(directory=SESSIONS_DIR):
+    """Names of every recorded session, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(n for n in os.listdir(directory) if os.path.isdir(os.path.join(directory, n)))
+
+
+def session_summary(name, directory=SESSIONS_DIR):
+    """(records, first_ts, last_ts) of a past session, from the sizes and ends
+    of its .off/.ts columns; does not open (or cache) the session's log.
+
+    Raises KeyError for unknown sessions.
+    """
+    path = os.path.join(directory, name)
+    if os.path.basename(name) != name or not os.path.isdir(path):
+        raise KeyError(name)
+    stems = sorted({n[:-len(SEGMENT_SUFFIX)] for n in os.listdir(path)
+                    if n.endswith(SEGMENT_SUFFIX) or n.endswith(SEGMENT_SUFFIX + ARCHIVE_SUFFIX)})
+    records, first_ts, last_ts = 0, None, None
+    for stem in stems:
+        ts_path = os.path.join(path, stem + TIMESTAMPS_SUFFIX)
+        try:
+            count = min(os.path.getsize(os.path.join(path, stem + OFFSETS_SUFFIX)), os.path.getsize(ts_path)) // 8
+        except OSError:
+            count = None
+        if count is None or (count == 0 and _segment_size(os.path.join(path, stem + SEGMENT_SUFFIX))):
+            return _summary(open_session(name, directory))  # Columns still to be rebuilt
+        if not count:
+            continue
+        with open(ts_path, "rb") as f:
+            if first_ts is None:
+                first_ts = array("d", f.read(8))[0]
+            f.seek((count - 1) * 8)
+            last_ts = array("d", f.read(8))[0]
+        records += count
+    return records, first_ts, last_ts
+
+
+def _segment_size(path):
+    if os.path.exists(path):
+        return os.path.getsize(path)
+    return ArchiveReader(path + ARCHIVE_SUFFIX).size if os.path.exists(path + ARCHIVE_SUFFIX) else 0
+
+
+def _summary(log):
+    return log.next_seq, log.first_ts(), log.last_ts()
+
+
+def open_session(name, directory=SESSIONS_DIR):
+    """Mapped, read-only log of a past session; the most recent few stay open.
+
+    Raises KeyError for unknown sessions.
+    """
+    path = os.path.join(directory, name)
+    if os.path.basename(name) != name or not os.path.isdir(path):
+        raise KeyError(name)
+    with _open_sessions_lock:
+        log = _open_sessions.get(name)
+        if log is None:
+            log = _open_sessions[name] = TranscriptLog(path)
+            while len(_open_sessions) > TRANSCRIPT_OPEN_SESSIONS:
+                _open_sessions.popitem(last=False)
+        _open_sessions.move_to_end(name)
+        return log
+
+
+def forget_session(name):
+    """Drop a past session's open log so the next open re-reads its files"""
+    with _open_sessions_lock:
+        _open_sessions.pop(name, None)
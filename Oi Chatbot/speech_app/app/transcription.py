@@ -1,28 +1,70 @@
-import io
-import time
 import numpy as np
-from scipy.io.wavfile import write
-from app.models import whisper_model
-from app.speaker import identify_speaker
+from app.models import whisper_model, get_fallback_whisper_model
+from app.batcher import WhisperBatcher
+from app.stitcher import TranscriptStitcher
+from app.config import SAMPLERATE, WHISPER_WORKER_PROCESSES
+from app.speaker import identify_speakers
 from app.writer import log_transcript
 
-def process_chunk(audio_frames, known_speakers):
-    start = time.time()
-    full_chunk = np.concatenate(audio_frames)
-
-    if np.mean(np.abs(full_chunk)) < 0.01:
-        return
-
-    wav_io = io.BytesIO()
-    write(wav_io, 16000, (full_chunk * 32767).astype(np.int16))
-    wav_io.seek(0)
-
-    try:
-        segments, _ = whisper_model.transcribe(wav_io, vad_filter=True)
-        for segment in segments:
-            text = segment.text.strip()
-            if text:
-                speaker = identify_speaker(audio_frames, known_speakers)
-                log_transcript(speaker, text)
-    except Exception as e:
-        print(f"[❌ Whisper Error] {e}")
+batcher = WhisperBatcher(whisper_model) if whisper_model is not None else None
+fallback_batcher = None
+worker_pool = None
+stitchers = {}
+
+def start_worker_pool(processes=WHISPER_WORKER_PROCESSES):
+    """Switch transcription to a pool of Whisper worker processes.
+
+    Must be called from under the `__main__` guard: the workers are spawned
+    and re-import the main module.
+    """
+    global worker_pool
+    from app.worker_pool import WhisperWorkerPool
+    if worker_pool is None:
+        worker_pool = WhisperWorkerPool(processes)
+    return worker_pool
+
+def _get_batcher(degraded):
+    global fallback_batcher
+    if not degraded:
+        return batcher
+    if fallback_batcher is None:
+        fallback_batcher = WhisperBatcher(get_fallback_whisper_model())
+    return fallback_batcher
+
+def transcribe_array(audio, stream=None, degraded=False, **options):
+    """Transcribe a 16 kHz mono float32 array in memory.
+
+    faster-whisper accepts arrays directly, so there is no WAV encode,
+    decode or resample and no float -> int16 -> float round trip. Calls
+    go through the shared batcher so concurrent streams share decodes;
+    `degraded` switches to the smaller fallback model.
+    """
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    if worker_pool is not None:
+        return worker_pool.transcribe(audio, degraded, **options)
+    return _get_batcher(degraded).transcribe(audio, stream, **options)
+
+def _get_stitcher(stream):
+    return stitchers.setdefault(stream, TranscriptStitcher())
+
+def transcribe_chunk(audio, start_sample=0, stream=None, degraded=False):
+    """Transcription stage: Whisper segments for one utterance (thread-safe)"""
+    # Silence never gets here, so Whisper's own VAD is skipped
+    return transcribe_array(audio, stream, degraded, vad_filter=False, word_timestamps=True,
+                            initial_prompt=_get_stitcher(stream).prompt())
+
+def commit_chunk(segments, audio, known_speakers, start_sample=0, stream=None, final=False):
+    """Commit stage: log only newly committed text; must run in capture order per stream.
+
+    Returns the number of samples consumed, i.e. where the next piece of a
+    force-split utterance should start.
+    """
+    stitcher = _get_stitcher(stream)
+    chunk_start = start_sample / SAMPLERATE
+    chunk_end = chunk_start + len(audio) / SAMPLERATE
+    committed, resume = stitcher.stitch(segments, chunk_start, chunk_end, final)
+    if committed:
+        spans = [(s.start - chunk_start, s.end - chunk_start) for s in committed]
+        for segment, speaker in zip(committed, identify_speakers(audio, spans, known_speakers)):
+            log_transcript(speaker, segment.text)
+    return max(1, round(resume * SAMPLERATE) - start_sample)
@@ -0,0 +1,189 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing import shared_memory
+import numpy as np
+from app.config import (SAMPLERATE, WHISPER_MODEL_SIZE, WHISPER_FALLBACK_MODEL, WHISPER_WORKER_PROCESSES,
+                        WHISPER_WORKER_SLOT_SECONDS, WHISPER_WORKER_TIMEOUT_SECONDS)
+
+# Plain, picklable stand-ins for faster-whisper's Segment / Word
+Segment = namedtuple("Segment", ["start", "end", "text", "words"])
+Word = namedtuple("Word", ["start", "end", "word"])
+
+
+def _worker_main(shm_name, n_slots, slot_samples, tasks, results, model_size, fallback_size, cpu_threads):
+    """Entry point of one transcription process; owns its own Whisper model(s)"""
+    import torch
+    from faster_whisper import WhisperModel
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    compute_type = "float16" if device == "cuda" else "int8"
+    models = {}
+
+    def get_model(degraded):
+        size = fallback_size if degraded else model_size
+        if size not in models:
+            models[size] = WhisperModel(size, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+        return models[size]
+
+    get_model(False)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray((n_slots, slot_samples), dtype=np.float32, buffer=shm.buf)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            job_id, slot, length, degraded, options = task
+            results.put(("start", job_id, os.getpid()))
+            try:
+                segments, _ = get_model(degraded).transcribe(slots[slot, :length], **options)
+                payload = [Segment(s.start, s.end, s.text,
+                                   [Word(w.start, w.end, w.word) for w in s.words] if s.words else None)
+                           for s in segments]
+                results.put(("done", job_id, payload))
+            except Exception as e:
+                results.put(("error", job_id, repr(e)))
+    finally:
+        del slots
+        shm.close()
+
+
+class WhisperWorkerPool:
+    """Runs Whisper in N separate processes so transcription uses all cores.
+
+    Audio is copied once into a shared-memory slot (one slot per in-flight
+    job, two per worker) and only the slot index crosses the process
+    boundary; segments come back on a result queue. When all slots are busy
+    `submit` blocks, which pushes back on the scheduler. Workers that die
+    are restarted and their in-flight job is failed; a job that times out
+    is failed and gives its slot back, and the worker stuck on it is
+    restarted.
+    """
+
+    def __init__(self, processes=WHISPER_WORKER_PROCESSES, model_size=WHISPER_MODEL_SIZE,
+                 fallback_size=WHISPER_FALLBACK_MODEL, slot_seconds=WHISPER_WORKER_SLOT_SECONDS,
+                 timeout=WHISPER_WORKER_TIMEOUT_SECONDS, samplerate=SAMPLERATE):
+        self.n_processes = max(1, processes)
+        self.model_size = model_size
+        self.fallback_size = fallback_size
+        self.timeout = timeout
+        self.slot_samples = int(slot_seconds * samplerate)
+        self.n_slots = 2 * self.n_processes
+        self.cpu_threads = max(1, (os.cpu_count() or 1) // self.n_processes)
+
+        self._ctx = mp.get_context("spawn")
+        self._shm = shared_memory.SharedMemory(create=True, size=self.n_slots * self.slot_samples * 4)
+        self._slots = np.ndarray((self.n_slots, self.slot_samples), dtype=np.float32, buffer=self._shm.buf)
+        self._free = queue.Queue()
+        for slot in range(self.n_slots):
+            self._free.put(slot)
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._pending = {}  # job_id -> (future, slot)
+        self._running = {}  # pid -> job_id
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = [self._spawn() for _ in range(self.n_processes)]
+        threading.Thread(target=self._collect, daemon=True).start()
+
+    def _spawn(self):
+        process = self._ctx.Process(
+            target=_worker_main, daemon=True,
+            args=(self._shm.name, self.n_slots, self.slot_samples, self._tasks, self._results,
+                  self.model_size, self.fallback_size, self.cpu_threads))
+        process.start()
+        return process
+
+    def submit(self, audio, degraded=False, **options):
+        """Queue one chunk; returns (job id, future of its segments)"""
+        if len(audio) > self.slot_samples:
+            raise ValueError(f"audio of {len(audio)} samples exceeds worker slot of {self.slot_samples}")
+        slot = self._free.get()
+        self._slots[slot, :len(audio)] = audio
+        future = Future()
+        job_id = next(self._ids)
+        with self._lock:
+            self._pending[job_id] = (future, slot)
+        self._tasks.put((job_id, slot, len(audio), degraded, options))
+        return job_id, future
+
+    def transcribe(self, audio, degraded=False, **options):
+        job_id, future = self.submit(audio, degraded, **options)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self._abandon(job_id)
+            return future.result()  # The timeout, unless the result landed meanwhile
+
+    def _abandon(self, job_id):
+        """Fail a timed-out job, restarting the worker stuck on it if one took it.
+
+        A job still queued keeps its task; the worker that takes it later
+        decodes whatever is in the reused slot and the result is dropped.
+        """
+        with self._lock:
+            stuck = next((p for p in self._workers if self._running.get(p.pid) == job_id), None)
+        if stuck is not None:
+            self._restart(stuck, "timed out")
+        self._finish(job_id, error="timeout")
+
+    def _finish(self, job_id, result=None, error=None):
+        with self._lock:
+            entry = self._pending.pop(job_id, None)
+        if entry is None:
+            return
+        future, slot = entry
+        self._free.put(slot)
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+    def _collect(self):
+        while not self._closed:
+            self._check_workers()
+            try:
+                kind, job_id, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if kind == "start":
+                with self._lock:
+                    self._running[payload] = job_id
+            elif kind == "done":
+                self._finish(job_id, result=payload)
+            else:
+                self._finish(job_id, error=payload)
+
+    def _check_workers(self):
+        for process in list(self._workers):
+            if not process.is_alive() and not self._closed:
+                self._restart(process, f"exited ({process.exitcode})")
+
+    def _restart(self, process, reason):
+        """Replace `process` (killing it if still running) and fail its in-flight job"""
+        with self._lock:
+            if process not in self._workers:
+                return  # Already replaced
+            self._workers[self._workers.index(process)] = self._spawn()
+            job_id = self._running.pop(process.pid, None)
+        print(f"[❌ Whisper Worker] pid {process.pid} {reason}, restarting")
+        if process.is_alive():
+            process.kill()
+        if job_id is not None:
+            self._finish(job_id, error=f"worker {process.pid} {reason}")
+
+    def close(self):
+        self._closed = True
+        for _ in self._workers:
+            self._tasks.put(None)
+        for process in self._workers:
+            process.join(timeout=5)
+        del self._slots
+        self._shm.close()
+        self._shm.unlink()
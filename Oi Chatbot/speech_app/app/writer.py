@@ -1,30 +1,108 @@
+import sys
 import threading
+import time
 from collections import deque
-from app.config import SPEAKER_TRANSCRIPT_PATH, PLAIN_TRANSCRIPT_PATH
+from datetime import datetime
+from app.config import SPEAKER_TRANSCRIPT_PATH, PLAIN_TRANSCRIPT_PATH, MAX_TRANSCRIPT_LINES, TIMESTAMP, TRANSCRIPT_READ_LIMIT
+from app.broadcaster import broadcaster
+from app.transcript_log import TranscriptLog, list_sessions, open_session
+from app.persistence import TranscriptPersister
+from app.search import index_live
 
-transcript_lines_speaker = deque(maxlen=10000)
-transcript_lines_plain = deque(maxlen=10000)
-write_buffer = []
+class TranscriptRecord:
+    """One transcript line, stored once and rendered for either view on demand"""
+    __slots__ = ("seq", "ts", "speaker", "text")
+
+    def __init__(self, seq, ts, speaker, text):
+        self.seq = seq
+        self.ts = ts  # Epoch seconds
+        self.speaker = sys.intern(speaker)  # A handful of labels shared by every line
+        self.text = text
+
+    @property
+    def clock(self):
+        return datetime.fromtimestamp(self.ts).strftime("%H:%M:%S")
+
+    @property
+    def line(self):
+        return f"[{self.clock}] {self.speaker}: {self.text}"
+
+    def as_dict(self):
+        """The record as TranscriptLog.read returns it"""
+        return {"seq": self.seq, "ts": self.ts, "speaker": self.speaker, "text": self.text}
+
+transcript_records = deque(maxlen=MAX_TRANSCRIPT_LINES)
 lock = threading.Lock()
+transcript_log = TranscriptLog()
+next_seq = transcript_log.next_seq  # Assigned under `lock`; the writer thread appends to the log in this order
+
+def rehydrate():
+    """Seed the in-memory window with the tail of the most recent earlier sessions.
+
+    Only the records that fit the window are read, straight from the mapped
+    session logs. They are renumbered below 0, so they come before, and
+    never collide with, this session's seqs.
+    """
+    restored = []
+    for name in reversed(list_sessions()):
+        want = transcript_records.maxlen - len(restored)
+        if want <= 0:
+            break
+        if name == TIMESTAMP:
+            continue
+        log = open_session(name)
+        start = max(0, log.next_seq - want)
+        restored[:0] = [(r["ts"], r["speaker"], r["text"]) for r in log.read(since_seq=start - 1, limit=want)]
+    restored = [TranscriptRecord(i - len(restored), *fields) for i, fields in enumerate(restored)]
+    with lock:
+        live = list(transcript_records)
+        transcript_records.clear()
+        transcript_records.extend(restored)
+        transcript_records.extend(live)  # Anything logged meanwhile stays newest
+    return len(restored)
+
+persister = TranscriptPersister(
+    (SPEAKER_TRANSCRIPT_PATH, PLAIN_TRANSCRIPT_PATH),
+    lambda record: (record.line, record.text),
+    log=transcript_log,
+    syncables=(transcript_log,),
+)
+
+def last_seq():
+    """Seq of the newest record, whether or not the log has it yet"""
+    return next_seq - 1
+
+def read_live(since_seq=None, from_ts=None, to_ts=None, limit=TRANSCRIPT_READ_LIMIT):
+    """transcript_log.read, completed with the newest records the writer
+    thread has not appended to the log yet (taken from the window)"""
+    logged = transcript_log.next_seq  # Before reading: records logged meanwhile come back from both
+    records = transcript_log.read(since_seq, from_ts, to_ts, limit)
+    if len(records) < limit:
+        after = max(records[-1]["seq"] if records else -1, since_seq if since_seq is not None else -1)
+        unlogged = []
+        with lock:
+            for record in reversed(transcript_records):
+                if record.seq < logged:
+                    break
+                unlogged.append(record)
+        records += [r.as_dict() for r in reversed(unlogged)
+                    if r.seq > after and (from_ts is None or r.ts >= from_ts) and (to_ts is None or r.ts < to_ts)
+                    ][:limit - len(records)]
+    return records
 
 def log_transcript(speaker, text):
-    from datetime import datetime
-    ts = datetime.now().strftime("%H:%M:%S")
-    line = f"[{ts}] {speaker}: {text}"
-    print(line)
+    global next_seq
+    now = time.time()
     with lock:
-        transcript_lines_speaker.append(line)
-        transcript_lines_plain.append(text)
-        write_buffer.append((line, text))
+        seq = next_seq
+        next_seq += 1
+        record = TranscriptRecord(seq, now, speaker, text)
+        transcript_records.append(record)
+        persister.append(record)  # Queued in seq order; no disk I/O under the lock
+    index_live(seq, now, record.speaker, text)
+    line = record.line
+    print(line)
+    broadcaster.publish({"seq": seq, "timestamp": record.clock, "speaker": record.speaker, "text": text, "line": line})
 
 def writer_thread():
-    import time
-    while True:
-        time.sleep(5)
-        with lock:
-            if write_buffer:
-                with open(SPEAKER_TRANSCRIPT_PATH, "a") as f1, open(PLAIN_TRANSCRIPT_PATH, "a") as f2:
-                    for s, p in write_buffer:
-                        f1.write(s + "\n")
-                        f2.write(p + "\n")
-                write_buffer.clear()
+    persister.run()
@@ -0,0 +1,77 @@
+"""Per-chunk cost of feeding Whisper a WAV buffer vs. the float32 array.
+
+Usage (from speech_app/):
+    python -m benchmarks.whisper_input [--model tiny] [--chunks 20] [--transcribe]
+
+Without --transcribe only the input preparation is timed: the old path
+(float -> int16, WAV write, faster-whisper decode/resample) against the
+direct array path. With --transcribe both inputs also go through a full
+`WhisperModel.transcribe` call so the end-to-end difference is visible.
+"""
+import argparse
+import io
+import time
+import numpy as np
+from scipy.io.wavfile import write
+from faster_whisper import WhisperModel, decode_audio
+
+SAMPLERATE = 16000
+CHUNK_SECONDS = 3
+
+
+def make_chunk(rng):
+    t = np.arange(CHUNK_SECONDS * SAMPLERATE) / SAMPLERATE
+    tone = 0.2 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 3 * t))
+    return (tone + 0.02 * rng.standard_normal(t.size)).astype(np.float32)
+
+
+def wav_input(chunk):
+    wav_io = io.BytesIO()
+    write(wav_io, SAMPLERATE, (chunk * 32767).astype(np.int16))
+    wav_io.seek(0)
+    return wav_io
+
+
+def array_input(chunk):
+    return np.ascontiguousarray(chunk, dtype=np.float32)
+
+
+def time_per_chunk(fn, chunks):
+    start = time.perf_counter()
+    for chunk in chunks:
+        fn(chunk)
+    return (time.perf_counter() - start) / len(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--transcribe", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    chunks = [make_chunk(rng) for _ in range(args.chunks)]
+
+    # decode_audio is what faster-whisper runs internally on non-array input
+    old_prep = time_per_chunk(lambda c: decode_audio(wav_input(c), sampling_rate=SAMPLERATE), chunks)
+    new_prep = time_per_chunk(array_input, chunks)
+    print(f"input prep  wav: {old_prep * 1000:8.3f} ms/chunk | array: {new_prep * 1000:8.3f} ms/chunk "
+          f"| saved {(old_prep - new_prep) * 1000:.3f} ms/chunk")
+
+    if args.transcribe:
+        model = WhisperModel(args.model, device="cpu", compute_type="int8")
+
+        def run(audio):
+            segments, _ = model.transcribe(audio, vad_filter=True)
+            list(segments)
+
+        run(array_input(chunks[0]))  # Warm-up
+        old_total = time_per_chunk(lambda c: run(wav_input(c)), chunks)
+        new_total = time_per_chunk(lambda c: run(array_input(c)), chunks)
+        print(f"transcribe  wav: {old_total * 1000:8.1f} ms/chunk | array: {new_total * 1000:8.1f} ms/chunk "
+              f"| saved {(old_total - new_total) * 1000:.1f} ms/chunk")
+
+
+if __name__ == "__main__":
+    main()
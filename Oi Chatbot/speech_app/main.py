@@ -1,18 +1,37 @@
 import threading
 import uvicorn
-from app.api import app
-from app.audio_input import start_stream
-from app.transcription import process_chunk
-from app.writer import writer_thread
-from app.performance import monitor
+from app.config import WHISPER_WORKER_PROCESSES
 
 known_speakers = {}
 
+# App imports stay inside functions: in worker-pool mode the Whisper worker
+# processes are spawned and re-import this module, and must not load the
+# server, capture or NLP models.
+
 def background_tasks():
+    from app.audio_input import start_stream
+    from app.transcription import transcribe_chunk, commit_chunk, start_worker_pool
+    from app.writer import writer_thread, rehydrate
+    from app.rotation import rotator
+    from app.performance import monitor
+    from app.scheduler import scheduler
+    from app.search import indexer
+
+    print(f"[📜 History] Restored {rehydrate()} transcript lines")
+    if WHISPER_WORKER_PROCESSES:
+        start_worker_pool(WHISPER_WORKER_PROCESSES)
     threading.Thread(target=writer_thread, daemon=True).start()
     threading.Thread(target=monitor, daemon=True).start()
-    threading.Thread(target=start_stream, args=(None, lambda audio: process_chunk(audio, known_speakers)), daemon=True).start()
+    threading.Thread(target=indexer.run, daemon=True).start()
+    threading.Thread(target=rotator.run, daemon=True).start()
+    scheduler.start(
+        lambda audio, start, stream, degraded: transcribe_chunk(audio, start, stream, degraded),
+        lambda segments, audio, start, final, stream: commit_chunk(segments, audio, known_speakers, start, stream, final),
+        workers=max(1, WHISPER_WORKER_PROCESSES),
+    )
+    threading.Thread(target=start_stream, args=(None, scheduler.submit), daemon=True).start()
 
 if __name__ == "__main__":
+    from app.api import app
     background_tasks()
     uvicorn.run(app, host="0.0.0.0", port=9575)
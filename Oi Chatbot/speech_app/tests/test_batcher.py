@@ -0,0 +1,53 @@
+import dataclasses
+import importlib
+import sys
+import types
+import numpy as np
+import pytest
+
+
+@dataclasses.dataclass
+class Segment:
+    start: float
+    end: float
+    text: str
+    words: list = None
+
+
+class StubPipeline:
+    """Answers one segment per clip, read back in seconds as faster-whisper >= 1.2 does"""
+    calls = []
+
+    def __init__(self, model):
+        self.model = model
+
+    def transcribe(self, audio, clip_timestamps, **options):
+        StubPipeline.calls.append((audio, clip_timestamps, options))
+        return [Segment(clip["start"] + 0.1, clip["end"] - 0.1, f"clip {i}")
+                for i, clip in enumerate(clip_timestamps)], None
+
+
+@pytest.fixture
+def batcher():
+    StubPipeline.calls = []
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setitem(sys.modules, "faster_whisper", types.SimpleNamespace(BatchedInferencePipeline=StubPipeline))
+        patch.delitem(sys.modules, "app.batcher", raising=False)
+        yield importlib.import_module("app.batcher")
+        sys.modules.pop("app.batcher", None)
+
+
+def test_batched_group_passes_clips_in_seconds(batcher):
+    from app.config import SAMPLERATE
+    whisper = batcher.WhisperBatcher(model=object())
+    group = [batcher._Request(np.zeros(2 * SAMPLERATE, dtype=np.float32), "a", {"initial_prompt": "hello"}),
+             batcher._Request(np.zeros(3 * SAMPLERATE, dtype=np.float32), "b", {"initial_prompt": "there"})]
+    whisper._execute(group)
+
+    (audio, clips, options), = StubPipeline.calls
+    assert len(audio) == 5 * SAMPLERATE
+    assert clips == [{"start": 0.0, "end": 2.0}, {"start": 2.0, "end": 5.0}]
+    assert "initial_prompt" not in options  # Differs between the streams
+    first, second = (request.future.result(timeout=0) for request in group)
+    assert [(s.text, s.start, s.end) for s in first] == [("clip 0", pytest.approx(0.1), pytest.approx(1.9))]
+    assert [(s.text, s.start, s.end) for s in second] == [("clip 1", pytest.approx(0.1), pytest.approx(2.9))]
@@ -0,0 +1,39 @@
+import importlib
+import sys
+import types
+import numpy as np
+import pytest
+
+resemblyzer = pytest.importorskip("resemblyzer")
+
+
+@pytest.fixture(scope="module")
+def speaker():
+    # The real voice encoder, without app.models also loading Whisper
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setitem(sys.modules, "app.models", types.SimpleNamespace(encoder=resemblyzer.VoiceEncoder("cpu")))
+        patch.delitem(sys.modules, "app.speaker", raising=False)
+        yield importlib.import_module("app.speaker")
+        sys.modules.pop("app.speaker", None)
+
+
+def voice(seconds, pitch, samplerate=16000):
+    """A harmonic tone with a syllable-rate envelope, loud enough to pass the silence check"""
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    tone = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+    return (0.1 * tone * envelope).astype(np.float32)
+
+
+def test_embed_spans_gives_one_unit_embedding_per_span(speaker):
+    audio = np.concatenate([voice(2.0, 120), voice(2.0, 220)])
+    embeddings = speaker.embed_spans(audio, [(0.0, 2.0), (2.0, 4.0)])
+    assert len(embeddings) == 2
+    for embedding in embeddings:
+        assert embedding.shape == (256,)
+        assert np.isfinite(embedding).all()
+        assert np.linalg.norm(embedding) == pytest.approx(1.0, abs=1e-4)
+
+
+def test_embed_spans_skips_silence(speaker):
+    assert speaker.embed_spans(np.zeros(32000, dtype=np.float32), [(0.0, 1.0), (1.0, 2.0)]) == [None, None]
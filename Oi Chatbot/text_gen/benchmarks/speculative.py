@@ -0,0 +1,87 @@
+"""Decode speed with and without speculative decoding on the chat model.
+
+Usage (from text_gen/):
+    python -m benchmarks.speculative [--runs 3] [--max-tokens 256] [--draft-tokens 10]
+
+Loads the model once per configuration (plain decoding, then prompt-lookup
+drafting) and answers the same conversation prompts with each, at
+temperature 0 so both produce the same text and only the speed differs.
+Reports completion tokens/s and, for the speculative run, how many drafted
+tokens were accepted and how many tokens each forward pass produced.
+"""
+import argparse
+import gc
+import time
+from modules import llm_engine
+from modules.conversation import SYSTEM_PROMPT
+from modules.llm_engine import Replica, GENERATION_PARAMS
+
+# Turns whose answers naturally quote the conversation, plus one that doesn't
+CONVERSATIONS = [
+    [
+        "User [neutral; intent: conversation]: My shopping list is eggs, whole milk, sourdough bread, two avocados, cherry tomatoes and dark chocolate.",
+        "AI: Got it: eggs, whole milk, sourdough bread, two avocados, cherry tomatoes and dark chocolate.",
+        "User [neutral; intent: summary]: Can you read my shopping list back to me as a numbered list?",
+    ],
+    [
+        "User [curiosity; intent: clarification]: What does this mean: \"The cache keeps the evaluated prompt prefix so later turns only evaluate the new tokens\"?",
+        "AI: It means the model remembers the work it already did on the start of the conversation.",
+        "User [confusion; intent: clarification]: Explain it again, quoting the sentence part by part.",
+    ],
+    [
+        "User [joy; intent: recommendation]: Suggest a name for a grey kitten who loves sleeping in shoe boxes.",
+    ],
+]
+
+
+def prompt_for(lines):
+    return SYSTEM_PROMPT + "\n" + "\n".join(lines) + "\nAI:"
+
+
+def run(replica, prompts, runs, params):
+    tokens, seconds = 0, 0.0
+    for _ in range(runs):
+        for prompt in prompts:
+            replica.llm.reset()  # Every run evaluates the prompt from scratch
+            start = time.perf_counter()
+            result = replica.llm(prompt, **params)
+            seconds += time.perf_counter() - start
+            tokens += result["usage"]["completion_tokens"]
+    return tokens, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--draft-tokens", type=int, default=llm_engine.SPECULATIVE_DRAFT_TOKENS)
+    args = parser.parse_args()
+
+    llm_engine.SPECULATIVE_DRAFT_TOKENS = args.draft_tokens
+    params = dict(GENERATION_PARAMS, max_tokens=args.max_tokens, temperature=0)
+    prompts = [prompt_for(lines) for lines in CONVERSATIONS]
+
+    results = {}
+    for mode in (None, "prompt_lookup"):
+        replica = Replica(0, speculative=mode)
+        replica.load()
+        run(replica, prompts[:1], 1, dict(params, max_tokens=8))  # Warm-up
+        draft = replica.draft
+        calls, proposed = (draft.calls, draft.proposed) if draft else (0, 0)
+        tokens, seconds = run(replica, prompts, args.runs, params)
+        results[mode] = tokens / seconds
+        line = f"{mode or 'baseline':>13}: {tokens / seconds:7.2f} tokens/s ({tokens} tokens in {seconds:.1f}s)"
+        if draft:
+            passes = len(prompts) * args.runs + draft.calls - calls
+            accepted = max(tokens - passes, 0)
+            line += (f" | accepted {accepted}/{draft.proposed - proposed} drafted tokens"
+                     f" | {tokens / passes:.2f} tokens/pass")
+        print(line)
+        del replica
+        gc.collect()  # Free the first model's KV cache before loading the second
+
+    print(f"speedup: {results['prompt_lookup'] / results[None]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,70 @@
 
 import asyncio
-from fastapi import FastAPI, HTTPException
+import json
+from contextlib import aclosing
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import requests
 from datetime import datetime
 import os
-from collections import deque
 
-from modules.llm_engine import generate_response, init_llm
+from modules.llm_engine import (
+    generate_response, stream_response, init_llm, count_tokens, summarize_turns, PROMPT_TOKEN_BUDGET, GENERATION_PARAMS,
+)
+from modules.conversation import Conversation
+from modules.inference import pool, INTERACTIVE, VOICE, BACKGROUND
+from modules.sessions import SessionStore, DEFAULT_SESSION
+from modules.response_cache import ResponseCache, HISTORY_WINDOW, normalize
 from modules.emotion import detect_emotions
 from modules.intent import classify_intent
 from modules.logger import log_to_file
 
 # === CONFIG ===
-TRANSCRIPT_API = "http://localhost:9575/transcript?mode=plain"
+TRANSCRIPT_API = "http://localhost:9575/transcript/delta"
 TRANSCRIPT_DIR = "/mnt/d/Data_Files/Transcripts"
 os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
 timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 ai_conversation_path = os.path.join(TRANSCRIPT_DIR, f"ai_responses_{timestamp_str}.txt")
+SESSION_SPILL_DIR = "/mnt/d/Data_Files/Sessions"
 
 # === STATE ===
-chat_history = deque(maxlen=50)
-last_seen_line = ""
-mode = "text"
+def new_conversation():
+    conversation = Conversation(count_tokens, None, PROMPT_TOKEN_BUDGET)
+    # Compaction runs on the conversation's own replica, whose KV it invalidates anyway
+    conversation.summarize = lambda summary, lines: pool.run_threadsafe(
+        BACKGROUND, summarize_turns, summary, lines, conversation=conversation)
+    return conversation
+
+# Clients pick their session with an X-Session-ID header; without one they share "default"
+sessions = SessionStore(SESSION_SPILL_DIR, new_conversation)
+response_cache = ResponseCache()
 
 app = FastAPI()
 
+def fetch_latest_transcript(session):
+    """Newest transcript line past the session's cursor, or None if nothing new"""
+    headers = {"If-None-Match": session.transcript_etag} if session.transcript_etag else {}
+    res = requests.get(TRANSCRIPT_API, params={"since_seq": session.transcript_cursor, "mode": "plain"}, headers=headers, timeout=2)
+    if res.status_code == 304:
+        return None
+    delta = res.json()
+    if delta["session"] != session.transcript_session:
+        session.transcript_session = delta["session"]
+        if session.transcript_cursor >= 0:  # STT restarted; our cursor belongs to the old session
+            session.transcript_cursor, session.transcript_etag = -1, None
+            return fetch_latest_transcript(session)
+    session.transcript_cursor = delta["last_seq"]
+    session.transcript_etag = res.headers.get("ETag")
+    entries = delta["entries"]
+    return entries[-1]["text"] if entries else None
+
+async def acquire_session(session_id):
+    try:
+        return await sessions.acquire(session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/")
 async def root():
     return {"message": "AI Assistant is running! Use /respond for interaction."}
@@ -34,60 +73,165 @@ async def root():
 async def favicon():
     return {"message": "No favicon available."}
 
+@app.get("/status")
+async def status():
+    return {"llm": pool.stats(), "sessions": sessions.stats(), "response_cache": response_cache.stats()}
+
 class UserInput(BaseModel):
     input: str
 
 @app.post("/toggle_mode")
-async def toggle_mode():
-    global mode
-    mode = "voice" if mode == "text" else "text"
-    return {"mode": mode}
+async def toggle_mode(x_session_id: str = Header(DEFAULT_SESSION)):
+    session = await acquire_session(x_session_id)
+    session.mode = "voice" if session.mode == "text" else "text"
+    sessions.release(session)
+    return {"mode": session.mode}
+
+async def resolve_input(data, session):
+    """The text to answer: the typed input, or in voice mode the newest transcript line (None if none)"""
+    if session.mode != "voice":
+        return data.input
+    try:
+        return await asyncio.to_thread(fetch_latest_transcript, session)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Transcript fetch error: {str(e)}")
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def format_reply(result):
+    return f"(Detected Emotion: {result['emotion']})\n{result['response']}"
+
+def cache_key(user_input, conversation):
+    return response_cache.key(user_input, conversation.window(HISTORY_WINDOW), GENERATION_PARAMS)
+
+def record_turn(conversation, user_input, result):
+    conversation.add_user(user_input, result["emotion"], result["intent"])
+    conversation.add_ai(result["response"])
+
+async def settle_turn(session, user_input, result, source):
+    """Bring the session's history in line with a (possibly cached) reply.
+
+    A reply generated for this very session is already in its history (the
+    caller is a retry of a turn that finished or is finishing); anyone else's
+    is appended, reusing its emotion and intent. Either way the reply is
+    also cached under the post-turn history, so a retry arriving after the
+    turn finished gets it back instead of a new turn.
+    """
+    conversation = session.conversation
+    if result["session"] != session.id:
+        await asyncio.to_thread(record_turn, conversation, user_input, result)
+    if source != "hit":
+        response_cache.put(cache_key(user_input, conversation), dict(result, session=session.id))
+
+async def answer(session, user_input, priority):
+    """Reply to `user_input` in the session, served from the response cache when possible.
+
+    A repeat of a turn still generating in the same session shares it; its
+    history key no longer matches once that turn added the user line.
+    """
+    key = cache_key(user_input, session.conversation)
+
+    async def generate():
+        result = await pool.run(priority, generate_response, user_input, session.conversation,
+                                conversation=session.conversation)
+        return dict(result, session=session.id)
+
+    result, source = await response_cache.get_or_generate(key, generate,
+                                                          inflight_key=(session.id, normalize(user_input)))
+    await settle_turn(session, user_input, result, source)
+    return result
 
 @app.post("/respond")
-async def respond_to_input(data: UserInput):
-    global last_seen_line
-    user_input = data.input
-
-    if mode == "voice":
-        try:
-            res = requests.get(TRANSCRIPT_API, timeout=2)
-            lines = res.json()
-            if lines and lines[-1] != last_seen_line:
-                last_seen_line = lines[-1]
-                user_input = last_seen_line.split("] ", 1)[-1]
-            else:
-                return {"response": None}
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Transcript fetch error: {str(e)}")
-
-    ai_response = generate_response(user_input, chat_history)
+async def respond_to_input(data: UserInput, x_session_id: str = Header(DEFAULT_SESSION)):
+    session = await acquire_session(x_session_id)
+    try:
+        user_input = await resolve_input(data, session)
+        if not user_input:
+            return {"response": None}
+
+        ai_response = format_reply(await answer(session, user_input, INTERACTIVE))
+    finally:
+        sessions.release(session)
     log_to_file(user_input, ai_response, ai_conversation_path)
     return {"response": ai_response}
 
-async def poll_transcript():
-    global last_seen_line
-    while True:
+@app.post("/respond/stream")
+async def respond_stream(data: UserInput, x_session_id: str = Header(DEFAULT_SESSION)):
+    """Same as /respond, but streamed as Server-Sent Events: a `token` event per
+    decoded token, then one `done` event with the full response, emotion,
+    intent and timings."""
+    session = await acquire_session(x_session_id)
+    try:
+        user_input = await resolve_input(data, session)
+    except HTTPException:
+        sessions.release(session)
+        raise
+    # Keyed on the history before this turn, which the stream itself extends
+    key = cache_key(user_input, session.conversation) if user_input else None
+
+    async def events():
         try:
-            if mode == "voice":
-                res = requests.get(TRANSCRIPT_API, timeout=2)
-                lines = res.json()
-
-                if lines and lines[-1] != last_seen_line:
-                    last_seen_line = lines[-1]
-                    user_input = last_seen_line.split("] ", 1)[-1]
-                    ai_response = generate_response(user_input, chat_history)
-                    log_to_file(user_input, ai_response, ai_conversation_path)
-                    print(f"\n👤 {user_input}\n🤖 {ai_response}\n")
-        except Exception as e:
-            print(f"[❌ Transcript Error] {e}")
+            if not user_input:
+                yield sse("done", {"response": None})
+                return
+            cached = response_cache.get(key)
+            if cached is not None:  # Finished replies only; identical streams in flight are not shared
+                await settle_turn(session, user_input, cached, "hit")
+                log_to_file(user_input, format_reply(cached), ai_conversation_path)
+                yield sse("token", {"text": cached["response"]})
+                yield sse("done", {"response": cached["response"], "emotion": cached["emotion"],
+                                   "intent": cached["intent"], "cached": True})
+                return
+            stream = pool.stream(INTERACTIVE, stream_response, user_input, session.conversation,
+                                 conversation=session.conversation)
+            async with aclosing(stream):
+                async for event, payload in stream:
+                    if event == "token":
+                        yield sse("token", {"text": payload})
+                    else:
+                        result = {"response": payload["response"], "emotion": payload["emotion"],
+                                  "intent": payload["intent"], "session": session.id}
+                        response_cache.put(key, result)
+                        await settle_turn(session, user_input, result, "generated")
+                        log_to_file(user_input, format_reply(result), ai_conversation_path)
+                        yield sse("done", payload)
+        finally:
+            sessions.release(session)
+
+    # Decoding runs on the inference worker; a client disconnect closes the generator and cancels it
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def answer_transcript(session):
+    try:
+        latest = await asyncio.to_thread(fetch_latest_transcript, session)
+        if latest:
+            user_input = latest
+            ai_response = format_reply(await answer(session, user_input, VOICE))
+            log_to_file(user_input, ai_response, ai_conversation_path)
+            print(f"\n👤 [{session.id}] {user_input}\n🤖 {ai_response}\n")
+    except Exception as e:
+        print(f"[❌ Transcript Error] {e}")
+    finally:
+        sessions.release(session)
 
+async def poll_transcript():
+    """Answer new transcript lines for every resident session in voice mode"""
+    while True:
+        # Held until answered, so none is spilled meanwhile
+        voice = await sessions.acquire_resident(lambda s: s.mode == "voice")
+        await asyncio.gather(*(answer_transcript(s) for s in voice))
         await asyncio.sleep(1)
 
 @app.on_event("startup")
 async def startup_event():
-    init_llm()
+    await pool.start(init_llm())
     asyncio.create_task(poll_transcript())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await sessions.spill_all()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8989, log_level="info")
@@ -0,0 +1,162 @@
+import threading
+
+COMPACT_AT = 0.75  # Fold old turns into the summary once history reaches this share of the budget...
+COMPACT_TO = 0.4  # ...keeping the newest turns up to this share verbatim
+
+SYSTEM_PROMPT = """### Instruction:
+You are a helpful, emotionally intelligent AI assistant. Each user turn is tagged with the user's detected emotion(s) and intent; adjust your tone to fit them.
+"""
+
+class Conversation:
+    """Token-budgeted chat context with a running summary of older turns.
+
+    Every line is counted with the model's tokenizer (`count_tokens`) once,
+    when added. When the prompt reaches COMPACT_AT of `budget`, the oldest
+    lines are handed to `summarize(summary, lines)` on a background thread;
+    they stay in the prompt until the new summary replaces them in a single
+    step. If the prompt would pass `budget` before that, they are dropped
+    right away (and still land in the summary), so the prompt never
+    overflows the context whatever the turn lengths.
+
+    The layout keeps llama.cpp's KV prefix valid between compactions: the
+    instruction and summary come first and only change when a compaction
+    lands, per-turn emotion/intent tags sit on the user's own line, and the
+    reply is stored exactly as it follows the "AI:" cue.
+    """
+
+    def __init__(self, count_tokens, summarize, budget):
+        self.count_tokens = count_tokens
+        self.summarize = summarize
+        self.budget = budget
+        self.lines = []  # [text, tokens]
+        self.summary = ""
+        self.kv_state = None  # Saved llama.cpp state while another conversation holds the model
+        self.replica = None  # Replica that last ran this conversation (see InferencePool)
+        self.compactions = 0
+        self._fixed_tokens = None
+        self._compacting = False  # A summarize call is running
+        self._pending = 0  # Oldest lines still in the prompt that it covers
+        self._backlog = []  # Lines dropped for the budget that no summary covers yet
+        self._lock = threading.Lock()
+
+    def _header(self):
+        if not self.summary:
+            return SYSTEM_PROMPT
+        return f"{SYSTEM_PROMPT}Summary of the earlier conversation: {self.summary}\n"
+
+    def _total(self):
+        if self._fixed_tokens is None:
+            self._fixed_tokens = self.count_tokens(self._header() + "\nAI:")
+        return self._fixed_tokens + sum(tokens for _, tokens in self.lines)
+
+    def _append(self, line):
+        tokens = self.count_tokens(line + "\n")
+        limit = int(self.budget * COMPACT_TO)
+        if tokens > limit:  # A single huge turn: keep its head
+            line = line[:len(line) * limit // tokens]
+            tokens = self.count_tokens(line + "\n")
+        with self._lock:
+            self.lines.append([line, tokens])
+            self._enforce()
+
+    def add_user(self, text, emotion_str, intent):
+        self._append(f"User [{emotion_str}; intent: {intent}]: {text}")
+
+    def add_ai(self, text):
+        self._append(f"AI: {text}")
+
+    def prompt(self):
+        with self._lock:
+            return self._header() + "\n" + "\n".join(line for line, _ in self.lines) + "\nAI:"
+
+    def window(self, n):
+        """The last `n` lines, part of a cached response's key"""
+        with self._lock:
+            return tuple(line for line, _ in self.lines[-n:])
+
+    def prompt_tokens(self):
+        with self._lock:
+            return self._total()
+
+    @property
+    def compacting(self):
+        return self._compacting
+
+    def nbytes(self):
+        """Approximate resident size: text plus any parked KV state"""
+        size = sum(len(line) for line, _ in self.lines) + len(self.summary)
+        if self.kv_state is not None:
+            size += self.kv_state.llama_state_size + self.kv_state.input_ids.nbytes + self.kv_state.scores.nbytes
+        return size
+
+    def snapshot(self):
+        """Picklable state, KV included (see SessionStore)"""
+        with self._lock:
+            return {"lines": [list(entry) for entry in self.lines], "summary": self.summary,
+                    "backlog": list(self._backlog), "kv_state": self.kv_state}
+
+    def restore(self, state):
+        with self._lock:
+            self.lines = state["lines"]
+            self.summary = state["summary"]
+            self._backlog = state["backlog"]
+            self.kv_state = state["kv_state"]
+            self._fixed_tokens = None
+
+    def _turn_start(self, count):
+        """`count` moved forward to the next user line, so whole turns are folded"""
+        while count < len(self.lines) - 1 and not self.lines[count][0].startswith("User"):
+            count += 1
+        return count
+
+    def _enforce(self):
+        total = self._total()
+        if total > self.budget:
+            # Hard limit: drop the oldest turns now, pending ones first
+            while (total > self.budget * COMPACT_TO or not self.lines[0][0].startswith("User")) and len(self.lines) > 1:
+                line, tokens = self.lines.pop(0)
+                total -= tokens
+                if self._pending:
+                    self._pending -= 1
+                else:
+                    self._backlog.append(line)
+        if self._compacting:
+            return  # Checked again when it lands, against the new summary
+        if total > self.budget * COMPACT_AT:
+            keep, count = total, 0
+            while keep > self.budget * COMPACT_TO and count < len(self.lines) - 1:
+                keep -= self.lines[count][1]
+                count += 1
+            count = self._turn_start(count)
+            if count:
+                self._start_compaction(count)
+        elif self._backlog:
+            self._start_compaction(0)
+
+    def _start_compaction(self, count):
+        self._compacting = True
+        self._pending = count
+        lines = self._backlog + [line for line, _ in self.lines[:count]]
+        self._backlog = []
+        threading.Thread(target=self._compact, args=(self.summary, lines), daemon=True).start()
+
+    def _compact(self, summary, lines):
+        try:
+            new_summary = self.summarize(summary, lines).strip()
+        except Exception as e:
+            print(f"[❌ Compaction Error] {e}")
+            with self._lock:
+                # Lines still in the prompt are its last `_pending`; the rest were dropped for the budget
+                self._backlog[:0] = lines[:len(lines) - self._pending]
+                self._pending = 0
+                self._compacting = False
+            return
+        with self._lock:
+            # Swap summary and folded lines together: one prefix change per compaction
+            del self.lines[:self._pending]
+            self._pending = 0
+            self._compacting = False
+            self.summary = new_summary
+            self._fixed_tokens = None
+            self.compactions += 1
+            self._enforce()  # Lines dropped or added meanwhile fold into the new summary
@@ -0,0 +1,203 @@
+import asyncio
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, closing
+
+# Job priorities, lowest first
+INTERACTIVE = 0  # A client waiting on /respond
+VOICE = 1  # Turns picked up from the transcript poll
+BACKGROUND = 2  # Context compaction
+
+AFFINITY_SLACK = 1  # Extra jobs a conversation's own replica may have before it moves
+
+_END = object()
+
+class Job:
+    __slots__ = ("priority", "seq", "fn", "args", "future", "cancelled")
+
+    def __init__(self, priority, seq, fn, args, future):
+        self.priority = priority
+        self.seq = seq
+        self.fn = fn
+        self.args = args
+        self.future = future
+        self.cancelled = threading.Event()  # Checked by the model code between tokens
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def cancel(self):
+        self.cancelled.set()
+
+class InferenceWorker:
+    """Runs every call on one replica on a dedicated thread, fed by an asyncio priority queue.
+
+    Callers on the event loop `await worker.run(...)` or iterate
+    `worker.stream(...)` without ever blocking it, so health checks and mode
+    toggles answer during a long decode. Jobs run one at a time, highest
+    priority first (FIFO within a priority); each is called as
+    `fn(replica, *args, cancelled=event)`. A job whose caller went away is
+    skipped if still queued, or stops at its next token if already running.
+    """
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.loop = None
+        self.queue = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"llm-{replica.index}")
+        self._seq = itertools.count()
+        self.running = None
+        self._stats = {"completed": 0, "cancelled": 0, "failed": 0}
+
+    async def start(self):
+        """Load the replica on the worker thread, then consume the queue; call from the event loop"""
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.PriorityQueue()
+        await self.loop.run_in_executor(self._executor, self.replica.load)
+        self.loop.create_task(self._consume())
+
+    def load(self):
+        """Queued plus running jobs"""
+        return self.queue.qsize() + (self.running is not None)
+
+    def stats(self):
+        return dict(self._stats, queued=self.queue.qsize() if self.queue else 0,
+                    running=self.running.priority if self.running else None)
+
+    async def _consume(self):
+        while True:
+            job = await self.queue.get()
+            if job.cancelled.is_set():
+                self._stats["cancelled"] += 1
+                continue
+            self.running = job
+            try:
+                result = await self.loop.run_in_executor(
+                    self._executor, lambda: job.fn(self.replica, *job.args, cancelled=job.cancelled))
+            except Exception as e:
+                self._stats["failed"] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self._stats["cancelled" if job.cancelled.is_set() else "completed"] += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.running = None
+
+    def submit(self, priority, fn, *args):
+        """Queue `fn(replica, *args)`; the returned Job's future resolves with its result"""
+        job = Job(priority, next(self._seq), fn, args, self.loop.create_future())
+        # Cancelling the awaiting task cancels the future, and with it the job
+        job.future.add_done_callback(lambda f: f.cancelled() and job.cancel())
+        self.queue.put_nowait(job)
+        return job
+
+    async def run(self, priority, fn, *args):
+        return await self.submit(priority, fn, *args).future
+
+    async def stream(self, priority, fn, *args):
+        """Async iterator over what the generator `fn(replica, *args)` yields on the worker.
+
+        Closing the iterator early (e.g. the client disconnected) cancels the job.
+        """
+        items = asyncio.Queue()
+        put = lambda item: self.loop.call_soon_threadsafe(items.put_nowait, item)
+
+        def drain(*args, cancelled):
+            try:
+                with closing(fn(*args, cancelled=cancelled)) as produced:
+                    for item in produced:
+                        put(item)
+            finally:
+                put(_END)
+
+        job = self.submit(priority, drain, *args)
+        try:
+            while True:
+                item = await items.get()  # `drain` always ends with _END, even when `fn` fails
+                if item is _END:
+                    break
+                yield item
+            await job.future  # Re-raises a failure inside `fn`
+        finally:
+            job.cancel()
+
+class InferencePool:
+    """One InferenceWorker per llm_engine replica, with least-loaded routing.
+
+    A conversation goes back to the replica that last ran it, where its
+    tokens are probably still in the KV cache, unless that replica has more
+    than AFFINITY_SLACK jobs over the least loaded one; while it has a job in
+    flight it always does, so its turns never run concurrently.
+    """
+
+    def __init__(self):
+        self.workers = []
+        self.loop = None
+        self._inflight = {}  # id(conversation) -> (worker, jobs)
+
+    async def start(self, replicas):
+        self.loop = asyncio.get_running_loop()
+        self.workers = [InferenceWorker(replica) for replica in replicas]
+        await asyncio.gather(*(worker.start() for worker in self.workers))
+
+    def _pick(self, conversation):
+        best = min(self.workers, key=InferenceWorker.load)
+        if conversation is None:
+            return best
+        inflight = self._inflight.get(id(conversation))
+        if inflight is not None:
+            return inflight[0]
+        if conversation.replica is not None:
+            home = self.workers[conversation.replica]
+            if home.load() <= best.load() + AFFINITY_SLACK:
+                return home
+        return best
+
+    def _enter(self, conversation):
+        worker = self._pick(conversation)
+        if conversation is not None:
+            jobs = self._inflight.get(id(conversation), (worker, 0))[1]
+            self._inflight[id(conversation)] = (worker, jobs + 1)
+            conversation.replica = worker.replica.index
+        return worker
+
+    def _exit(self, conversation):
+        if conversation is not None:
+            worker, jobs = self._inflight[id(conversation)]
+            if jobs == 1:
+                del self._inflight[id(conversation)]
+            else:
+                self._inflight[id(conversation)] = (worker, jobs - 1)
+
+    async def run(self, priority, fn, *args, conversation=None):
+        """`fn(replica, *args)` on the replica chosen for `conversation`"""
+        worker = self._enter(conversation)
+        try:
+            return await worker.run(priority, fn, *args)
+        finally:
+            self._exit(conversation)
+
+    def run_threadsafe(self, priority, fn, *args, conversation=None):
+        """Blocking form of `run` for threads other than the event loop"""
+        return asyncio.run_coroutine_threadsafe(
+            self.run(priority, fn, *args, conversation=conversation), self.loop).result()
+
+    async def stream(self, priority, fn, *args, conversation=None):
+        worker = self._enter(conversation)
+        try:
+            # Closed here rather than whenever it is collected, so the job is cancelled now
+            async with aclosing(worker.stream(priority, fn, *args)) as items:
+                async for item in items:
+                    yield item
+        finally:
+            self._exit(conversation)
+
+    def stats(self):
+        return {"replicas": [dict(worker.stats(), replica=worker.replica.index, cores=worker.replica.cores,
+                                  **worker.replica.stats())
+                             for worker in self.workers]}
+
+pool = InferencePool()
@@ -1,40 +1,274 @@
+import os
+import time
+from contextlib import closing
 from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
 
-llm = None
-
-def init_llm():
-    global llm
-    print("🔄 Loading LLM...")
-    MODEL_PATH = "/mnt/d/WSL/Ubuntu/TheBloke/Mistral-7B-Instruct-v0.1-GGUF/mistral-7b-instruct-v0.1.Q4_K_S.gguf"
-    llm = Llama(
-        model_path=MODEL_PATH,
-        n_gpu_layers=32,
-        n_ctx=8192,
-        n_batch=64,
-        use_mmap=True,
-        use_mlock=True
-    )
-    print("✅ LLM loaded.")
-
-def generate_response(user_input, chat_history):
+MODEL_PATH = "/mnt/d/WSL/Ubuntu/TheBloke/Mistral-7B-Instruct-v0.1-GGUF/mistral-7b-instruct-v0.1.Q4_K_S.gguf"
+N_CTX = 8192
+
+# Replica pool: LLM_REPLICAS > 1 loads that many CPU-only copies of the model,
+# each pinned to its own share of the cores (the mmapped weights are shared,
+# only the KV caches are per replica). 1 keeps the single GPU-offloaded model.
+LLM_REPLICAS = 1
+
+# Speculative decoding (opt-in): "prompt_lookup" drafts the next tokens by
+# matching the latest n-gram against everything already in the context, which
+# pays off when replies quote the conversation; None decodes one token per
+# pass. Drafting needs logits for every position, which adds n_vocab floats
+# per token to each replica's buffers and to every parked KV state.
+SPECULATIVE = None
+SPECULATIVE_DRAFT_TOKENS = 10
+SPECULATIVE_NGRAM = 2
+
+replicas = []
+
+class DraftCounter(LlamaDraftModel):
+    """Counts what a draft model proposes; llama.cpp verifies each draft in one forward pass"""
+
+    def __init__(self, draft):
+        self.draft = draft
+        self.calls = 0
+        self.proposed = 0
+
+    def __call__(self, input_ids, /, **kwargs):
+        tokens = self.draft(input_ids, **kwargs)
+        self.calls += 1
+        self.proposed += len(tokens)
+        return tokens
+
+def make_draft_model(mode):
+    if mode is None:
+        return None
+    if mode == "prompt_lookup":
+        return DraftCounter(LlamaPromptLookupDecoding(max_ngram_size=SPECULATIVE_NGRAM,
+                                                      num_pred_tokens=SPECULATIVE_DRAFT_TOKENS))
+    raise ValueError(f"Unknown speculative decoding mode: {mode!r}")
+
+class Replica:
+    """One loaded model and the conversation whose tokens are in its KV cache.
+
+    Each replica is driven by exactly one inference worker thread
+    (modules/inference.py); `load` runs on that thread, so the core pinning
+    applies to it and to the threads llama.cpp starts from it.
+    """
+
+    def __init__(self, index, cores=None, speculative=SPECULATIVE):
+        self.index = index
+        self.cores = cores
+        self.llm = None
+        self.kv_owner = None
+        self.draft = make_draft_model(speculative)
+        self.speculative = {"tokens": 0, "passes": 0, "proposed": 0, "accepted": 0}
+
+    def load(self):
+        if self.cores:
+            os.sched_setaffinity(0, self.cores)  # 0 = the calling thread
+        where = f" on cores {self.cores[0]}-{self.cores[-1]}" if self.cores else ""
+        print(f"🔄 Loading LLM replica {self.index}{where}...")
+        self.llm = Llama(
+            model_path=MODEL_PATH,
+            n_gpu_layers=0 if self.cores else 32,
+            n_ctx=N_CTX,
+            n_batch=64,
+            n_threads=len(self.cores) if self.cores else None,
+            n_threads_batch=len(self.cores) if self.cores else None,  # Prefill defaults to every core
+            use_mmap=True,
+            use_mlock=True,
+            logits_all=self.draft is not None,  # Drafts are verified against every position's logits
+            draft_model=self.draft
+        )
+        print(f"✅ LLM replica {self.index} loaded.")
+
+    def stats(self):
+        if self.draft is None:
+            return {}
+        totals = self.speculative
+        return {"speculative": dict(
+            totals,
+            acceptance_rate=round(totals["accepted"] / totals["proposed"], 3) if totals["proposed"] else None,
+            tokens_per_pass=round(totals["tokens"] / totals["passes"], 2) if totals["passes"] else None,
+        )}
+
+def partition_cores(count):
+    """Split the cores this process may use into `count` disjoint, contiguous sets"""
+    cores = sorted(os.sched_getaffinity(0))
+    if count > len(cores):
+        raise ValueError(f"{count} replicas need at least as many cores, have {len(cores)}")
+    size = len(cores) // count
+    return [cores[i * size:(i + 1) * size] for i in range(count)]
+
+def init_llm(count=LLM_REPLICAS):
+    """Create the replicas; each is loaded by its worker (see InferenceWorker.start)"""
+    replicas[:] = [Replica(0)] if count == 1 else [Replica(i, cores) for i, cores in enumerate(partition_cores(count))]
+    return replicas
+
+GENERATION_PARAMS = dict(max_tokens=512, temperature=0.55, top_p=0.7, repeat_penalty=1.1)
+SUMMARY_PARAMS = dict(max_tokens=256, temperature=0.2, top_p=0.9)
+PROMPT_TOKEN_BUDGET = N_CTX - GENERATION_PARAMS["max_tokens"] - 128  # Headroom for tokenizer drift between lines
+
+SUMMARY_PROMPT = """### Instruction:
+Update the running summary of a conversation between a user and an AI assistant with the new lines below. Keep names, facts, decisions, open questions and how the user has been feeling. Reply with the updated summary only, in under 150 words.
+
+Current summary: {summary}
+
+New lines:
+{lines}
+
+Updated summary:"""
+
+# Everything below taking a `replica` runs on that replica's worker thread,
+# which owns its model; count_tokens and is_live only read and are safe anywhere.
+
+def count_tokens(text):
+    return len(replicas[0].llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+def is_live(conversation):
+    """Whether some replica holds `conversation`'s tokens in its KV cache"""
+    return any(replica.kv_owner is conversation for replica in replicas)
+
+def _activate(replica, conversation):
+    """Give `conversation` the replica's KV cache, parking the previous owner's state.
+
+    Within one conversation llama.cpp reuses the longest common token prefix
+    with what it evaluated last, so nothing is saved or restored; a
+    save/load only happens when another conversation took the model. A
+    conversation that moved replicas just re-evaluates what differs; the
+    replica it left no longer counts as holding it, so that one's cache is
+    never parked over the conversation's newer state.
+    """
+    owner = replica.kv_owner  # Read once: other replicas' threads may clear it
+    if owner is conversation:
+        return
+    if owner is not None:
+        owner.kv_state = replica.llm.save_state()
+    if conversation.kv_state is not None:
+        replica.llm.load_state(conversation.kv_state)
+        conversation.kv_state = None
+    for other in replicas:
+        if other is not replica and other.kv_owner is conversation:
+            other.kv_owner = None
+    replica.kv_owner = conversation
+
+def summarize_turns(replica, summary, lines, cancelled=None):
+    """Fold `lines` into `summary` for a Conversation's compaction"""
+    prompt = SUMMARY_PROMPT.format(summary=summary or "(none yet)", lines="\n".join(lines))
+    owner = replica.kv_owner
+    if owner is not None:  # The summary overwrites the KV cache
+        owner.kv_state = replica.llm.save_state()
+        replica.kv_owner = None
+    started = time.perf_counter()
+    result = replica.llm(prompt, **SUMMARY_PARAMS)
+    print(f"[🗜️ Context] Folded {len(lines)} lines into the summary in {time.perf_counter() - started:.1f}s")
+    return result["choices"][0]["text"]
+
+def _prefix_stats(replica, prompt):
+    """(prompt tokens, tokens whose KV is already evaluated)"""
+    tokens = replica.llm.tokenize(prompt.encode("utf-8"))
+    return len(tokens), Llama.longest_token_prefix(replica.llm._input_ids.tolist(), tokens)
+
+def _prepare(user_input, conversation):
     from modules.emotion import detect_emotions
     from modules.intent import classify_intent
 
     emotions = detect_emotions(user_input)
     emotion_str = ", ".join(emotions)
     intent = classify_intent(user_input)
+    conversation.add_user(user_input, emotion_str, intent)
+    return conversation.prompt(), emotion_str, intent
+
+def _start(replica, prompt, conversation):
+    """Hand the model to `conversation`; returns (prompt tokens, cached prompt tokens)"""
+    _activate(replica, conversation)
+    prompt_tokens, cached = _prefix_stats(replica, prompt)
+    print(f"[⚡ KV Cache] Replica {replica.index} reused {cached}/{prompt_tokens} prompt tokens")
+    return prompt_tokens, cached
+
+def _reply_tokens(replica, prompt, reply):
+    """Tokens decoded for `reply`, counted as it extends the prompt.
+
+    Stream chunks can hold several tokens (held back for stop strings or
+    split UTF-8), so chunks are not counted.
+    """
+    return (len(replica.llm.tokenize((prompt + reply).encode("utf-8")))
+            - len(replica.llm.tokenize(prompt.encode("utf-8"))))
 
-    chat_history.append(f"User: {user_input}")
-    history_text = "\n".join(chat_history)
+def _decode(replica, prompt, cancelled, stats=None):
+    """Yield response pieces as llama.cpp decodes, stopping early once `cancelled` is set.
 
-    prompt = f"""### Instruction:
-You are a helpful, emotionally intelligent AI assistant. Adjust your tone to fit the user's emotion(s): {emotion_str}.
-Recognized user intent: {intent}.
+    `stats` receives the response's "tokens" and, with speculative decoding,
+    its draft counts under "speculative".
+    """
+    first = True
+    pieces = []
+    draft = replica.draft
+    calls, proposed = (draft.calls, draft.proposed) if draft else (0, 0)
+    with closing(replica.llm(prompt, stream=True, **GENERATION_PARAMS)) as chunks:
+        for chunk in chunks:
+            if cancelled is not None and cancelled.is_set():
+                print("[⏹️ LLM] Generation cancelled")
+                break
+            text = chunk["choices"][0]["text"]
+            pieces.append(text)
+            if first:
+                text = text.lstrip()  # Matches the .strip() of the full response
+            if text:
+                first = False
+                yield text
+    if draft is None and stats is None:
+        return
+    tokens = _reply_tokens(replica, prompt, "".join(pieces))
+    if stats is not None:
+        stats["tokens"] = tokens
+    if draft is None:
+        return
+    # One forward pass for the prompt plus one per draft; each pass yields
+    # one sampled token plus the draft tokens that matched it
+    passes = 1 + draft.calls - calls
+    response = {"tokens": tokens, "passes": passes, "proposed": draft.proposed - proposed,
+                "accepted": max(tokens - passes, 0)}
+    for key, value in response.items():
+        replica.speculative[key] += value
+    if stats is not None:
+        stats["speculative"] = response
 
-{history_text}
-AI Assistant:"""
+def generate_response(replica, user_input, conversation, cancelled=None):
+    """{"response", "emotion", "intent"} of one turn, like stream_response's "done" event"""
+    prompt, emotion_str, intent = _prepare(user_input, conversation)
+    _start(replica, prompt, conversation)
+    ai_response = "".join(_decode(replica, prompt, cancelled)).strip()
+    conversation.add_ai(ai_response)
+    return {"response": ai_response, "emotion": emotion_str, "intent": intent}
 
-    result = llm(prompt, max_tokens=512, temperature=0.55, top_p=0.7, repeat_penalty=1.1)
-    ai_response = result["choices"][0]["text"].strip()
-    chat_history.append(f"AI: {ai_response}")
-    return f"(Detected Emotion: {emotion_str})\n{ai_response}"
\ No newline at end of file
+def stream_response(replica, user_input, conversation, cancelled=None):
+    """Yield ("token", text) as llama.cpp decodes, then ("done", metadata)"""
+    started = time.perf_counter()
+    prompt, emotion_str, intent = _prepare(user_input, conversation)
+    prepared = time.perf_counter()
+    first_token = None
+    pieces = []
+    counts = {}
+    prompt_tokens, cached = _start(replica, prompt, conversation)
+    for text in _decode(replica, prompt, cancelled, counts):
+        if first_token is None:
+            first_token = time.perf_counter()
+        pieces.append(text)
+        yield "token", text
+    finished = time.perf_counter()
+    ai_response = "".join(pieces).strip()
+    conversation.add_ai(ai_response)
+    yield "done", {
+        "response": ai_response,
+        "emotion": emotion_str,
+        "intent": intent,
+        "timings": {
+            "analysis_ms": round((prepared - started) * 1000, 1),
+            "first_token_ms": round(((first_token or finished) - started) * 1000, 1),
+            "total_ms": round((finished - started) * 1000, 1),
+            "tokens": counts["tokens"],
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached,
+            "replica": replica.index,
+            **({"speculative": counts["speculative"]} if "speculative" in counts else {}),
+        },
+    }
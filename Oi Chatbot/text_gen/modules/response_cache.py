@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+
+CACHE_MAX_ENTRIES = 1024
+CACHE_TTL_SECONDS = 600
+HISTORY_WINDOW = 4  # Trailing conversation lines that are part of the key
+
+WORD_RE = re.compile(r"\w+")
+
+def normalize(text):
+    """Case, punctuation and spacing don't change the answer: "Hi, there!" == "hi there" """
+    return " ".join(WORD_RE.findall(text.lower()))
+
+class ResponseCache:
+    """Finished responses keyed on (normalized input, history window, generation params).
+
+    Entries expire after `ttl` seconds and the least recently used go first
+    past `max_entries`. Identical requests arriving while the first is still
+    generating await that same generation instead of starting another one;
+    they are matched on `inflight_key` when given, since the first request's
+    turn may already have changed the history part of the key.
+    Use from the event loop only.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.inflight = {}  # inflight_key or key -> task
+        self._stats = {"hits": 0, "misses": 0, "shared": 0, "evictions": 0, "expirations": 0}
+
+    @staticmethod
+    def key(user_input, window, params):
+        payload = json.dumps([normalize(user_input), list(window), params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key):
+        item = self.entries.get(key)
+        if item is not None and item[0] < time.monotonic():
+            del self.entries[key]
+            self._stats["expirations"] += 1
+            item = None
+        if item is None:
+            return None
+        self.entries.move_to_end(key)
+        return item[1]
+
+    def get(self, key):
+        """The cached value or None, counted as a hit or miss"""
+        value = self._lookup(key)
+        self._stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    async def get_or_generate(self, key, generate, inflight_key=None):
+        """(value, source): a cached value ("hit"), the result of an identical
+        generation in flight ("shared"), or of `generate()` ("generated").
+        Failures are not cached."""
+        value = self._lookup(key)
+        if value is not None:
+            self._stats["hits"] += 1
+            return value, "hit"
+        inflight_key = inflight_key or key
+        task = self.inflight.get(inflight_key)
+        if task is not None:
+            self._stats["shared"] += 1
+            return await asyncio.shield(task), "shared"
+        self._stats["misses"] += 1
+        task = self.inflight[inflight_key] = asyncio.ensure_future(generate())
+        task.add_done_callback(lambda t: self._finish(key, inflight_key, t))
+        return await asyncio.shield(task), "generated"  # A caller going away doesn't fail the others
+
+    def _finish(self, key, inflight_key, task):
+        del self.inflight[inflight_key]
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def stats(self):
+        lookups = self._stats["hits"] + self._stats["shared"] + self._stats["misses"]
+        return dict(self._stats, entries=len(self.entries), inflight=len(self.inflight),
+                    hit_rate=round((self._stats["hits"] + self._stats["shared"]) / lookups, 3) if lookups else None)
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import pickle
+import re
+from collections import OrderedDict
+from modules import llm_engine
+
+DEFAULT_SESSION = "default"
+SESSION_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+SESSION_MEMORY_BYTES = 4 * 1024 ** 3  # Resident history plus parked KV states
+SESSION_MAX_RESIDENT = 64
+
+class Session:
+    """Everything one client owns: its conversation (with parked KV state), mode and transcript cursor"""
+    __slots__ = ("id", "conversation", "mode", "transcript_cursor", "transcript_etag", "transcript_session", "refs")
+
+    def __init__(self, session_id, conversation):
+        self.id = session_id
+        self.conversation = conversation
+        self.mode = "text"
+        self.transcript_cursor = -1
+        self.transcript_etag = None
+        self.transcript_session = None
+        self.refs = 0  # Requests in flight; such sessions are never spilled
+
+    def snapshot(self):
+        return {
+            "conversation": self.conversation.snapshot(),
+            "mode": self.mode,
+            "transcript_cursor": self.transcript_cursor,
+            "transcript_etag": self.transcript_etag,
+            "transcript_session": self.transcript_session,
+        }
+
+    def restore(self, state):
+        self.conversation.restore(state["conversation"])
+        self.mode = state["mode"]
+        self.transcript_cursor = state["transcript_cursor"]
+        self.transcript_etag = state["transcript_etag"]
+        self.transcript_session = state["transcript_session"]
+
+class SessionStore:
+    """Session-keyed state in an LRU, capped by memory, with cold sessions spilled to disk.
+
+    A session's parked llama.cpp KV state (see llm_engine._activate) makes up
+    most of its size, so the cap is on bytes rather than count. Evicted
+    sessions are pickled to `spill_dir`, KV state included, so a returning
+    client resumes without re-evaluating its history. The session whose
+    tokens are live in the model, and any with a request or compaction in
+    flight, are never evicted. Call `acquire`/`release` from the event loop.
+    """
+
+    def __init__(self, spill_dir, new_conversation, memory_bytes=SESSION_MEMORY_BYTES,
+                 max_resident=SESSION_MAX_RESIDENT):
+        self.spill_dir = spill_dir
+        self.new_conversation = new_conversation
+        self.memory_bytes = memory_bytes
+        self.max_resident = max_resident
+        self.sessions = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._stats = {"created": 0, "spilled": 0, "resumed": 0}
+        os.makedirs(spill_dir, exist_ok=True)
+
+    def _path(self, session_id):
+        return os.path.join(self.spill_dir, f"{session_id}.pkl")
+
+    def stats(self):
+        return dict(self._stats, resident=len(self.sessions),
+                    resident_bytes=sum(s.conversation.nbytes() for s in self.sessions.values()))
+
+    async def acquire_resident(self, predicate):
+        """Every resident session matching `predicate`, each acquired; release each one"""
+        async with self._lock:
+            chosen = [session for session in self.sessions.values() if predicate(session)]
+            for session in chosen:
+                session.refs += 1
+            return chosen
+
+    async def acquire(self, session_id=DEFAULT_SESSION):
+        """The session for `session_id`, loaded or created; pair with `release`.
+
+        Raises ValueError for ids that are not 1-64 of [A-Za-z0-9_-].
+        """
+        if not SESSION_ID_RE.fullmatch(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        async with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, self.new_conversation())
+                path = self._path(session_id)
+                if os.path.exists(path):
+                    try:
+                        session.restore(await asyncio.to_thread(self._load, path))
+                        self._stats["resumed"] += 1
+                    except Exception as e:
+                        print(f"[❌ Session Error] Could not resume {session_id}: {e}")
+                else:
+                    self._stats["created"] += 1
+                self.sessions[session_id] = session
+            self.sessions.move_to_end(session_id)
+            session.refs += 1
+            await self._evict()
+            return session
+
+    def release(self, session):
+        session.refs -= 1
+
+    def _evictable(self, session):
+        conversation = session.conversation
+        return session.refs == 0 and not conversation.compacting and not llm_engine.is_live(conversation)
+
+    async def _evict(self):
+        total = sum(s.conversation.nbytes() for s in self.sessions.values())
+        for session in list(self.sessions.values()):
+            if total <= self.memory_bytes and len(self.sessions) <= self.max_resident:
+                break
+            if not self._evictable(session):
+                continue
+            size = session.conversation.nbytes()
+            try:
+                await asyncio.to_thread(self._dump, self._path(session.id), session.snapshot())
+            except Exception as e:
+                print(f"[❌ Session Error] Could not spill {session.id}: {e}")
+                continue
+            if not self._evictable(session):  # Taken again while it was being written
+                continue
+            del self.sessions[session.id]
+            total -= size
+            self._stats["spilled"] += 1
+
+    async def spill_all(self):
+        """Write every resident session to disk (on shutdown) so a restart resumes them"""
+        async with self._lock:
+            for session in self.sessions.values():
+                await asyncio.to_thread(self._dump, self._path(session.id), session.snapshot())
+
+    @staticmethod
+    def _dump(path, state):
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
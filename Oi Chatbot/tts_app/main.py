@@ -1,7 +1,7 @@
 import logging
 from tts_assistant.tts_engine import speak
 from tts_assistant.input_handler import get_voice_input
-from tts_assistant.ai_client import get_response_from_server
+from tts_assistant.ai_client import stream_sentences_from_server
 
 if __name__ == "__main__":
     import sounddevice as sd
@@ -20,10 +20,10 @@ if __name__ == "__main__":
                 break
 
             if user_input:
-                reply = get_response_from_server(user_input)
-                if reply:
-                    logging.info(f"🤖 Response: {reply}")
-                    speak(reply)
+                # Speak each sentence as soon as it is decoded instead of after the whole reply
+                for sentence in stream_sentences_from_server(user_input):
+                    logging.info(f"🤖 Response: {sentence}")
+                    speak(sentence, blocking=True)
 
     except KeyboardInterrupt:
         logging.info("\n👋 Exiting on Ctrl+C.")
@@ -1,8 +1,9 @@
+import json
 import requests
 import re
 import logging
 import time
-from .config import AI_URL, TIMEOUT_DURATION, MAX_RETRIES
+from .config import AI_URL, AI_STREAM_URL, TIMEOUT_DURATION, MAX_RETRIES
 
 def get_response_from_server(user_input):
     payload = {"input": user_input}
@@ -19,5 +20,38 @@ def get_response_from_server(user_input):
             time.sleep(1)
     return "[Failed to retrieve AI response]"
 
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def stream_sentences_from_server(user_input):
+    """Yield the reply sentence by sentence while the server is still decoding.
+
+    Falls back to the blocking endpoint if the stream cannot be opened.
+    """
+    try:
+        response = requests.post(AI_STREAM_URL, json={"input": user_input}, stream=True,
+                                 timeout=(TIMEOUT_DURATION, None))
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"[🚨 AI Stream Error] {e}; falling back to /respond")
+        yield get_response_from_server(user_input)
+        return
+
+    buffer, event = "", None
+    with response:
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "token":
+                    buffer += data["text"]
+                    *sentences, buffer = SENTENCE_END.split(buffer)
+                    for sentence in sentences:
+                        yield sentence
+                elif event == "done":
+                    logging.info(f"🤖 Bot Response: {data.get('response')} | {data.get('timings')}")
+    if buffer.strip():
+        yield buffer.strip()
+
 def clean_reply(text):
     return re.sub(r"\(Detected Emotion:.*?\)", "", text).strip()
@@ -14,7 +14,7 @@ def load_tts_model():
 
 tts = load_tts_model()
 
-def speak(text, sample_rate=DEFAULT_SAMPLE_RATE):
+def speak(text, sample_rate=DEFAULT_SAMPLE_RATE, blocking=False):
     if not tts:
         logging.warning("[⚠️ TTS not available]")
         return
@@ -24,6 +24,6 @@ def speak(text, sample_rate=DEFAULT_SAMPLE_RATE):
     try:
         logging.info("🔊 Speaking response...")
         wav = np.array(tts.tts(text), dtype=np.float32)
-        sd.play(wav, samplerate=int(sample_rate), blocking=False)
+        sd.play(wav, samplerate=int(sample_rate), blocking=blocking)
     except Exception as e:
         logging.error(f"[❌ TTS Error] {e}")
@@ -1,4 +1,3 @@
-import queue
 import sys
 import os
 import threading
@@ -7,20 +6,21 @@ import sounddevice as sd
 import torch
 import argparse
 from datetime import datetime
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from resemblyzer import VoiceEncoder, preprocess_wav
+from resemblyzer import VoiceEncoder
+from resemblyzer.audio import normalize_volume
+from resemblyzer.hparams import audio_norm_target_dBFS
 from scipy.spatial.distance import cosine
-from collections import deque
-from sklearn.cluster import DBSCAN
+from collections import deque, namedtuple
+from concurrent.futures import Future
 from faster_whisper import WhisperModel
-from scipy.io.wavfile import write
-import io
 import pickle
 import time
-from concurrent.futures import ThreadPoolExecutor
 import uvicorn
 import psutil
+import asyncio
+import json
 
 # === CONFIG ===
 transcript_dir = "D:/Data_Files/Transcripts"
@@ -54,6 +54,18 @@ blocksize = 16000
 speaker_threshold = 0.55
 MAX_TRANSCRIPT_LINES = 10000
 MAX_SPEAKERS = 4  # Limiting number of recognized speakers
+RING_BUFFER_SECONDS = 30  # Capture history; chunk views are valid this long
+WS_CLIENT_QUEUE_SIZE = 256  # Per-client backlog before oldest records are dropped
+TRANSCRIBE_WORKERS = 1  # Each chunk starts where the previous one was committed, so one is in flight
+MAX_PENDING_CHUNKS = 6  # Bounded backlog: oldest chunks are dropped past this
+MAX_LAG_SECONDS = 10  # ...or once the oldest pending chunk is this far behind
+FLUSH_INTERVAL = 5  # Seconds between transcript file flushes
+FSYNC_POLICY = "interval"  # never | interval | always
+FSYNC_INTERVAL = 30
+CHUNK_SECONDS = 3
+STITCH_HOLDBACK_SECONDS = 0.3  # Words ending this close to a chunk's edge may be cut off
+STITCH_MAX_REWIND_SECONDS = 1.0  # Furthest back the next chunk may start
+STITCH_CONTEXT_CHARS = 200  # Committed text carried forward as the decoder prompt
 
 # === MODELS ===
 device_type = "cuda" if torch.cuda.is_available() else "cpu"
@@ -71,56 +83,396 @@ except Exception as e:
     known_speakers = {}
 
 recent_predictions = []
-q = queue.Queue()
-transcript_lines_speaker = deque(maxlen=MAX_TRANSCRIPT_LINES)
-transcript_lines_plain = deque(maxlen=MAX_TRANSCRIPT_LINES)
+transcript_entries = deque(maxlen=MAX_TRANSCRIPT_LINES)  # (seq, timestamp, speaker, text); both views render from it
+next_seq = 0
 transcript_lock = threading.Lock()
-write_buffer = []
-executor = ThreadPoolExecutor(max_workers=2)
+write_buffer = []  # Swapped out whole by periodic_writer; file I/O never holds transcript_lock
+write_buffer_since = None  # When the oldest unwritten line arrived
+writer_stats = {"written": 0, "last_flush_seconds": 0.0, "max_write_lag_seconds": 0.0, "errors": 0}
+pending_chunks = deque()  # (captured_at, chunk, start_sample, future) waiting for a transcription worker
+pending_cond = threading.Condition()
+dropped_chunks = 0
 latency_data = deque(maxlen=100)
+ws_clients = set()
+ws_clients_lock = threading.Lock()
+event_loop = None
+
+# === AUDIO RING BUFFER ===
+class AudioRing:
+    """Preallocated float32 ring; samples are mirrored into both halves so any
+    window up to `capacity` samples is a contiguous, zero-copy slice."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity, dtype=np.float32)
+        self.written = 0
+        self.ready = threading.Event()
+
+    def write(self, samples):
+        cap = self.capacity
+        n = len(samples)
+        if n > cap:
+            self.written += n - cap
+            samples, n = samples[-cap:], cap
+        pos = self.written % cap
+        first = min(n, cap - pos)
+        self.data[pos:pos + first] = samples[:first]
+        self.data[cap + pos:cap + pos + first] = samples[:first]
+        if n > first:
+            self.data[:n - first] = samples[first:]
+            self.data[cap:cap + n - first] = samples[first:]
+        self.written += n
+        self.ready.set()
+
+    def wait_for(self, position):
+        while self.written < position:
+            self.ready.clear()
+            if self.written < position:
+                self.ready.wait()
+
+    def view(self, start, length):
+        pos = start % self.capacity
+        return self.data[pos:pos + length]
+
+ring = AudioRing(RING_BUFFER_SECONDS * samplerate)
 
 # === AUDIO CALLBACK ===
 def callback(indata, frames, time, status):
     if status:
         print("[⚠️ Audio Status]", status, file=sys.stderr)
-    q.put(bytes(indata))
+    ring.write(indata[:, 0])
+
+# === ONLINE SPEAKER CLUSTERING ===
+def _normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class _Centroid:
+    __slots__ = ("vector", "count", "label", "last_seen", "cohesion", "recent")
+
+    def __init__(self, vector, step, reservoir_size):
+        self.vector = vector
+        self.count = 1
+        self.label = None
+        self.last_seen = step
+        self.cohesion = 1.0  # Running mean similarity of members to the centroid
+        self.recent = deque([vector], maxlen=reservoir_size)
+
+
+class OnlineSpeakerClusterer:
+    """Incremental speaker clustering over a bounded set of centroids.
+
+    Each embedding is compared against at most `max_speakers + max_candidates`
+    centroids, so attribution cost and memory stay constant however long the
+    meeting runs. New voices start as unlabelled candidates and get a
+    Speaker_N label once heard `min_count` times (DBSCAN's min_samples).
+    Every `maintenance_interval` assignments, near-duplicate centroids are
+    merged, stale candidates dropped and incoherent speakers split in two.
+    """
+
+    def __init__(self, match_similarity=0.75, merge_similarity=0.85, split_cohesion=0.7,
+                 max_speakers=MAX_SPEAKERS, max_candidates=4, min_count=5, maintenance_interval=50,
+                 reservoir_size=32, max_weight=200):
+        self.match_similarity = match_similarity
+        self.merge_similarity = merge_similarity
+        self.split_cohesion = split_cohesion
+        self.max_speakers = max_speakers
+        self.max_candidates = max_candidates
+        self.min_count = min_count
+        self.maintenance_interval = maintenance_interval
+        self.reservoir_size = reservoir_size
+        self.max_weight = max_weight
+        self.centroids = []
+        self.step = 0
+        self._next_label = 1
+        self._lock = threading.Lock()
+
+    def assign(self, embedding):
+        """Return the speaker label for one embedding and update the model"""
+        embedding = _normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            self.step += 1
+            best, similarity = self._nearest(embedding)
+            if best is None or similarity < self.match_similarity:
+                best = self._spawn(embedding)
+            else:
+                self._update(best, embedding, similarity)
+
+            if best.label is None and best.count >= self.min_count:
+                self._promote(best)
+            label = best.label
+
+            if self.step % self.maintenance_interval == 0:
+                self._maintain()
+        return label or "Unknown"
+
+    def speakers(self):
+        with self._lock:
+            return {c.label: c.vector for c in self.centroids if c.label}
+
+    def _labelled(self):
+        return sum(1 for c in self.centroids if c.label)
+
+    def _nearest(self, embedding):
+        best, best_sim = None, -1.0
+        for centroid in self.centroids:
+            sim = float(np.dot(centroid.vector, embedding))
+            if sim > best_sim:
+                best, best_sim = centroid, sim
+        return best, best_sim
+
+    def _spawn(self, embedding):
+        candidates = [c for c in self.centroids if c.label is None]
+        if len(candidates) >= self.max_candidates:
+            self.centroids.remove(min(candidates, key=lambda c: c.last_seen))
+        centroid = _Centroid(embedding, self.step, self.reservoir_size)
+        self.centroids.append(centroid)
+        return centroid
+
+    def _update(self, centroid, embedding, similarity):
+        # Capped weight keeps the centroid tracking slow drift in a long session
+        weight = 1.0 / min(centroid.count + 1, self.max_weight)
+        centroid.vector = _normalize((1 - weight) * centroid.vector + weight * embedding)
+        centroid.count += 1
+        centroid.last_seen = self.step
+        centroid.cohesion = 0.9 * centroid.cohesion + 0.1 * similarity
+        centroid.recent.append(embedding)
+
+    def _promote(self, centroid):
+        if self._labelled() < self.max_speakers:
+            centroid.label = f"Speaker_{self._next_label}"
+            self._next_label += 1
+
+    def _maintain(self):
+        stale_after = 4 * self.maintenance_interval
+        self.centroids = [c for c in self.centroids
+                          if c.label or self.step - c.last_seen <= stale_after]
+        self._merge()
+        self._split()
+
+    def _merge(self):
+        i = 0
+        while i < len(self.centroids):
+            keep = self.centroids[i]
+            j = i + 1
+            while j < len(self.centroids):
+                other = self.centroids[j]
+                if float(np.dot(keep.vector, other.vector)) >= self.merge_similarity:
+                    # Earlier centroid wins so established labels stay stable
+                    total = keep.count + other.count
+                    keep.vector = _normalize((keep.count * keep.vector + other.count * other.vector) / total)
+                    keep.count = total
+                    keep.label = keep.label or other.label
+                    keep.last_seen = max(keep.last_seen, other.last_seen)
+                    keep.recent.extend(other.recent)
+                    del self.centroids[j]
+                else:
+                    j += 1
+            i += 1
+
+    def _split(self):
+        for centroid in list(self.centroids):
+            if (centroid.label is None or centroid.cohesion >= self.split_cohesion
+                    or len(centroid.recent) < self.reservoir_size // 2
+                    or self._labelled() >= self.max_speakers):
+                continue
+            halves = self._two_means(np.stack(centroid.recent))
+            if halves is None:
+                continue
+            (a, a_members), (b, b_members) = halves
+            if float(np.dot(a, b)) >= self.match_similarity:
+                continue
+            share = len(b_members) / (len(a_members) + len(b_members))
+            split = _Centroid(b, self.step, self.reservoir_size)
+            split.count = max(self.min_count, int(centroid.count * share))
+            split.recent.extend(b_members)
+            self.centroids.append(split)
+            self._promote(split)
+            centroid.vector = a
+            centroid.count = max(1, centroid.count - split.count)
+            centroid.cohesion = 1.0
+            centroid.recent = deque(a_members, maxlen=self.reservoir_size)
+
+    @staticmethod
+    def _two_means(members, iterations=5):
+        sims = members @ members.T
+        i, j = np.unravel_index(np.argmin(sims), sims.shape)
+        centers = np.stack([members[i], members[j]])
+        for _ in range(iterations):
+            assign = np.argmax(members @ centers.T, axis=1)
+            if assign.min() == assign.max():
+                return None
+            centers = np.stack([_normalize(members[assign == k].mean(axis=0)) for k in (0, 1)])
+        big, small = (0, 1) if (assign == 0).sum() >= (assign == 1).sum() else (1, 0)
+        return (centers[big], list(members[assign == big])), (centers[small], list(members[assign == small]))
+
+speaker_clusterer = OnlineSpeakerClusterer()
+
+# === CHUNK STITCHING ===
+StitchedSegment = namedtuple("StitchedSegment", ["start", "end", "text"])  # Absolute stream seconds
+
+
+class TranscriptStitcher:
+    """Commits each stretch of the stream's audio to the transcript exactly once.
+
+    Words ending in the last `holdback` seconds of a chunk may be cut off, so
+    they are not committed; instead the next chunk is started just before
+    the cut word and only that short tail is decoded again.
+    Words whose midpoint falls before the commit point are dropped, so a
+    rewound tail never repeats a line. The tail of the committed text is
+    offered as the decoder prompt for the next chunk.
+    """
+
+    def __init__(self, holdback=STITCH_HOLDBACK_SECONDS, max_rewind=STITCH_MAX_REWIND_SECONDS,
+                 context_chars=STITCH_CONTEXT_CHARS):
+        self.holdback = holdback
+        self.max_rewind = max_rewind
+        self.context_chars = context_chars
+        self.committed_until = 0.0
+        self.context = ""
+
+    def prompt(self):
+        return self.context or None
+
+    def skip(self, until):
+        """Mark audio up to `until` as handled without text (e.g. silence)"""
+        self.committed_until = max(self.committed_until, until)
+
+    def stitch(self, segments, chunk_start, chunk_end):
+        """Return (committed segments, stream time the next chunk should start at)"""
+        cutoff = chunk_end - self.holdback
+        rewind_floor = chunk_end - self.max_rewind
+        committed, held = [], None
+
+        for segment in segments:
+            words = segment.words or [segment]
+            kept = []
+            for word in words:
+                start, end = chunk_start + word.start, chunk_start + word.end
+                if (start + end) / 2 < self.committed_until:
+                    continue
+                # Words that start too early to be re-decoded are committed as they are
+                if end > cutoff and start >= rewind_floor:
+                    held = start
+                    break
+                kept.append((start, end, getattr(word, "word", None) or word.text))
+            if kept:
+                text = "".join(t for _, _, t in kept).strip()
+                if text:
+                    committed.append(StitchedSegment(kept[0][0], kept[-1][1], text))
+                self.committed_until = max(self.committed_until, kept[-1][1])
+            if held is not None:
+                break
+
+        if committed:
+            self.context = (self.context + " " + " ".join(s.text for s in committed))[-self.context_chars:].lstrip()
 
-# === SPEAKER EMBEDDING HISTORY ===
-speaker_embedding_history = deque(maxlen=20)  # Rolling storage for improved clustering
+        if held is not None:
+            # Leave a little lead-in before the cut word for the decoder
+            resume = max(self.committed_until, held - self.holdback)
+        else:
+            resume = max(self.committed_until, cutoff)
+        resume = min(chunk_end, max(resume, rewind_floor, chunk_start))
+        self.committed_until = max(self.committed_until, min(resume, cutoff))
+        return committed, resume
+
+stitcher = TranscriptStitcher()
 
 def audio_thread():
-    buffer = []
+    """Cuts the microphone stream into chunks, each starting where the previous one was committed.
+
+    The next chunk's start depends on the previous chunk's words, so one
+    chunk is in flight at a time; the audio behind it keeps accumulating in
+    the ring meanwhile.
+    """
+    chunk_samples = CHUNK_SECONDS * blocksize
+    cursor = ring.written
     while True:
         try:
-            with sd.RawInputStream(samplerate=samplerate, blocksize=blocksize,
-                                   device=device, dtype='int16', channels=1,
-                                   callback=callback):
+            with sd.InputStream(samplerate=samplerate, blocksize=blocksize,
+                                device=device, dtype='float32', channels=1,
+                                callback=callback):
                 while True:
-                    data = q.get()
-                    audio_np = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
-                    buffer.append(audio_np)
-
-                    if len(buffer) >= 3:
-                        executor.submit(process_chunk, buffer[-3:])
-                        buffer = buffer[-1:]
+                    ring.wait_for(cursor + chunk_samples)
+                    newest = ring.written - chunk_samples
+                    if cursor < ring.written - ring.capacity or newest - cursor > MAX_LAG_SECONDS * samplerate:
+                        print("[⚠️ Audio Overrun] Skipping to newest audio")
+                        cursor = newest
+                        stitcher.skip(cursor / samplerate)
+                    consumed = submit_chunk(ring.view(cursor, chunk_samples), cursor).result()
+                    cursor += consumed or chunk_samples  # None: shed by the queue
         except Exception as e:
             print(f"[❌ Audio Thread Error] {e} on device={device}")
+            cursor = ring.written
             time.sleep(3)
             
+# === BOUNDED TRANSCRIPTION QUEUE ===
+def pending_lag():
+    return time.time() - pending_chunks[0][0] if pending_chunks else 0.0
+
+def submit_chunk(chunk, start_sample):
+    """Queue a chunk, shedding the oldest ones so latency stays bounded.
+
+    The future resolves to the samples the chunk consumed, or None if it was shed.
+    """
+    global dropped_chunks
+    future = Future()
+    with pending_cond:
+        pending_chunks.append((time.time(), chunk, start_sample, future))
+        while pending_chunks and (len(pending_chunks) > MAX_PENDING_CHUNKS or pending_lag() > MAX_LAG_SECONDS):
+            pending_chunks.popleft()[3].set_result(None)
+            dropped_chunks += 1
+        pending_cond.notify()
+    return future
+
+def transcription_worker():
+    while True:
+        with pending_cond:
+            while not pending_chunks:
+                pending_cond.wait()
+            _, chunk, start_sample, future = pending_chunks.popleft()
+        try:
+            future.set_result(process_chunk(chunk, start_sample))
+        except Exception as e:
+            print(f"[❌ Transcription Error] {e}")
+            future.set_result(None)
+
 def periodic_writer():
+    global write_buffer, write_buffer_since
+    files = None
+    last_fsync = time.monotonic()
     while True:
+        time.sleep(FLUSH_INTERVAL)
+        with transcript_lock:
+            batch, write_buffer = write_buffer, []
+            since, write_buffer_since = write_buffer_since, None
+        if not batch:
+            continue
+        started = time.monotonic()
         try:
-            time.sleep(5)
-            with transcript_lock:
-                if write_buffer:
-                    with open(speaker_transcript_path, "a", encoding="utf-8") as f1, \
-                         open(plain_transcript_path, "a", encoding="utf-8") as f2:
-                        for speaker_line, plain_line in write_buffer:
-                            f1.write(speaker_line + "\n")
-                            f2.write(plain_line + "\n")
-                    write_buffer.clear()
+            if files is None:
+                files = (open(speaker_transcript_path, "a", encoding="utf-8"),
+                         open(plain_transcript_path, "a", encoding="utf-8"))
+            files[0].write("".join(speaker_line + "\n" for speaker_line, _ in batch))
+            files[1].write("".join(plain_line + "\n" for _, plain_line in batch))
+            for f in files:
+                f.flush()
+            if FSYNC_POLICY == "always" or (FSYNC_POLICY == "interval" and started - last_fsync >= FSYNC_INTERVAL):
+                for f in files:
+                    os.fsync(f.fileno())
+                last_fsync = started
+            now = time.monotonic()
+            writer_stats["written"] += len(batch)
+            writer_stats["last_flush_seconds"] = round(now - started, 4)
+            writer_stats["max_write_lag_seconds"] = round(max(writer_stats["max_write_lag_seconds"], now - since), 3)
         except Exception as e:
             print(f"[❌ Writer Thread Error] {e}")
+            writer_stats["errors"] += 1
+            with transcript_lock:  # Retry next round, ahead of anything newer
+                write_buffer[:0] = batch
+                write_buffer_since = since
+            files = None
 
 def performance_monitor():
     while True:
@@ -128,44 +480,59 @@ def performance_monitor():
         mem = psutil.virtual_memory().percent
         print(f"[📊 Performance] CPU: {cpu:.1f}% | Memory: {mem:.1f}%")
 
-def cluster_speakers():
-    """Clusters speaker embeddings to dynamically differentiate voices, limiting to MAX_SPEAKERS."""
-    if len(speaker_embedding_history) < 5:
-        return None
-
-    embeddings = np.array(speaker_embedding_history)
-    clustering_model = DBSCAN(eps=0.4, min_samples=5, metric="euclidean")
-    labels = clustering_model.fit_predict(embeddings)
-
-    unique_speakers = set(labels)
-    if len(unique_speakers) > MAX_SPEAKERS:
-        return "Unknown"  # Defaulting extra speakers beyond limit
+def identify_speakers(audio, spans):
+    """Labels each (start, end) span in seconds from one encoder pass over the chunk."""
 
-    return labels[-1] if labels[-1] >= 0 else "Unknown"
-
-def identify_speaker(audio_frames):
-    """Identifies speakers using adaptive clustering, ensuring a maximum of 4 speakers."""
-    
-    wav = preprocess_wav(np.concatenate(audio_frames), source_sr=samplerate)
+    # preprocess_wav minus trim_long_silences, which would shift the windows
+    # off the chunk timeline; capture is already at the encoder's 16 kHz
+    if not audio.any():
+        return ["Unknown"] * len(spans)
+    wav = normalize_volume(np.asarray(audio, dtype=np.float32), audio_norm_target_dBFS, increase_only=True)
 
     if np.mean(np.abs(wav)) < 0.01:  # Ignore silence
-        return "Unknown"
-
-    embedding = encoder.embed_utterance(wav)
-    speaker_embedding_history.append(embedding)
-
-    # Apply clustering
-    speaker_label = cluster_speakers()
-    if speaker_label and speaker_label != "Unknown":
-        identity = f"Speaker_{speaker_label + 1}"
-        if identity not in known_speakers and len(known_speakers) < MAX_SPEAKERS:
+        return ["Unknown"] * len(spans)
+
+    _, partials, wav_slices = encoder.embed_utterance(wav, return_partials=True)
+    starts = np.array([s.start for s in wav_slices]) / samplerate
+    stops = np.array([s.stop for s in wav_slices]) / samplerate
+    centers = (starts + stops) / 2
+
+    identities = []
+    for start, end in spans:
+        # Average the 1.6 s partial embeddings overlapping this segment
+        overlapping = partials[(starts < end) & (stops > start)]
+        if not len(overlapping):
+            overlapping = partials[[np.argmin(np.abs(centers - (start + end) / 2))]]
+        embedding = _normalize(overlapping.mean(axis=0))
+
+        # O(speakers) assignment against the online centroids
+        identity = speaker_clusterer.assign(embedding)
+        if identity != "Unknown" and identity not in known_speakers and len(known_speakers) < MAX_SPEAKERS:
             known_speakers[identity] = embedding
-    else:
-        identity = "Unknown"
-
-    return identity
+        identities.append(identity)
+
+    return identities
+
+# === LIVE TRANSCRIPT PUSH ===
+def _fan_out(record):
+    with ws_clients_lock:
+        clients = list(ws_clients)
+    for client in clients:
+        if client.full():
+            client.get_nowait()  # Slow client: drop its oldest record
+        client.put_nowait(record)
+
+def publish_transcript(record):
+    """Hands a record to the event loop for every websocket client (thread-safe)."""
+    if event_loop is None or not ws_clients:
+        return
+    try:
+        event_loop.call_soon_threadsafe(_fan_out, record)
+    except RuntimeError:
+        pass  # Loop closed during shutdown
 
 def log_transcript(speaker, text):
+    global next_seq, write_buffer_since
     timestamp = datetime.now().strftime("%H:%M:%S")
     line_with_speaker = f"[{timestamp}] {speaker}: {text}"
     line_plain = f"{text}"
@@ -173,36 +540,46 @@ def log_transcript(speaker, text):
     print(line_with_speaker)
 
     with transcript_lock:
-        transcript_lines_speaker.append(line_with_speaker)
-        transcript_lines_plain.append(line_plain)
+        seq = next_seq
+        next_seq += 1
+        transcript_entries.append((seq, timestamp, sys.intern(speaker), text))
+        if not write_buffer:
+            write_buffer_since = time.monotonic()
         write_buffer.append((line_with_speaker, line_plain))
+    publish_transcript({"seq": seq, "timestamp": timestamp, "speaker": speaker, "text": text, "line": line_with_speaker})
 
-def process_chunk(audio_frames):
+def process_chunk(full_chunk, start_sample):
+    """Transcribes and logs the chunk's newly committed text; returns the samples consumed."""
     start = time.time()
     print("[🧠 Processing audio chunk...]")
-    
-    full_chunk = np.concatenate(audio_frames)
+    chunk_start = start_sample / samplerate
+    chunk_end = chunk_start + len(full_chunk) / samplerate
+
     if np.mean(np.abs(full_chunk)) < 0.01:
         print("[🔇 Silence skipped]")
-        return
+        stitcher.skip(chunk_end)
+        return len(full_chunk)
 
-    wav_io = io.BytesIO()
-    write(wav_io, samplerate, (full_chunk * 32767).astype(np.int16))
-    wav_io.seek(0)
+    # Whisper takes float32 arrays directly: no WAV encode/decode round trip
+    audio = np.ascontiguousarray(full_chunk, dtype=np.float32)
 
+    consumed = len(full_chunk)
     retries = 2
     for attempt in range(retries):
         try:
             segments, _ = whisper_model.transcribe(
-                wav_io, vad_filter=True, vad_parameters={"threshold": 0.6, "min_silence_duration_ms": 300}
+                audio, vad_filter=True, vad_parameters={"threshold": 0.6, "min_silence_duration_ms": 300},
+                word_timestamps=True, initial_prompt=stitcher.prompt(),
             )
+            segments = list(segments)
             print("[🔍 Raw Whisper Output]:", segments)
 
-            for segment in segments:
-                text = segment.text.strip()
-                if text:
-                    speaker = identify_speaker(audio_frames)
-                    log_transcript(speaker, text)
+            committed, resume = stitcher.stitch(segments, chunk_start, chunk_end)
+            if committed:
+                spans = [(s.start - chunk_start, s.end - chunk_start) for s in committed]
+                for segment, speaker in zip(committed, identify_speakers(full_chunk, spans)):
+                    log_transcript(speaker, segment.text)
+            consumed = max(1, round(resume * samplerate) - start_sample)
             break
         except Exception as e:
             if attempt < retries - 1:
@@ -210,12 +587,16 @@ def process_chunk(audio_frames):
                 time.sleep(1)
             else:
                 print(f"[❌ Whisper Failed After {retries} Attempts]: {e}")
+                stitcher.skip(chunk_end)
 
     end = time.time()
     latency_data.append(end - start)
+    return consumed
 
 # === BACKGROUND THREADS ===
 def start_background_tasks():
+    for _ in range(TRANSCRIBE_WORKERS):
+        threading.Thread(target=transcription_worker, daemon=True).start()
     threading.Thread(target=audio_thread, daemon=True).start()
     threading.Thread(target=periodic_writer, daemon=True).start()
     threading.Thread(target=performance_monitor, daemon=True).start()
@@ -229,12 +610,73 @@ app.add_middleware(
 @app.get("/transcript")
 async def get_transcript(mode: str = "plain"):
     with transcript_lock:
-        return list(transcript_lines_plain) if mode == "plain" else list(transcript_lines_speaker)
+        return [e[3] for e in transcript_entries] if mode == "plain" else [f"[{e[1]}] {e[2]}: {e[3]}" for e in transcript_entries]
+
+@app.get("/transcript/delta")
+async def get_transcript_delta(request: Request, since_seq: int = -1, mode: str = "plain"):
+    """Entries after the client's cursor; 304 when nothing changed (ETag / If-None-Match).
+
+    Same shape as speech_app's /api/transcript/delta: `truncated` means entries
+    after the cursor already left the in-memory window, `more` (never set
+    here, the whole window is returned) means read again from `last_seq`.
+    """
+    with transcript_lock:
+        last_seq = next_seq - 1
+        etag = f'"{timestamp_str}-{last_seq}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        new_entries = []
+        for entry in reversed(transcript_entries):  # O(new entries), not O(window)
+            if entry[0] <= since_seq:
+                break
+            new_entries.append(entry)
+        first_seq = transcript_entries[0][0] if transcript_entries else next_seq
+    new_entries.reverse()
+    if mode == "plain":
+        entries = [{"seq": e[0], "text": e[3]} for e in new_entries]
+    else:
+        entries = [{"seq": e[0], "timestamp": e[1], "speaker": e[2], "text": e[3]} for e in new_entries]
+    return Response(
+        content=json.dumps({"session": timestamp_str, "last_seq": last_seq, "truncated": since_seq + 1 < first_seq,
+                            "more": False, "entries": entries}),
+        media_type="application/json", headers={"ETag": etag},
+    )
+
+@app.on_event("startup")
+async def bind_event_loop():
+    global event_loop
+    event_loop = asyncio.get_running_loop()
+
+async def pump_transcript(websocket, client):
+    while True:
+        await websocket.send_json(await client.get())
+
+@app.websocket("/ws")
+async def transcript_ws(websocket: WebSocket):
+    await websocket.accept()
+    client = asyncio.Queue(maxsize=WS_CLIENT_QUEUE_SIZE)
+    with ws_clients_lock:
+        ws_clients.add(client)
+    sender = asyncio.create_task(pump_transcript(websocket, client))
+    try:
+        while True:
+            await websocket.receive_text()  # Only used to detect disconnects
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        with ws_clients_lock:
+            ws_clients.discard(client)
 
 @app.get("/status")
 async def status():
     with transcript_lock:
-        return {"known_speakers": list(known_speakers.keys()), "total_lines": len(transcript_lines_speaker)}
+        info = {"known_speakers": list(known_speakers.keys()), "total_lines": len(transcript_entries), "last_seq": next_seq - 1}
+        write_lag = time.monotonic() - write_buffer_since if write_buffer else 0.0
+        info["writer"] = {**writer_stats, "pending": len(write_buffer), "write_lag_seconds": round(write_lag, 3)}
+    with pending_cond:
+        info.update(queue_depth=len(pending_chunks), lag_seconds=round(pending_lag(), 3), dropped_chunks=dropped_chunks)
+    return info
 
 if __name__ == "__main__":
     print(f"🎧 Using device: {device} | Torch device: {device_type}")
@@ -2,17 +2,22 @@ import os, torch, time, requests, sys
 from datetime import datetime
 from llama_cpp import Llama
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, abort
+import json
+import re
+from collections import OrderedDict
 from queue import Queue
 import threading
 
 # === CONFIG ===
 MODEL_PATH = "/mnt/d/WSL/Ubuntu/TheBloke/Mistral-7B-Instruct-v0.1-GGUF/mistral-7b-instruct-v0.1.Q4_K_S.gguf"
-TRANSCRIPT_API = "http://localhost:9575/transcript?mode=plain"
+TRANSCRIPT_API = "http://localhost:9575/transcript/delta"
 TRANSCRIPT_DIR = "/mnt/d/Data_Files/Transcripts"
 os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
 timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 ai_conversation_path = os.path.join(TRANSCRIPT_DIR, f"ai_responses_{timestamp_str}.txt")
+SESSION_DIR = "/mnt/d/Data_Files/Sessions"
+os.makedirs(SESSION_DIR, exist_ok=True)
 
 # === LOAD MODELS ===
 print("🔄 Loading LLM...")
@@ -25,13 +30,79 @@ emotion_model = AutoModelForSequenceClassification.from_pretrained(emotion_model
 labels_url = "https://raw.githubusercontent.com/google-research/google-research/master/goemotions/data/emotions.txt"
 emotion_labels = requests.get(labels_url).text.strip().split("\n")
 
+GENERATION_PARAMS = dict(max_tokens=512, temperature=0.8, top_p=0.9, repeat_penalty=1.1)
+
 # === STATE ===
-chat_history = []
-last_seen_line = ""
-mode = "text"
 q = Queue()
 app = Flask(__name__)
 
+# === SESSIONS ===
+# Per-client history, mode and transcript cursor, keyed by the X-Session-ID header
+# ("default" without one). The most recently used MAX_SESSIONS stay in memory;
+# older ones are spilled to SESSION_DIR as JSON and reloaded on their next request.
+DEFAULT_SESSION = "default"
+SESSION_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+MAX_SESSIONS = 256
+sessions = OrderedDict()
+sessions_lock = threading.Lock()
+
+def session_path(session_id):
+    return os.path.join(SESSION_DIR, f"{session_id}.json")
+
+def acquire_session(session_id):
+    """Load or create the session and mark it in use; pair with release_session. Raises ValueError on bad ids."""
+    if not SESSION_ID_RE.fullmatch(session_id):
+        raise ValueError(f"Invalid session id: {session_id!r}")
+    with sessions_lock:
+        session = sessions.get(session_id)
+        if session is None:
+            session = {"history": [], "mode": "text", "transcript_cursor": -1, "transcript_etag": None, "transcript_session": None}
+            if os.path.exists(session_path(session_id)):
+                with open(session_path(session_id), encoding="utf-8") as f:
+                    session.update(json.load(f))
+            sessions[session_id] = session
+        sessions.move_to_end(session_id)
+        session["refs"] = session.get("refs", 0) + 1
+        for old_id in list(sessions):
+            if len(sessions) <= MAX_SESSIONS:
+                break
+            if sessions[old_id]["refs"] == 0:  # Never spill a session with a request in flight
+                spill_session(old_id, sessions.pop(old_id))
+        return session
+
+def release_session(session):
+    with sessions_lock:
+        session["refs"] -= 1
+
+def spill_session(session_id, session):
+    with open(session_path(session_id) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(dict(session, refs=0), f, ensure_ascii=False)
+    os.replace(session_path(session_id) + ".tmp", session_path(session_id))
+
+def request_session():
+    try:
+        return acquire_session(request.headers.get("X-Session-ID", DEFAULT_SESSION))
+    except ValueError as e:
+        abort(400, description=str(e))
+
+# === TRANSCRIPT ===
+def fetch_latest_transcript(session):
+    """Newest transcript line past the session's cursor, or None if nothing new"""
+    headers = {"If-None-Match": session["transcript_etag"]} if session["transcript_etag"] else {}
+    res = requests.get(TRANSCRIPT_API, params={"since_seq": session["transcript_cursor"], "mode": "plain"}, headers=headers, timeout=3)
+    if res.status_code == 304:
+        return None
+    delta = res.json()
+    if delta["session"] != session["transcript_session"]:
+        session["transcript_session"] = delta["session"]
+        if session["transcript_cursor"] >= 0:  # STT restarted; our cursor belongs to the old session
+            session["transcript_cursor"], session["transcript_etag"] = -1, None
+            return fetch_latest_transcript(session)
+    session["transcript_cursor"] = delta["last_seq"]
+    session["transcript_etag"] = res.headers.get("ETag")
+    entries = delta["entries"]
+    return entries[-1]["text"] if entries else None
+
 # === EMOTION ===
 def detect_emotions(text, threshold=0.3):
     inputs = emotion_tokenizer(text, return_tensors="pt", truncation=True)
@@ -43,7 +114,7 @@ def detect_emotions(text, threshold=0.3):
     return [e[0] for e in detected] if detected else ["neutral"]
 
 # === AI RESPONSE ===
-def generate_response(user_input):
+def build_prompt(user_input, chat_history):
     emotions = detect_emotions(user_input)
     emotion_str = ", ".join(emotions)
     chat_history.append(f"User: {user_input}")
@@ -53,11 +124,52 @@ You are a helpful, emotionally intelligent AI assistant. Adjust your tone to fit
 
 {history_text}
 AI Assistant:"""
-    result = llm(prompt, max_tokens=512, temperature=0.8, top_p=0.9, repeat_penalty=1.1)
+    return prompt, emotion_str
+
+def generate_response(user_input, chat_history):
+    prompt, emotion_str = build_prompt(user_input, chat_history)
+    result = llm(prompt, **GENERATION_PARAMS)
     ai_response = result["choices"][0]["text"].strip()
     chat_history.append(f"AI: {ai_response}")
     return f"(Detected Emotion: {emotion_str})\n{ai_response}"
 
+def reply_tokens(prompt, reply):
+    """Tokens decoded for `reply`, counted as it extends the prompt (a stream chunk can hold several)"""
+    return len(llm.tokenize((prompt + reply).encode("utf-8"))) - len(llm.tokenize(prompt.encode("utf-8")))
+
+def stream_response(user_input, chat_history):
+    """Yield ("token", text) as llama.cpp decodes, then ("done", metadata)"""
+    started = time.perf_counter()
+    prompt, emotion_str = build_prompt(user_input, chat_history)
+    prepared = time.perf_counter()
+    first_token = None
+    pieces = []
+    raw = []
+    for chunk in llm(prompt, stream=True, **GENERATION_PARAMS):
+        text = chunk["choices"][0]["text"]
+        raw.append(text)
+        if not pieces:
+            text = text.lstrip()
+        if not text:
+            continue
+        if first_token is None:
+            first_token = time.perf_counter()
+        pieces.append(text)
+        yield "token", text
+    finished = time.perf_counter()
+    ai_response = "".join(pieces).strip()
+    chat_history.append(f"AI: {ai_response}")
+    yield "done", {
+        "response": ai_response,
+        "emotion": emotion_str,
+        "timings": {
+            "analysis_ms": round((prepared - started) * 1000, 1),
+            "first_token_ms": round(((first_token or finished) - started) * 1000, 1),
+            "total_ms": round((finished - started) * 1000, 1),
+            "tokens": reply_tokens(prompt, "".join(raw)),
+        },
+    }
+
 # === LOGGING ===
 def log_to_file(user_input, ai_response):
     with open(ai_conversation_path, "a", encoding="utf-8") as f:
@@ -72,60 +184,98 @@ def safe_input(prompt):
 # === FLASK ===
 @app.route("/toggle_mode", methods=["POST"])
 def toggle_mode():
-    global mode
-    mode = "voice" if mode == "text" else "text"
-    return jsonify({"mode": mode})
+    session = request_session()
+    session["mode"] = "voice" if session["mode"] == "text" else "text"
+    release_session(session)
+    return jsonify({"mode": session["mode"]})
 
 @app.route("/respond", methods=["POST"])
 def respond_to_input():
-    global last_seen_line
     data = request.get_json()
     user_input = data.get("input", "")
+    session = request_session()
+    try:
+        if session["mode"] == "voice":
+            try:
+                latest = fetch_latest_transcript(session)
+                if latest:
+                    user_input = latest
+                else:
+                    return jsonify({"response": None})
+            except Exception as e:
+                return jsonify({"response": f"[Transcript fetch error] {str(e)}"})
 
-    if mode == "voice":
+        ai_response = generate_response(user_input, session["history"])
+    finally:
+        release_session(session)
+    log_to_file(user_input, ai_response)
+    return jsonify({"response": ai_response})
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route("/respond/stream", methods=["POST"])
+def respond_stream():
+    """/respond as Server-Sent Events: `token` events, then a `done` event with metadata"""
+    data = request.get_json()
+    user_input = data.get("input", "")
+    session = request_session()
+
+    if session["mode"] == "voice":
         try:
-            res = requests.get(TRANSCRIPT_API, timeout=3)
-            lines = res.json()
-            if lines and lines[-1] != last_seen_line:
-                last_seen_line = lines[-1]
-                user_input = last_seen_line.split("] ", 1)[-1]
-            else:
-                return jsonify({"response": None})
+            user_input = fetch_latest_transcript(session)
         except Exception as e:
+            release_session(session)
             return jsonify({"response": f"[Transcript fetch error] {str(e)}"})
 
-    ai_response = generate_response(user_input)
-    log_to_file(user_input, ai_response)
-    return jsonify({"response": ai_response})
+    def events():
+        try:
+            if not user_input:
+                yield sse("done", {"response": None})
+                return
+            for event, payload in stream_response(user_input, session["history"]):
+                if event == "token":
+                    yield sse("token", {"text": payload})
+                else:
+                    log_to_file(user_input, f"(Detected Emotion: {payload['emotion']})\n{payload['response']}")
+                    yield sse("done", payload)
+        finally:
+            release_session(session)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 # === TRANSCRIPT POLLING ===
+def answer_transcript(session_id):
+    session = acquire_session(session_id)
+    try:
+        latest = fetch_latest_transcript(session)
+        if latest:
+            user_input = latest
+        else:
+            user_input = safe_input("🧑 You (manual input): ").strip()
+            if not user_input:
+                return
+        ai_response = generate_response(user_input, session["history"])
+        log_to_file(user_input, ai_response)
+        print(f"\n👤 [{session_id}] {user_input}\n🤖 {ai_response}\n")
+    except Exception as e:
+        print(f"[❌ Transcript Error] {e}")
+        user_input = safe_input("🎤 STT unavailable. Type your input: ").strip()
+        if not user_input:
+            return
+        ai_response = generate_response(user_input, session["history"])
+        log_to_file(user_input, ai_response)
+        print(f"\n👤 [{session_id}] {user_input}\n🤖 {ai_response}\n")
+    finally:
+        release_session(session)
+
 def poll_transcript():
-    global last_seen_line
+    """Answer new transcript lines for every in-memory session in voice mode"""
     while True:
-        if mode == "voice":
-            try:
-                res = requests.get(TRANSCRIPT_API, timeout=3)
-                lines = res.json()
-                if lines and lines[-1] != last_seen_line:
-                    last_seen_line = lines[-1]
-                    user_input = last_seen_line.split("] ", 1)[-1]
-                else:
-                    user_input = safe_input("🧑 You (manual input): ").strip()
-                    if not user_input:
-                        time.sleep(1)
-                        continue
-                ai_response = generate_response(user_input)
-                log_to_file(user_input, ai_response)
-                print(f"\n👤 {user_input}\n🤖 {ai_response}\n")
-            except Exception as e:
-                print(f"[❌ Transcript Error] {e}")
-                user_input = safe_input("🎤 STT unavailable. Type your input: ").strip()
-                if not user_input:
-                    time.sleep(1)
-                    continue
-                ai_response = generate_response(user_input)
-                log_to_file(user_input, ai_response)
-                print(f"\n👤 {user_input}\n🤖 {ai_response}\n")
+        with sessions_lock:
+            voice = [session_id for session_id, session in sessions.items() if session["mode"] == "voice"]
+        for session_id in voice:
+            answer_transcript(session_id)
         time.sleep(3)
 
 # === START FUNCTIONS ===
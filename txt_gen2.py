@@ -2,19 +2,26 @@ import os, torch, time, requests
 from datetime import datetime
 from llama_cpp import Llama
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from collections import deque
+from collections import OrderedDict, deque
 import asyncio
-import concurrent.futures  # Added for parallel execution
+import itertools
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # === CONFIG ===
 MODEL_PATH = "/mnt/d/WSL/Ubuntu/TheBloke/Mistral-7B-Instruct-v0.1-GGUF/mistral-7b-instruct-v0.1.Q4_K_S.gguf"
-TRANSCRIPT_API = "http://localhost:9575/transcript?mode=plain"
+TRANSCRIPT_API = "http://localhost:9575/transcript/delta"
 TRANSCRIPT_DIR = "/mnt/d/Data_Files/Transcripts"
 os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
 timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 ai_conversation_path = os.path.join(TRANSCRIPT_DIR, f"ai_responses_{timestamp_str}.txt")
+SESSION_DIR = "/mnt/d/Data_Files/Sessions"
+os.makedirs(SESSION_DIR, exist_ok=True)
 
 # === LOAD MODELS WITH OPTIMIZED PARAMETERS ===
 print("🔄 Loading LLM...")
@@ -34,12 +41,77 @@ emotion_model = AutoModelForSequenceClassification.from_pretrained(emotion_model
 labels_url = "https://raw.githubusercontent.com/google-research/google-research/master/goemotions/data/emotions.txt"
 emotion_labels = requests.get(labels_url).text.strip().split("\n")
 
-# === STATE ===
-chat_history = deque(maxlen=50)
-last_seen_line = ""
-mode = "text"
+GENERATION_PARAMS = dict(
+    max_tokens=512,
+    temperature=0.55,  # Lowered for controlled responses
+    top_p=0.7,
+    repeat_penalty=1.1
+)
+
+# === SESSIONS ===
+# Per-client history, mode and transcript cursor, keyed by the X-Session-ID header
+# ("default" without one). The most recently used MAX_SESSIONS stay in memory;
+# older ones are spilled to SESSION_DIR as JSON and reloaded on their next request.
+DEFAULT_SESSION = "default"
+SESSION_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+MAX_SESSIONS = 256
+HISTORY_LINES = 50
+sessions = OrderedDict()
 app = FastAPI()
 
+def new_session():
+    return {"history": deque(maxlen=HISTORY_LINES), "mode": "text", "refs": 0,
+            "transcript_cursor": -1, "transcript_etag": None, "transcript_session": None}
+
+def acquire_session(session_id):
+    """Loads or creates the session and marks it in use; pair with release_session."""
+    if not SESSION_ID_RE.fullmatch(session_id):
+        raise HTTPException(status_code=400, detail=f"Invalid session id: {session_id!r}")
+    session = sessions.get(session_id)
+    if session is None:
+        session = new_session()
+        path = os.path.join(SESSION_DIR, f"{session_id}.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+            session.update(saved, history=deque(saved["history"], maxlen=HISTORY_LINES), refs=0)
+        sessions[session_id] = session
+    sessions.move_to_end(session_id)
+    session["refs"] += 1
+    for old_id in list(sessions):
+        if len(sessions) <= MAX_SESSIONS:
+            break
+        if sessions[old_id]["refs"] == 0:  # Never spill a session with a request in flight
+            spill_session(old_id, sessions.pop(old_id))
+    return session
+
+def release_session(session):
+    session["refs"] -= 1
+
+def spill_session(session_id, session):
+    path = os.path.join(SESSION_DIR, f"{session_id}.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(dict(session, history=list(session["history"])), f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+# === TRANSCRIPT DELTA ===
+def fetch_latest_transcript(session):
+    """Fetches only entries past the session's cursor; the ETag turns idle polls into empty 304s."""
+    headers = {"If-None-Match": session["transcript_etag"]} if session["transcript_etag"] else {}
+    res = requests.get(TRANSCRIPT_API, params={"since_seq": session["transcript_cursor"], "mode": "plain"}, headers=headers, timeout=2)
+    if res.status_code == 304:
+        return None
+    delta = res.json()
+    if delta["session"] != session["transcript_session"]:
+        session["transcript_session"] = delta["session"]
+        if session["transcript_cursor"] >= 0:  # STT restarted; our cursor belongs to the old session
+            session["transcript_cursor"], session["transcript_etag"] = -1, None
+            return fetch_latest_transcript(session)
+    session["transcript_cursor"] = delta["last_seq"]
+    session["transcript_etag"] = res.headers.get("ETag")
+    entries = delta["entries"]
+    return entries[-1]["text"] if entries else None
+
 # === ROOT ENDPOINT FIX ===
 @app.get("/")
 async def root():
@@ -79,9 +151,9 @@ def classify_intent(user_input):
             return intent
     return "conversation"
 
-# === AI RESPONSE GENERATION WITH PARALLEL PROCESSING ===
-def generate_response(user_input):
-    """Generates AI response with emotional context-awareness, intent recognition, and parallel execution."""
+# === AI RESPONSE GENERATION ===
+def build_prompt(user_input, chat_history):
+    """Builds the prompt with emotional context and intent; returns (prompt, emotions, intent)."""
     emotions = detect_emotions(user_input)
     emotion_str = ", ".join(emotions)
     intent = classify_intent(user_input)
@@ -95,55 +167,197 @@ Recognized user intent: {intent}.
 
 {history_text}
 AI Assistant:"""
+    return prompt, emotion_str, intent
+
+def reply_tokens(prompt, reply):
+    """Tokens decoded for `reply`, counted as it extends the prompt (a stream chunk can hold several)"""
+    return len(llm.tokenize((prompt + reply).encode("utf-8"))) - len(llm.tokenize(prompt.encode("utf-8")))
+
+def decode(prompt, cancelled, raw=None):
+    """Yields response pieces as llama.cpp decodes, stopping early once `cancelled` is set.
+
+    `raw`, if given, collects the chunks' text before the leading whitespace is stripped.
+    """
+    first = True
+    for chunk in llm(prompt, stream=True, **GENERATION_PARAMS):
+        if cancelled is not None and cancelled.is_set():
+            print("[⏹️ LLM] Generation cancelled")
+            break
+        text = chunk["choices"][0]["text"]
+        if raw is not None:
+            raw.append(text)
+        if first:
+            text = text.lstrip()
+        if text:
+            first = False
+            yield text
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future = executor.submit(
-            llm,
-            prompt,
-            max_tokens=512,
-            temperature=0.55,  # Lowered for controlled responses
-            top_p=0.7,
-            repeat_penalty=1.1
-        )
-        result = future.result()
-
-    ai_response = result["choices"][0]["text"].strip()
+def generate_response(user_input, chat_history, cancelled=None):
+    """Generates AI response with emotional context-awareness and intent recognition."""
+    prompt, emotion_str, intent = build_prompt(user_input, chat_history)
+    ai_response = "".join(decode(prompt, cancelled)).strip()
     chat_history.append(f"AI: {ai_response}")
     return f"(Detected Emotion: {emotion_str})\n{ai_response}"
 
+def stream_response(user_input, chat_history, cancelled=None):
+    """Yields ("token", text) as llama.cpp decodes, then ("done", metadata) with timings."""
+    started = time.perf_counter()
+    prompt, emotion_str, intent = build_prompt(user_input, chat_history)
+    prepared = time.perf_counter()
+    first_token = None
+    pieces = []
+    raw = []
+    for text in decode(prompt, cancelled, raw):
+        if first_token is None:
+            first_token = time.perf_counter()
+        pieces.append(text)
+        yield "token", text
+    finished = time.perf_counter()
+    ai_response = "".join(pieces).strip()
+    chat_history.append(f"AI: {ai_response}")
+    yield "done", {
+        "response": ai_response,
+        "emotion": emotion_str,
+        "intent": intent,
+        "timings": {
+            "analysis_ms": round((prepared - started) * 1000, 1),
+            "first_token_ms": round(((first_token or finished) - started) * 1000, 1),
+            "total_ms": round((finished - started) * 1000, 1),
+            "tokens": reply_tokens(prompt, "".join(raw)),
+        },
+    }
+
+# === INFERENCE WORKER ===
+# One thread owns the model and runs jobs from a priority queue, so the event
+# loop never blocks on a decode and interactive requests overtake voice turns.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_VOICE = 1
+llm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm")
+llm_queue = None  # asyncio.PriorityQueue of (priority, seq, fn, args, future, cancelled)
+job_seq = itertools.count()
+_END = object()
+
+async def llm_worker():
+    """Runs queued jobs one at a time as fn(*args, cancelled=event); skips cancelled ones."""
+    loop = asyncio.get_running_loop()
+    while True:
+        _, _, fn, args, future, cancelled = await llm_queue.get()
+        if cancelled.is_set():
+            continue
+        try:
+            result = await loop.run_in_executor(llm_executor, lambda: fn(*args, cancelled=cancelled))
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+def submit_llm(priority, fn, *args):
+    """Queues a job; returns (future, cancel event). Cancelling the future cancels the job."""
+    future = asyncio.get_running_loop().create_future()
+    cancelled = threading.Event()
+    future.add_done_callback(lambda f: f.cancelled() and cancelled.set())
+    llm_queue.put_nowait((priority, next(job_seq), fn, args, future, cancelled))
+    return future, cancelled
+
+async def run_llm(priority, fn, *args):
+    future, _ = submit_llm(priority, fn, *args)
+    return await future
+
+async def stream_llm(priority, fn, *args):
+    """Async iterator over what generator fn(*args) yields on the worker; closing it cancels the job."""
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+
+    def drain(*args, cancelled):
+        try:
+            for item in fn(*args, cancelled=cancelled):
+                loop.call_soon_threadsafe(items.put_nowait, item)
+        finally:
+            loop.call_soon_threadsafe(items.put_nowait, _END)
+
+    future, cancelled = submit_llm(priority, drain, *args)
+    try:
+        while (item := await items.get()) is not _END:
+            yield item
+        await future
+    finally:
+        cancelled.set()
+
 # === REQUEST MODEL ===
 class UserInput(BaseModel):
     input: str
 
 # === API ENDPOINTS ===
+@app.get("/status")
+async def status():
+    """Health check; answers immediately even mid-generation."""
+    return {"sessions": len(sessions), "queued": llm_queue.qsize() if llm_queue else 0}
+
 @app.post("/toggle_mode")
-async def toggle_mode():
-    """Switch between text and voice input modes."""
-    global mode
-    mode = "voice" if mode == "text" else "text"
-    return {"mode": mode}
+async def toggle_mode(x_session_id: str = Header(DEFAULT_SESSION)):
+    """Switch this session between text and voice input modes."""
+    session = acquire_session(x_session_id)
+    session["mode"] = "voice" if session["mode"] == "text" else "text"
+    release_session(session)
+    return {"mode": session["mode"]}
 
 @app.post("/respond")
-async def respond_to_input(data: UserInput):
+async def respond_to_input(data: UserInput, x_session_id: str = Header(DEFAULT_SESSION)):
     """Processes user input and returns AI-generated response asynchronously."""
-    global last_seen_line
     user_input = data.input
+    session = acquire_session(x_session_id)
+    try:
+        if session["mode"] == "voice":
+            try:
+                latest = await asyncio.to_thread(fetch_latest_transcript, session)
+                if latest:
+                    user_input = latest
+                else:
+                    return {"response": None}
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Transcript fetch error: {str(e)}")
+
+        ai_response = await run_llm(PRIORITY_INTERACTIVE, generate_response, user_input, session["history"])
+    finally:
+        release_session(session)
+    log_to_file(user_input, ai_response)
+    return {"response": ai_response}
+
+def sse(event, data):
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/respond/stream")
+async def respond_stream(data: UserInput, x_session_id: str = Header(DEFAULT_SESSION)):
+    """Streams the response as Server-Sent Events: `token` events, then a `done` event with emotion, intent and timings."""
+    user_input = data.input
+    session = acquire_session(x_session_id)
 
-    if mode == "voice":
+    if session["mode"] == "voice":
         try:
-            res = requests.get(TRANSCRIPT_API, timeout=2)
-            lines = res.json()
-            if lines and lines[-1] != last_seen_line:
-                last_seen_line = lines[-1]
-                user_input = last_seen_line.split("] ", 1)[-1]
-            else:
-                return {"response": None}
+            user_input = await asyncio.to_thread(fetch_latest_transcript, session)
         except Exception as e:
+            release_session(session)
             raise HTTPException(status_code=500, detail=f"Transcript fetch error: {str(e)}")
 
-    ai_response = generate_response(user_input)
-    log_to_file(user_input, ai_response)
-    return {"response": ai_response}
+    async def events():
+        try:
+            if not user_input:
+                yield sse("done", {"response": None})
+                return
+            async for event, payload in stream_llm(PRIORITY_INTERACTIVE, stream_response, user_input, session["history"]):
+                if event == "token":
+                    yield sse("token", {"text": payload})
+                else:
+                    log_to_file(user_input, f"(Detected Emotion: {payload['emotion']})\n{payload['response']}")
+                    yield sse("done", payload)
+        finally:
+            release_session(session)
+
+    # Decoding runs on the inference worker; a client disconnect closes the generator and cancels it
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 # === LOGGING ===
 def log_to_file(user_input, ai_response):
@@ -152,32 +366,43 @@ def log_to_file(user_input, ai_response):
         f.write(f"[User] {user_input}\n[AI] {ai_response}\n\n")
 
 # === EVENT-BASED TRANSCRIPT HANDLING ===
+async def answer_transcript(session_id):
+    """Answers the newest transcript line for one voice-mode session."""
+    session = acquire_session(session_id)
+    try:
+        latest = await asyncio.to_thread(fetch_latest_transcript, session)
+        if latest:
+            user_input = latest
+            ai_response = await run_llm(PRIORITY_VOICE, generate_response, user_input, session["history"])
+            log_to_file(user_input, ai_response)
+            print(f"\n👤 [{session_id}] {user_input}\n🤖 {ai_response}\n")
+    except Exception as e:
+        print(f"[❌ Transcript Error] {e}")
+    finally:
+        release_session(session)
+
 async def poll_transcript():
-    """Optimized event-based transcript retrieval instead of fixed intervals."""
-    global last_seen_line
+    """Polls the transcript for every in-memory session in voice mode."""
     while True:
-        try:
-            if mode == "voice":
-                res = requests.get(TRANSCRIPT_API, timeout=2)
-                lines = res.json()
-
-                if lines and lines[-1] != last_seen_line:
-                    last_seen_line = lines[-1]
-                    user_input = last_seen_line.split("] ", 1)[-1]
-                    ai_response = generate_response(user_input)
-                    log_to_file(user_input, ai_response)
-                    print(f"\n👤 {user_input}\n🤖 {ai_response}\n")
-        except Exception as e:
-            print(f"[❌ Transcript Error] {e}")
-
+        voice = [session_id for session_id, session in sessions.items() if session["mode"] == "voice"]
+        await asyncio.gather(*(answer_transcript(session_id) for session_id in voice))
         await asyncio.sleep(1)  # Faster response time with async handling
 
 # === START FUNCTIONS ===
 @app.on_event("startup")
 async def startup_event():
-    """Starts transcript polling when FastAPI server runs."""
+    """Starts the inference worker and transcript polling when FastAPI server runs."""
+    global llm_queue
+    llm_queue = asyncio.PriorityQueue()
+    asyncio.create_task(llm_worker())
     asyncio.create_task(poll_transcript())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Spills every session so a restart resumes them."""
+    for session_id, session in sessions.items():
+        spill_session(session_id, session)
+
 # === MAIN ENTRY POINT ===
 if __name__ == "__main__":
     import uvicorn